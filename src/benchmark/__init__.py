@@ -0,0 +1,6 @@
+from .corpus import generate_corpus, generate_queries
+from .run import run_benchmarks, run_variant
+from .recall import measure_recall
+from .startup import measure_startup
+
+__all__ = ["generate_corpus", "generate_queries", "run_benchmarks", "run_variant", "measure_recall", "measure_startup"]
\ No newline at end of file
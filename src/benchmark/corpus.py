@@ -0,0 +1,60 @@
+from typing import List
+
+import numpy as np
+
+from documents import Document
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "tu", "ra", "si", "po", "de", "va", "zu", "bel", "tor", "quin", "dra", "fex"]
+
+def _make_vocabulary(size: int, rng: np.random.Generator) -> List[str]:
+    words = set()
+    while len(words) < size:
+        length = rng.integers(2, 5)
+        words.add("".join(rng.choice(_SYLLABLES, size=length)))
+    return sorted(words)
+
+def generate_corpus(
+    num_chunks: int,
+    vocabulary_size: int = 50_000,
+    words_per_chunk: int = 80,
+    max_chunks_per_document: int = 5,
+    zipf_exponent: float = 1.1,
+    seed: int = 42,
+) -> List[Document]:
+    """Generate a reproducible synthetic corpus of `num_chunks` chunks.
+    Words follow a Zipf distribution over a synthetic vocabulary, so term statistics look like natural text
+    (a few very common terms, a long tail of rare ones). Documents are split into 1 to `max_chunks_per_document` chunks."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(_make_vocabulary(vocabulary_size, rng))
+    ranks = np.arange(1, vocabulary_size + 1)
+    probabilities = 1 / ranks ** zipf_exponent
+    probabilities /= probabilities.sum()
+
+    # Shuffle the ranks so that frequent words are not alphabetically sorted
+    vocabulary = vocabulary[rng.permutation(vocabulary_size)]
+    lengths = rng.integers(words_per_chunk // 2, words_per_chunk * 3 // 2, size=num_chunks)
+    word_ids = rng.choice(vocabulary_size, size=int(lengths.sum()), p=probabilities)
+
+    documents = []
+    doc_idx, chunk, chunks_left = 0, 0, rng.integers(1, max_chunks_per_document + 1)
+    offset = 0
+    for length in lengths:
+        text = " ".join(vocabulary[word_ids[offset:offset + length]]) + "."
+        offset += length
+        documents.append(Document(idx=int(doc_idx), text=text, chunk=chunk))
+        chunk += 1
+        chunks_left -= 1
+        if chunks_left == 0:
+            doc_idx, chunk, chunks_left = doc_idx + 1, 0, rng.integers(1, max_chunks_per_document + 1)
+    return documents
+
+def generate_queries(documents: List[Document], num_queries: int, min_words: int = 2, max_words: int = 6, seed: int = 7) -> List[str]:
+    """Sample queries made of consecutive words taken from random chunks of the corpus"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for position in rng.integers(0, len(documents), size=num_queries):
+        words = documents[position].text.rstrip(".").split()
+        length = int(rng.integers(min_words, max_words + 1))
+        start = int(rng.integers(0, max(len(words) - length, 0) + 1))
+        queries.append(" ".join(words[start:start + length]))
+    return queries
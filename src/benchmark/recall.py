@@ -0,0 +1,92 @@
+import json, sys, time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .corpus import generate_corpus, generate_queries
+
+def _first_pass_bytes(retriever) -> int:
+    # Memory scanned by the first pass: the coarse index if any, otherwise the full embeddings
+    if retriever.codes is not None:
+        return retriever.codes.nbytes + (retriever.scales.nbytes if retriever.scales is not None else 0)
+    if retriever.coarse_embeddings is not None:
+        return retriever.coarse_embeddings.nbytes
+    return retriever.document_embeddings.nbytes
+
+def measure_recall(
+    num_chunks: int,
+    configs: List[Dict[str, Any]],
+    num_queries: int = 200,
+    top_k: int = 10,
+    seed: int = 42,
+    **embedder_kwargs,
+) -> List[Dict[str, Any]]:
+    """Compare approximate DenseRetriever configurations (`truncate_dim`, `quantization`, `rescore_multiplier`, `vector_dim`)
+    with the exact full-dimension search: recall@top_k of the exact results, first pass memory and search time."""
+    from retriever import DenseRetriever
+
+    documents = generate_corpus(num_chunks, seed=seed)
+    queries = generate_queries(documents, num_queries, seed=seed)
+
+    exact = DenseRetriever(**embedder_kwargs)
+    exact.encode_documents(documents)
+    query_embeddings = exact.embed_queries(queries)
+    expected = [{idx for idx, _ in results} for results in exact.search_by_vectors(query_embeddings, top_k)]
+
+    reports = []
+    for config in [{}] + configs:
+        retriever = exact if not config else DenseRetriever(**embedder_kwargs, **config)
+        if retriever is not exact:
+            retriever.encode_documents(documents)
+        start = time.perf_counter()
+        results = retriever.search_by_vectors(retriever.truncate(query_embeddings), top_k)
+        search_time = time.perf_counter() - start
+
+        recall = np.mean([len(expected_ids & {idx for idx, _ in found}) / max(len(expected_ids), 1)
+                          for expected_ids, found in zip(expected, results)])
+        reports.append({
+            "config": config or "exact",
+            "num_chunks": num_chunks,
+            f"recall@{top_k}": float(recall),
+            "first_pass_mb": _first_pass_bytes(retriever) / (1024 * 1024),
+            "search_ms_per_query": 1000 * search_time / max(len(queries), 1),
+        })
+    return reports
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure the recall loss of truncated (Matryoshka) and quantized dense search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="Corpus sizes, in chunks")
+    parser.add_argument("--truncate-dims", type=int, nargs="*", default=[64, 128, 256], help="Coarse index dimensions")
+    parser.add_argument("--quantization", nargs="*", default=[], choices=["int8", "binary"],
+                        help="Also combine every truncation dimension with these quantizations")
+    parser.add_argument("--rescore-multiplier", type=int, default=4)
+    parser.add_argument("--vector-dim", type=int, help="Truncate the stored full-precision embeddings as well")
+    parser.add_argument("--model-name", default="hash", help="Embedding model, measure with a Matryoshka model for meaningful numbers")
+    parser.add_argument("--embedding-module", default="hash")
+    parser.add_argument("--dimension", type=int, default=384, help="Dimension of the fake embeddings")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    embedder_kwargs = {"model_name": args.model_name, "embedding_module": args.embedding_module}
+    if args.embedding_module in ("hash", "random-projection"):
+        embedder_kwargs["dimension"] = args.dimension
+    common: Dict[str, Optional[int]] = {"rescore_multiplier": args.rescore_multiplier}
+    if args.vector_dim:
+        common["vector_dim"] = args.vector_dim
+
+    configs = [{"truncate_dim": dim, **common} for dim in args.truncate_dims]
+    configs += [
+        {"truncate_dim": dim, "quantization": quantization, **common}
+        for quantization in args.quantization for dim in args.truncate_dims + [None]
+    ]
+
+    reports = []
+    for num_chunks in args.sizes:
+        print(f"Measuring recall on {num_chunks} chunks...", file=sys.stderr)
+        reports.extend(measure_recall(num_chunks, configs, args.queries, args.top_k, args.seed, **embedder_kwargs))
+    print(json.dumps(reports, indent=2))
@@ -0,0 +1,212 @@
+import json, multiprocessing, platform, resource, sys, time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from .corpus import generate_corpus, generate_queries
+from .startup import measure_startup
+
+IN_MEMORY_VARIANTS = ["bm25", "dense", "hybrid", "staged"]
+REDIS_VARIANTS = ["redis_bm25", "redis_dense", "redis_hybrid", "redis_combined", "cached"]
+# Keys and indexes of the Redis variants, dropped before and after each run instead of flushing the database
+BENCH_PREFIX = "bench:"
+BENCH_INDEXES = ["bench_dense_idx", "bench_bm25_idx"]
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _clean_redis(options: Dict[str, Any]):
+    """Drop the benchmark indexes with their documents, then the remaining benchmark keys (cached results)"""
+    import redis
+    client = redis.Redis(host=options["redis_host"], port=options["redis_port"], db=options["redis_db"])
+    for index_name in BENCH_INDEXES:
+        try:
+            client.ft(index_name).dropindex(delete_documents=True)
+        except redis.exceptions.ResponseError:
+            pass  # Not created by this variant
+    pipeline = client.pipeline(transaction=False)
+    for key in client.scan_iter(match=f"{BENCH_PREFIX}*", count=1000):
+        pipeline.delete(key)
+    pipeline.execute()
+
+def _build_variant(name: str, options: Dict[str, Any]) -> Tuple[Any, Callable]:
+    """Create the benchmarked object and the function indexing documents into it"""
+    from retriever import BM25Retriever, DenseRetriever, RedisBM25Retriever, RedisDenseRetriever
+    from search import HybridSearchSystem, MultiStageHybridSearch, CachedHybridSearch, RedisHybridSearch
+    from store import create_controller
+
+    embedder_kwargs = {
+        "model_name": options["embedding_module"],
+        "embedding_module": options["embedding_module"],
+        "dimension": options["dimension"],
+        "cost_profile": options["cost_profile"],
+    }
+    redis_kwargs = {"redis_host": options["redis_host"], "redis_port": options["redis_port"], "redis_db": options["redis_db"]}
+
+    if name == "bm25":
+        target = BM25Retriever()
+        return target, target.fit_documents
+    if name == "dense":
+        target = DenseRetriever(**embedder_kwargs)
+        return target, target.encode_documents
+    if name == "redis_bm25":
+        target = RedisBM25Retriever(index_name="bench_bm25_idx", index_prefix="bench:", **redis_kwargs)
+        return target, target.fit_documents
+    if name == "redis_dense":
+        target = RedisDenseRetriever(index_name="bench_dense_idx", index_prefix="bench:", **redis_kwargs, **embedder_kwargs)
+        return target, target.encode_documents
+
+    if name == "hybrid":
+        target = HybridSearchSystem(dense_retriever=DenseRetriever(**embedder_kwargs))
+    elif name == "staged":
+        target = MultiStageHybridSearch(dense_retriever=DenseRetriever(**embedder_kwargs))
+    elif name == "redis_hybrid":
+        target = HybridSearchSystem(
+            dense_retriever=RedisDenseRetriever(index_name="bench_dense_idx", index_prefix="bench:", **redis_kwargs, **embedder_kwargs),
+            sparse_retriever=RedisBM25Retriever(index_name="bench_bm25_idx", index_prefix="bench:", **redis_kwargs),
+        )
+    elif name == "redis_combined":
+        target = RedisHybridSearch(
+            RedisDenseRetriever(index_name="bench_dense_idx", index_prefix="bench:", **redis_kwargs, **embedder_kwargs),
+        )
+    elif name == "cached":
+        # Same database and key prefix as the other Redis variants, so that the cleanup drops the cached results
+        target = CachedHybridSearch(
+            redis_client=create_controller(options["redis_host"], options["redis_port"], options["redis_db"]).redis_client,
+            cache_prefix=f"{BENCH_PREFIX}cache:",
+            dense_retriever=DenseRetriever(**embedder_kwargs),
+        )
+    else:
+        raise ValueError(f"Unknown benchmark variant: {name}")
+    return target, target.index_documents
+
+def run_variant(name: str, num_chunks: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Benchmark one variant on a synthetic corpus of `num_chunks` chunks.
+    Meant to run in a fresh process so that the peak RSS only accounts for this variant.
+    Redis variants use the `bench:` key prefix and `bench_*` indexes, deleted before and after the run."""
+    clean = name in REDIS_VARIANTS and options["redis_host"] != "memory"
+    if clean:
+        # Start without the keys of previous runs, so they do not skew index sizes and timings
+        _clean_redis(options)
+    try:
+        return _run_variant(name, num_chunks, options)
+    finally:
+        if clean:
+            _clean_redis(options)
+
+def _run_variant(name: str, num_chunks: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    from score import LatencyHistogram
+
+    documents = generate_corpus(num_chunks, seed=options["seed"])
+    queries = generate_queries(documents, options["num_queries"], seed=options["seed"])
+    corpus_rss = _peak_rss_mb()
+
+    target, index = _build_variant(name, options)
+    start = time.perf_counter()
+    index(documents)
+    ingest_time = time.perf_counter() - start
+
+    top_k = options["top_k"]
+    latencies = LatencyHistogram()
+    for query in queries:
+        query_start = time.perf_counter_ns()
+        target.search(query, top_k)
+        latencies.record(time.perf_counter_ns() - query_start)
+
+    batch_size = options["batch_size"]
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        target.search_batch(queries[offset:offset + batch_size], top_k)
+    batch_time = time.perf_counter() - start
+
+    return {
+        "variant": name,
+        "num_chunks": num_chunks,
+        "ingest_seconds": ingest_time,
+        "ingest_chunks_per_second": num_chunks / ingest_time if ingest_time > 0 else 0,
+        "latency_ms": {
+            "p50": latencies.percentile(50) / 1e6,
+            "p95": latencies.percentile(95) / 1e6,
+            "p99": latencies.percentile(99) / 1e6,
+            "max": latencies.max / 1e6,
+            "mean": latencies.mean / 1e6,
+        },
+        "batch_size": batch_size,
+        "batch_queries_per_second": len(queries) / batch_time if batch_time > 0 else 0,
+        "corpus_rss_mb": corpus_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def run_benchmarks(variants: List[str], sizes: List[int], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Measure the cold start, then run every (variant, size) pair in its own process and collect the results"""
+    print("Measuring import time and memory...", file=sys.stderr)
+    startup = measure_startup()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for num_chunks in sizes:
+        for name in variants:
+            print(f"Benchmarking {name} on {num_chunks} chunks...", file=sys.stderr)
+            with context.Pool(1) as pool:
+                try:
+                    results.append(pool.apply(run_variant, (name, num_chunks, options)))
+                except Exception as e:
+                    results.append({"variant": name, "num_chunks": num_chunks, "error": repr(e)})
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "cpu_count": multiprocessing.cpu_count(),
+            "options": options,
+        },
+        "startup": startup,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark indexing and query throughput of the retrievers and search variants")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Corpus sizes, in chunks")
+    parser.add_argument("--variants", nargs="+", default=IN_MEMORY_VARIANTS, choices=IN_MEMORY_VARIANTS + REDIS_VARIANTS)
+    parser.add_argument("--redis", action="store_true", help="Also benchmark the Redis variants (deletes the bench: keys and bench_* indexes)")
+    parser.add_argument("--redis-host", default="localhost", help="'memory' runs the Redis variants on the in-process fake")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=0, help="RediSearch indexes are only supported on db 0")
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dimension", type=int, default=384, help="Dimension of the fake embeddings")
+    parser.add_argument("--embedding-module", default="hash", choices=["hash", "random-projection"])
+    parser.add_argument("--cost-profile", default="none", help="Simulated embedding latency, see retriever.offline_embeddings.COST_PROFILES")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="JSON output file, defaults to stdout")
+    args = parser.parse_args()
+
+    variants = list(args.variants)
+    if args.redis:
+        variants += [variant for variant in REDIS_VARIANTS if variant not in variants]
+    options = {
+        "num_queries": args.queries,
+        "batch_size": args.batch_size,
+        "top_k": args.top_k,
+        "dimension": args.dimension,
+        "embedding_module": args.embedding_module,
+        "cost_profile": args.cost_profile,
+        "seed": args.seed,
+        "redis_host": args.redis_host,
+        "redis_port": args.redis_port,
+        "redis_db": args.redis_db,
+    }
+
+    report = json.dumps(run_benchmarks(variants, args.sizes, options), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
@@ -0,0 +1,65 @@
+import json, os, subprocess, sys, time
+from typing import Any, Dict, List, Optional
+
+# Statements timed from a fresh interpreter, as run by CLI tools and workers at startup
+STARTUP_STATEMENTS = {
+    "import retriever": "import retriever",
+    "import search": "import search",
+    "import server": "import server",
+    "redis dense retriever": "from retriever import RedisDenseRetriever",
+    "hybrid search": "from search import HybridSearchSystem",
+    "hybrid search system (hash)": (
+        "from search import HybridSearchSystem\n"
+        "from retriever import DenseRetriever\n"
+        "HybridSearchSystem(dense_retriever=DenseRetriever(model_name='hash', embedding_module='hash'))"
+    ),
+}
+
+# Dependencies whose import dominates cold starts
+HEAVY_MODULES = ["torch", "tensorflow", "sentence_transformers", "transformers", "langchain_openai", "sklearn", "scipy", "redis"]
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+exec(compile({statement!r}, "<startup>", "exec"))
+seconds = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "seconds": seconds,
+    "peak_rss_mb": peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024,
+    "modules": len(sys.modules),
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+def measure_startup(statements: Optional[Dict[str, str]] = None, repeat: int = 3) -> List[Dict[str, Any]]:
+    """Time each statement and measure the peak RSS in fresh interpreters, keeping the fastest of `repeat` runs.
+    `seconds` only covers the statement, `process_seconds` also includes the interpreter startup."""
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for name, statement in (statements or STARTUP_STATEMENTS).items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, "-c", _PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                cwd=src, capture_output=True, text=True,
+            )
+            process_seconds = time.perf_counter() - start
+            if completed.returncode != 0:
+                best = {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+                break
+            run = {**json.loads(completed.stdout.strip().splitlines()[-1]), "process_seconds": process_seconds}
+            if best is None or run["seconds"] < best["seconds"]:
+                best = run
+        results.append({"statement": name, **best})
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure import time and memory of the packages from a cold interpreter")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(measure_startup(repeat=args.repeat), indent=2))
@@ -2,4 +2,7 @@ import os
 
 # When working with local development
 # Use of Docker Model Runner (DMR) for embedding generation
-os.environ.setdefault("EMBEDDING_MODEL", "docker.io/embeddinggemma:300M-Q8_0")
\ No newline at end of file
+os.environ.setdefault("EMBEDDING_MODEL", "docker.io/embeddinggemma:300M-Q8_0")
+os.environ.setdefault("EMBEDDING_MODULE", "local-dmr")
+# Set REDIS_HOST=memory and EMBEDDING_MODULE=random-projection to run the demos offline, without Redis nor a model
+os.environ.setdefault("REDIS_HOST", "localhost")
\ No newline at end of file
@@ -1,4 +1,5 @@
 from .preprocess import preprocess_documents
 from .document import Document
+from .analyzer import Analyzer, normalize_text, light_stem, REDIS_STOP_WORDS
 
-__all__ = ["preprocess_documents", "Document"]
\ No newline at end of file
+__all__ = ["preprocess_documents", "Document", "Analyzer", "normalize_text", "light_stem", "REDIS_STOP_WORDS"]
\ No newline at end of file
@@ -0,0 +1,61 @@
+import re
+from typing import Callable, Iterable, List, Optional
+
+# RediSearch's default stop words, so that in-memory BM25 scores match the Redis BM25STD scorer
+REDIS_STOP_WORDS = frozenset([
+    "a", "is", "the", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "it",
+    "no", "not", "of", "on", "or", "such", "that", "their", "then", "there", "these", "they", "this", "to",
+    "was", "will", "with",
+])
+
+def normalize_text(text: str) -> str:
+    """Text cleaning shared by document preprocessing and query analysis:
+    collapse whitespace, drop special characters and lowercase"""
+    # Remove extra whitespace
+    text = re.sub(r'\s+', ' ', text.strip())
+
+    # Handle special characters
+    text = re.sub(r'[^\w\s\.\,\!\?\-]', '', text)
+
+    return text.lower().strip()  # Normalize case and trim
+
+def light_stem(token: str) -> str:
+    """English plural stemmer (Harman's S-stemmer): 'queries' -> 'query', 'indexes' -> 'indexe', 'documents' -> 'document'"""
+    if len(token) > 3 and token.endswith("ies") and not token.endswith(("eies", "aies")):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("es") and not token.endswith(("aes", "ees", "oes")):
+        return token[:-1]
+    if len(token) > 2 and token.endswith("s") and not token.endswith(("us", "ss")):
+        return token[:-1]
+    return token
+
+class Analyzer:
+    """Turns text into index terms: normalization, tokenization, stop words removal and optional stemming.
+    Arguments:
+        stop_words: Terms dropped from documents and queries, RediSearch's defaults unless specified
+        stemmer: Function mapping a token to its stem, e.g. `light_stem` or NLTK's `SnowballStemmer("english").stem`
+        min_token_length: Shorter tokens are dropped
+    """
+    def __init__(
+        self,
+        stop_words: Optional[Iterable[str]] = REDIS_STOP_WORDS,
+        stemmer: Optional[Callable[[str], str]] = None,
+        min_token_length: int = 1,
+        token_pattern: str = r"\w+",
+    ):
+        self.stop_words = frozenset(stop_words or ())
+        self.stemmer = stemmer
+        self.min_token_length = min_token_length
+        self._token_pattern = re.compile(token_pattern)
+
+    def __call__(self, text: str) -> List[str]:
+        return self.tokenize(text)
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = [
+            token for token in self._token_pattern.findall(normalize_text(text))
+            if len(token) >= self.min_token_length and token not in self.stop_words
+        ]
+        if self.stemmer is not None:
+            tokens = [self.stemmer(token) for token in tokens]
+        return tokens
@@ -1,23 +1,20 @@
 import re
 from typing import List
 from .document import Document
+from .analyzer import normalize_text
 
-def preprocess_documents(documents: List[str], chunk_size:int=512) -> List[Document]:
+def preprocess_documents(documents: List[str], chunk_size:int=512, start_idx:int=0) -> List[Document]:
     """Clean and normalize document text
     
     Arguments:
         documents: List of raw document strings
-        chunk_size: Maximum number of characters per document text chunk"""
+        chunk_size: Maximum number of characters per document text chunk
+        start_idx: Index of the first document, when documents are processed in successive batches"""
     processed = []
     
-    for doc_idx, doc in enumerate(documents):
-        # Remove extra whitespace
-        doc = re.sub(r'\s+', ' ', doc.strip())
-        
-        # Handle special characters
-        doc = re.sub(r'[^\w\s\.\,\!\?\-]', '', doc)
-
-        doc = doc.lower().strip()  # Normalize case and trim
+    for doc_idx, doc in enumerate(documents, start_idx):
+        # Same cleaning as the analyzer of the BM25 retrievers
+        doc = normalize_text(doc)
         
         # Ensure minimum length
         # if len(doc) > 50:  # Skip very short documents
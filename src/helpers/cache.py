@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+
+from .memory import value_nbytes
+
+class LRUCache:
+    """Bounded, thread-safe least-recently-used cache.
+    Pinned entries are kept outside of the LRU: they are never evicted and do not count towards `max_size`."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._pinned: Dict[Hashable, Any] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            if key in self._pinned:
+                self.hits += 1
+                return self._pinned[key]
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if key in self._pinned:
+                self._pinned[key] = value
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pin(self, key: Hashable, value: Any):
+        """Store an entry that is never evicted"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._pinned[key] = value
+
+    def unpin(self, key: Hashable):
+        with self._lock:
+            self._pinned.pop(key, None)
+
+    def clear(self, pinned: bool = False):
+        with self._lock:
+            self._entries.clear()
+            if pinned:
+                self._pinned.clear()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes of the cached keys and values"""
+        with self._lock:
+            entries = list(self._entries.items()) + list(self._pinned.items())
+        return sum(value_nbytes(key) + value_nbytes(value) for key, value in entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._pinned or key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pinned) + len(self._entries)
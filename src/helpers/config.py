@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import Literal, Optional
 from dataclasses import dataclass, fields
 from collections.abc import Mapping
 
@@ -13,7 +13,7 @@ class ConfigObject(Mapping):
 @dataclass
 class EmbedderConfig(ConfigObject):
     model_name: str = "all-MiniLM-L6-v2"
-    embedding_module: Literal['sentence-transformers', 'local-dmr', 'openai-api'] = 'sentence-transformers'
+    embedding_module: Literal['sentence-transformers', 'local-dmr', 'openai-api', 'hash', 'random-projection'] = 'sentence-transformers'
 
 @dataclass
 class BM25Config(ConfigObject):
@@ -24,4 +24,35 @@ class BM25Config(ConfigObject):
 class HybridSearchConfig(ConfigObject):
     fusion_method: Literal["rrf", "weighted_sum"] = "rrf"
     dense_weight: float = 0.7
-    sparse_weight: float = 0.3
\ No newline at end of file
+    sparse_weight: float = 0.3
+    rrf_k: int = 60
+    normalization: Literal["min_max", "z_score", "none"] = "min_max"
+    candidate_multiplier: float = 2.0
+
+@dataclass
+class RouterConfig(ConfigObject):
+    short_query_terms: int = 3
+    rare_idf: float = 0.5
+    min_sparse_coverage: float = 1.0
+    shallow_sparse_coverage: float = 0.5
+
+@dataclass
+class TenantConfig(ConfigObject):
+    max_loaded: int = 32
+    memory_budget_bytes: Optional[int] = None
+
+@dataclass
+class ProfilerConfig(ConfigObject):
+    sample_rate: float = 0.01
+    cprofile: bool = False
+    stack_interval: Optional[float] = None
+    slow_query_ms: float = 0.0
+    output_dir: Optional[str] = None
+    max_profiles: int = 100
+
+@dataclass
+class SpladeConfig(ConfigObject):
+    model_name: str = "naver/splade-cocondenser-ensembledistil"
+    batch_size: int = 32
+    max_length: int = 256
+    top_terms: Optional[int] = None
@@ -0,0 +1,46 @@
+import sys
+from typing import Any, Iterable, Optional, Set
+
+import numpy as np
+
+def array_nbytes(array: Optional[np.ndarray]) -> int:
+    """Bytes of an array held in memory, 0 for None and for memory-mapped arrays (paged in from their file by the OS)"""
+    if array is None or isinstance(array, np.memmap):
+        return 0
+    return int(array.nbytes)
+
+def mapped_nbytes(array: Optional[np.ndarray]) -> int:
+    """Bytes of a memory-mapped array, 0 for arrays held in memory"""
+    return int(array.nbytes) if isinstance(array, np.memmap) else 0
+
+def value_nbytes(value: Any) -> int:
+    """Approximate bytes of a cached value: arrays, strings, numbers, (nested) lists, tuples and dicts of them, and objects holding them"""
+    if isinstance(value, np.ndarray):
+        return array_nbytes(value) + sys.getsizeof(np.empty(0))
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(value_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_nbytes(key) + value_nbytes(item) for key, item in value.items())
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + value_nbytes(vars(value))
+    return sys.getsizeof(value)
+
+def strings_nbytes(strings: Iterable[str]) -> int:
+    return sum(sys.getsizeof(string) for string in strings)
+
+def documents_nbytes(documents: list, seen: Optional[Set[int]] = None) -> int:
+    """Approximate bytes of a document list: the list, the Document objects, their texts and embeddings.
+    Lists and documents whose id is in `seen` are skipped (and new ones added), so that structures sharing them count them once."""
+    seen = set() if seen is None else seen
+    if id(documents) in seen:
+        return 0
+    seen.add(id(documents))
+    total = sys.getsizeof(documents)
+    for doc in documents:
+        if id(doc) in seen:
+            continue
+        seen.add(id(doc))
+        total += sys.getsizeof(doc) + sys.getsizeof(doc.__dict__) + sys.getsizeof(doc.text)
+        if doc.embedding is not None:
+            total += value_nbytes(doc.embedding)
+    return total
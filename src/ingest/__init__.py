@@ -0,0 +1,5 @@
+from .sources import read_rows
+from .pipeline import IngestPipeline, Checkpoint
+from .sinks import LocalSink, RedisSink, load_local_index
+
+__all__ = ["read_rows", "IngestPipeline", "Checkpoint", "LocalSink", "RedisSink", "load_local_index"]
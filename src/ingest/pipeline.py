@@ -0,0 +1,291 @@
+import json, os, queue, sys, threading, time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from documents import Document, preprocess_documents
+from retriever import BaseDenseRetriever
+from .sources import read_rows
+
+class Checkpoint:
+    """Progress of an ingestion, saved atomically after every committed batch"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, state: Dict[str, Any]):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class IngestPipeline:
+    """Streaming ingestion: rows are read and preprocessed in batches, embedded by a pool of threads and written in order,
+    with bounded queues between the stages so that memory stays flat whatever the input size.
+    A checkpoint is saved after every written batch, an interrupted ingestion resumes after the last one.
+    Arguments:
+        sink: Where batches are written, `RedisSink` or `LocalSink`
+        embedder: Dense retriever whose model embeds the documents
+        checkpoint_path: JSON file holding the progress
+        batch_size: Number of rows per batch
+        embed_workers: Number of concurrent embedding calls
+        queue_size: Maximum number of batches waiting between two stages
+        chunk_size: Maximum number of characters per chunk, see `preprocess_documents`
+        report_every: Seconds between two throughput reports on stderr
+    """
+
+    def __init__(
+        self,
+        sink,
+        embedder: BaseDenseRetriever,
+        checkpoint_path: str,
+        batch_size: int = 64,
+        embed_workers: int = 4,
+        queue_size: int = 8,
+        chunk_size: int = 512,
+        report_every: float = 10.0,
+    ):
+        self.sink = sink
+        self.embedder = embedder
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.report_every = report_every
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def run(
+        self,
+        path: str,
+        columns: List[str],
+        file_format: Optional[str] = None,
+        encoding: str = "utf-8",
+        restart: bool = False,
+    ) -> Dict[str, Any]:
+        """Ingest a CSV / JSONL file, resuming from the checkpoint unless `restart` is set. Returns the final progress."""
+        if restart:
+            self.checkpoint.clear()
+        state = self.checkpoint.load()
+        if state and state.get("source") != os.path.abspath(path):
+            raise ValueError(f"Checkpoint {self.checkpoint.path} belongs to {state.get('source')}, use restart to start over")
+        state = {
+            "source": os.path.abspath(path),
+            "rows_done": 0,
+            "documents_done": 0,
+            "batches_done": 0,
+            "documents_bytes": 0,
+            "seconds": 0.0,
+            **state,
+            "completed": False,
+        }
+        if state["rows_done"]:
+            print(f"Resuming after {state['rows_done']} rows ({state['documents_done']} chunks)", file=sys.stderr)
+        self.sink.resume(state)
+
+        rows = read_rows(path, columns, file_format, encoding, skip=state["rows_done"])
+        return self._run(rows, state)
+
+    def _run(self, rows: Iterator[Tuple[int, str]], state: Dict[str, Any]) -> Dict[str, Any]:
+        self._stop.clear()
+        self._errors = []
+        embed_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+        # Bounds the batches between the reader and the writer, including those waiting to be written in order
+        in_flight = threading.Semaphore(self.queue_size + self.embed_workers)
+
+        threads = [threading.Thread(target=self._read, args=(rows, state["batches_done"], embed_queue, in_flight), daemon=True)]
+        threads += [
+            threading.Thread(target=self._embed, args=(embed_queue, write_queue), daemon=True)
+            for _ in range(self.embed_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self._write(write_queue, in_flight, state)
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+        self.sink.finish()
+        state["completed"] = True
+        self.checkpoint.save(state)
+        return state
+
+    def _put(self, target: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise InterruptedError("Ingestion stopped")
+
+    def _read(self, rows: Iterator[Tuple[int, str]], first_batch: int, embed_queue: queue.Queue, in_flight: threading.Semaphore):
+        try:
+            batch, row_numbers, texts = first_batch, [], []
+            for row, text in rows:
+                row_numbers.append(row)
+                texts.append(text)
+                if len(texts) == self.batch_size:
+                    if not self._dispatch(batch, row_numbers, texts, embed_queue, in_flight):
+                        return
+                    batch, row_numbers, texts = batch + 1, [], []
+            if texts and not self._dispatch(batch, row_numbers, texts, embed_queue, in_flight):
+                return
+            for _ in range(self.embed_workers):
+                self._put(embed_queue, None)
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _dispatch(self, batch: int, row_numbers: List[int], texts: List[str], embed_queue: queue.Queue, in_flight: threading.Semaphore) -> bool:
+        while not in_flight.acquire(timeout=0.1):
+            if self._stop.is_set():
+                return False
+        # Rows of a batch are consecutive, documents are numbered after their row
+        documents = preprocess_documents(texts, self.chunk_size, start_idx=row_numbers[0])
+        return self._put(embed_queue, (batch, row_numbers[-1], documents))
+
+    def _embed(self, embed_queue: queue.Queue, write_queue: queue.Queue):
+        try:
+            while True:
+                item = self._get(embed_queue)
+                if item is None:
+                    self._put(write_queue, None)
+                    return
+                batch, last_row, documents = item
+                embeddings = self.embedder.embed_documents([doc.text for doc in documents]) if documents else np.empty((0, 0), dtype=np.float32)
+                if not self._put(write_queue, (batch, last_row, documents, embeddings)):
+                    return
+        except InterruptedError:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _write(self, write_queue: queue.Queue, in_flight: threading.Semaphore, state: Dict[str, Any]):
+        pending: Dict[int, Tuple[int, List[Document], np.ndarray]] = {}
+        finished_workers = 0
+        start = time.perf_counter()
+        elapsed_before, rows_before, documents_before = state["seconds"], state["rows_done"], state["documents_done"]
+        last_report = start
+
+        while finished_workers < self.embed_workers:
+            item = self._get(write_queue)
+            if item is None:
+                finished_workers += 1
+            else:
+                batch, last_row, documents, embeddings = item
+                pending[batch] = (last_row, documents, embeddings)
+
+            # Batches are written in order, so that the checkpoint always describes a prefix of the input
+            while state["batches_done"] in pending:
+                last_row, documents, embeddings = pending.pop(state["batches_done"])
+                state.update(self.sink.write(state["batches_done"], documents, embeddings, state["documents_done"]))
+                state["rows_done"] = last_row + 1
+                state["documents_done"] += len(documents)
+                state["batches_done"] += 1
+                state["seconds"] = elapsed_before + time.perf_counter() - start
+                self.checkpoint.save(state)
+                in_flight.release()
+
+            now = time.perf_counter()
+            if now - last_report >= self.report_every:
+                last_report = now
+                self._report(state, rows_before, documents_before, now - start)
+        if pending:
+            raise RuntimeError(f"Batch {state['batches_done']} was never embedded")
+
+        self._report(state, rows_before, documents_before, time.perf_counter() - start)
+
+    @staticmethod
+    def _report(state: Dict[str, Any], rows_before: int, documents_before: int, seconds: float):
+        rows = state["rows_done"] - rows_before
+        documents = state["documents_done"] - documents_before
+        state["rows_per_second"] = rows / seconds if seconds > 0 else 0.0
+        state["chunks_per_second"] = documents / seconds if seconds > 0 else 0.0
+        print(
+            f"{state['rows_done']} rows, {state['documents_done']} chunks | "
+            f"{state['rows_per_second']:.1f} rows/s, {state['chunks_per_second']:.1f} chunks/s",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    from os import getenv
+    import default_env
+    from helpers.config import EmbedderConfig
+    from .sinks import LocalSink, RedisSink
+
+    parser = argparse.ArgumentParser(description="Stream a CSV / JSONL file into the search indexes, resumable after interruption")
+    parser.add_argument("path", help="CSV or JSONL file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+    parser.add_argument("--columns", nargs="+", default=["Question", "Answer"], help="Columns / fields concatenated as document text")
+    parser.add_argument("--encoding", default="utf-8")
+    parser.add_argument("--target", choices=["local", "redis"], default="local")
+    parser.add_argument("--state-dir", default=".ingest", help="Checkpoint and, for the local target, persisted index directory")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    parser.add_argument("--model", default=getenv("EMBEDDING_MODEL"))
+    parser.add_argument("--embedding-module", default="local-dmr")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--report-every", type=float, default=10.0)
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=0)
+    parser.add_argument("--redis-shards", nargs="*", help="host:port of every shard")
+    args = parser.parse_args()
+
+    os.makedirs(args.state_dir, exist_ok=True)
+    embedder_config = EmbedderConfig(model_name=args.model, embedding_module=args.embedding_module)
+    if args.target == "redis":
+        from retriever import RedisDenseRetriever, RedisBM25Retriever
+        redis_kwargs = {"redis_host": args.redis_host, "redis_port": args.redis_port, "redis_db": args.redis_db, "redis_shards": args.redis_shards}
+        embedder = RedisDenseRetriever(**redis_kwargs, **embedder_config)
+        sink = RedisSink(embedder, RedisBM25Retriever(**redis_kwargs))
+    else:
+        from retriever import DenseRetriever
+        embedder = DenseRetriever(**embedder_config)
+        sink = LocalSink(args.state_dir)
+
+    pipeline = IngestPipeline(
+        sink,
+        embedder,
+        checkpoint_path=os.path.join(args.state_dir, "checkpoint.json"),
+        batch_size=args.batch_size,
+        embed_workers=args.embed_workers,
+        queue_size=args.queue_size,
+        chunk_size=args.chunk_size,
+        report_every=args.report_every,
+    )
+    print(json.dumps(pipeline.run(args.path, args.columns, args.format, args.encoding, args.restart), indent=2))
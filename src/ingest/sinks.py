@@ -0,0 +1,74 @@
+import glob, json, os
+from typing import Any, Dict, List
+
+import numpy as np
+
+from documents import Document
+from retriever import RedisDenseRetriever, RedisBM25Retriever
+
+class RedisSink:
+    """Writes embedded batches to the Redis dense and BM25 indexes.
+    Keys are derived from document and chunk indices, so batches replayed after an interruption overwrite themselves."""
+
+    def __init__(self, dense_retriever: RedisDenseRetriever, sparse_retriever: RedisBM25Retriever):
+        self.dense_retriever = dense_retriever
+        self.sparse_retriever = sparse_retriever
+
+    def resume(self, state: Dict[str, Any]):
+        pass
+
+    def write(self, batch: int, documents: List[Document], embeddings: np.ndarray, start: int) -> Dict[str, Any]:
+        self.dense_retriever.add_embedded_documents(documents, embeddings, start=start)
+        if self.sparse_retriever.index_prefix != self.dense_retriever.index_prefix:
+            self.sparse_retriever.add_documents(documents, start=start)
+        else:
+            # Same hashes, the dense retriever already wrote their content: only make sure the text index exists
+            self.sparse_retriever.add_documents([], start=start)
+        return {}
+
+    def finish(self):
+        # Drop copies left on shards that no longer own their key
+        self.dense_retriever.redis.rebalance(self.dense_retriever.index_prefix)
+
+class LocalSink:
+    """Persists batches for the in-memory retrievers: chunks appended to `documents.jsonl`, embeddings to one `.npy` file per batch.
+    Use `load_local_index` to index the result into a search system."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.documents_path = os.path.join(directory, "documents.jsonl")
+        self.embeddings_dir = os.path.join(directory, "embeddings")
+        os.makedirs(self.embeddings_dir, exist_ok=True)
+
+    def resume(self, state: Dict[str, Any]):
+        # Drop whatever was written after the last checkpoint
+        with open(self.documents_path, "a+b") as f:
+            f.truncate(state.get("documents_bytes", 0))
+        for path in glob.glob(os.path.join(self.embeddings_dir, "*.npy")):
+            if int(os.path.basename(path)[:-4]) >= state.get("batches_done", 0):
+                os.remove(path)
+
+    def write(self, batch: int, documents: List[Document], embeddings: np.ndarray, start: int) -> Dict[str, Any]:
+        np.save(os.path.join(self.embeddings_dir, f"{batch:08d}.npy"), np.asarray(embeddings, dtype=np.float32))
+        with open(self.documents_path, "a", encoding="utf-8") as f:
+            for doc in documents:
+                f.write(json.dumps({"idx": doc.idx, "chunk": doc.chunk, "text": doc.text}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            return {"documents_bytes": f.tell()}
+
+    def finish(self):
+        pass
+
+def load_local_index(directory: str, search_system) -> List[Document]:
+    """Index the output of a `LocalSink` ingestion into a search system, without embedding the documents again"""
+    with open(os.path.join(directory, "documents.jsonl"), encoding="utf-8") as f:
+        documents = [Document(**json.loads(line)) for line in f if line.strip()]
+    parts = [np.load(path) for path in sorted(glob.glob(os.path.join(directory, "embeddings", "*.npy")))]
+    parts = [part for part in parts if len(part)]
+    embeddings = np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.float32)
+    if len(embeddings) != len(documents):
+        raise ValueError(f"{len(documents)} documents but {len(embeddings)} embeddings in {directory}")
+
+    search_system.index_embeddings(documents, embeddings)
+    return documents
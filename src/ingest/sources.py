@@ -0,0 +1,28 @@
+import csv, json
+from typing import Iterator, List, Optional, Tuple
+
+def detect_format(path: str) -> str:
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+def read_rows(
+    path: str,
+    columns: List[str],
+    file_format: Optional[str] = None,
+    encoding: str = "utf-8",
+    skip: int = 0,
+) -> Iterator[Tuple[int, str]]:
+    """Stream (row number, text) pairs from a CSV or JSONL file, the text joining the given columns / fields.
+    The first `skip` rows are read but not yielded, to resume an interrupted ingestion."""
+    file_format = file_format or detect_format(path)
+    with open(path, encoding=encoding, newline="") as f:
+        if file_format == "csv":
+            records = csv.DictReader(f)
+        elif file_format == "jsonl":
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"Unknown file format: {file_format}")
+
+        for row, record in enumerate(records):
+            if row < skip:
+                continue
+            yield row, " ".join(str(record.get(column) or "") for column in columns)
@@ -8,8 +8,8 @@ if __name__ == "__main__":
     from helpers.print import print_query_results
     from helpers.config import HybridSearchConfig
 
-    bm25_retriever = RedisBM25Retriever(fuzziness=3)
-    dense_retriever = RedisDenseRetriever(model_name=getenv('EMBEDDING_MODEL'), embedding_module='local-dmr')
+    bm25_retriever = RedisBM25Retriever(fuzziness=3, redis_host=getenv('REDIS_HOST'))
+    dense_retriever = RedisDenseRetriever(model_name=getenv('EMBEDDING_MODEL'), embedding_module=getenv('EMBEDDING_MODULE'), redis_host=getenv('REDIS_HOST'))
 
     search = HybridSearchSystem(
         dense_retriever=dense_retriever,
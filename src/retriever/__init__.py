@@ -1,17 +1,34 @@
-from .dense import DenseRetriever
-from .bm25 import BM25Retriever
-from .redis_dense import RedisDenseRetriever
-from .redis_bm25 import RedisBM25Retriever
-from .embedder import Embedder
-from .base import BaseRetriever, BaseDenseRetriever, BaseBM25Retriever
+from importlib import import_module
 
-__all__ = [
-	"DenseRetriever",
-	"BM25Retriever",
-	"RedisDenseRetriever",
-	"RedisBM25Retriever",
-	"Embedder",
-	"BaseRetriever",
-	"BaseDenseRetriever",
-	"BaseBM25Retriever",
-]
\ No newline at end of file
+# Retrievers are imported on first access (PEP 562), so that only the dependencies
+# of the retrievers actually used are loaded (e.g. sentence-transformers for DenseRetriever)
+_LAZY_IMPORTS = {
+	"DenseRetriever": ".dense",
+	"BM25Retriever": ".bm25",
+	"RedisDenseRetriever": ".redis_dense",
+	"RedisBM25Retriever": ".redis_bm25",
+	"SpladeRetriever": ".splade",
+	"SpladeEncoder": ".splade",
+	"InvertedIndex": ".inverted_index",
+	"Embedder": ".embedder",
+	"get_embedder": ".embedder",
+	"unload_embedder": ".embedder",
+	"unload_embedders": ".embedder",
+	"loaded_embedders": ".embedder",
+	"BaseRetriever": ".base",
+	"BaseDenseRetriever": ".base",
+	"BaseSparseRetriever": ".base",
+	"BaseBM25Retriever": ".base",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+def __getattr__(name: str):
+	if name not in _LAZY_IMPORTS:
+		raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+	value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+	globals()[name] = value
+	return value
+
+def __dir__():
+	return sorted(set(globals()) | set(__all__))
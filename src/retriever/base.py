@@ -1,20 +1,61 @@
+import copy
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
 from numpy import ndarray
 from documents import Document
-from .embedder import Embedder
+from helpers.cache import LRUCache
+from helpers.memory import documents_nbytes
+from .embedder import get_embedder
+from .quantization import truncate_embeddings
 
 class BaseRetriever(ABC):
     @abstractmethod
     def search(self, query:str, top_k:int=5) -> List[Tuple[str, float]]:
         pass
 
+    def search_batch(self, queries:List[str], top_k:int=5) -> List[List[Tuple[str, float]]]:
+        """Search several queries at once, retrievers override this when they can share work across queries"""
+        return [self.search(query, top_k) for query in queries]
+
+    def stats(self) -> Dict[str, Any]:
+        """Document counts, structure sizes and approximate memory footprint, in bytes per structure.
+        'documents' bytes cover the Document objects, that a search system may share between its retrievers."""
+        documents = getattr(self, "documents", [])
+        memory = {"documents": documents_nbytes(documents), **self._memory()}
+        return {
+            "type": type(self).__name__,
+            "chunks": len(documents),
+            "parents": len({doc.idx for doc in documents}),
+            **self._counts(),
+            "bytes": memory,
+            "total_bytes": sum(memory.values()),
+        }
+
+    def clone(self) -> "BaseRetriever":
+        """Copy sharing the settings, model and caches, whose index can be rebuilt while this retriever keeps serving.
+        Retrievers whose indexing modifies structures in place (rather than assigning new ones) give the copy its own."""
+        return copy.copy(self)
+
+    def _memory(self) -> Dict[str, int]:
+        """Bytes of the retriever's own structures, besides its documents"""
+        return {}
+
+    def _counts(self) -> Dict[str, Any]:
+        """Sizes of the retriever's structures (dimensions, terms...)"""
+        return {}
+
 class BaseDenseRetriever(BaseRetriever):
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", **model_kwargs):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", vector_dim: Optional[int] = None, query_cache_size: int = 1024, **model_kwargs):
         """Initialize dense retriever with embedding model
         `model_kwargs` are passed to the Embedder class, use **EmbedderConfig() from helpers.config to easily create the config dict.
+        Retrievers with the same model configuration share one Embedder (see `get_embedder`).
+        `vector_dim` truncates the model embeddings to their first dimensions, for Matryoshka models (e.g. embeddinggemma).
+        `query_cache_size` bounds the LRU of query embeddings, 0 disables it.
         """
-        self.model = Embedder(model_name, **model_kwargs)
+        self.model = get_embedder(model_name, **model_kwargs)
+        self.vector_dim = vector_dim
+        self.query_cache = LRUCache(query_cache_size)
         self.document_embeddings = None
         self.documents: List[Document] = []
 
@@ -22,7 +63,58 @@ class BaseDenseRetriever(BaseRetriever):
     def encode_documents(self, documents: List[Document]):
         pass
 
-class BaseBM25Retriever(BaseRetriever):
+    @abstractmethod
+    def search_by_vectors(self, query_embeddings: List[List[float]], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """Search with already embedded queries, one result list per query embedding"""
+        pass
+
+    def embed_documents(self, texts: List[str]) -> ndarray:
+        """Embed document texts, truncated to `vector_dim` (not cached, unlike queries)"""
+        return self.truncate(self.model.encode_array(texts))
+
+    def embed_queries(self, queries: List[str]) -> ndarray:
+        """Embed the queries, cached embeddings are reused and the others computed in a single call to the embedding model"""
+        cached = [self.query_cache.get(query) for query in queries]
+        misses = [position for position, embedding in enumerate(cached) if embedding is None]
+        if misses:
+            embeddings = self.truncate(self.model.encode_array([queries[position] for position in misses]))
+            for position, embedding in zip(misses, embeddings):
+                cached[position] = embedding
+                self.query_cache.put(queries[position], embedding)
+        return np.stack(cached) if cached else np.empty((0, self.vector_dim or 0), dtype=np.float32)
+
+    def pin_queries(self, queries: List[str]) -> ndarray:
+        """Embed hot queries once and keep their embeddings cached for the lifetime of the retriever"""
+        embeddings = self.embed_queries(queries)
+        for query, embedding in zip(queries, embeddings):
+            self.query_cache.pin(query, embedding)
+        return embeddings
+
+    def _memory(self) -> Dict[str, int]:
+        return {**super()._memory(), "query_cache": self.query_cache.nbytes}
+
+    def _counts(self) -> Dict[str, Any]:
+        return {**super()._counts(), "model": self.model.model_name, "vector_dim": self.vector_dim, "cached_queries": len(self.query_cache)}
+
+    def truncate(self, embeddings: ndarray) -> ndarray:
+        """Truncate embeddings to `vector_dim` dimensions, when it is smaller than the model dimension"""
+        if self.vector_dim is None or embeddings.shape[1] <= self.vector_dim:
+            return embeddings
+        return truncate_embeddings(embeddings, self.vector_dim)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        return self.search_by_vectors(self.embed_queries([query]), top_k)[0]
+
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        return self.search_by_vectors(self.embed_queries(queries), top_k)
+
+class BaseSparseRetriever(BaseRetriever):
+    """Retrievers indexing document terms (BM25, learned sparse), used as the sparse side of hybrid search"""
+    @abstractmethod
+    def fit_documents(self, documents: List[Document]):
+        pass
+
+class BaseBM25Retriever(BaseSparseRetriever):
     def __init__(self, k1: float = 1.2, b: float = 0.75):
         """Initialize BM25 retriever with tuning parameters.
         k1 controls term frequency saturation, while b controls length normalization.
@@ -31,8 +123,4 @@ class BaseBM25Retriever(BaseRetriever):
         self.b = b    # Length normalization factor
         self.documents: List[Document] = []
         self.doc_vectors : ndarray[ndarray] = None
-        self.avg_doc_length = 0
-
-    @abstractmethod
-    def fit_documents(self, documents: List[Document]):
-        pass
\ No newline at end of file
+        self.avg_doc_length = 0
\ No newline at end of file
@@ -1,54 +1,61 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from typing import List, Tuple
-from documents import Document
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from documents import Document, Analyzer
 from .base import BaseBM25Retriever
+from .inverted_index import InvertedIndex
 
 class BM25Retriever(BaseBM25Retriever):
-    def __init__(self, k1: float = 1.2, b: float = 0.75):
+    def __init__(self, k1: float = 1.2, b: float = 0.75, analyzer: Optional[Analyzer] = None, block_size: int = 128):
+        """In-memory BM25, scored like RediSearch's BM25STD.
+        `analyzer` tokenizes documents and queries (defaults to the preprocessing cleaning and RediSearch's stop words),
+        BM25 impacts are precomputed at indexing time in an `InvertedIndex` whose blocks of `block_size` documents allow
+        the top-k to be found without scoring every matching document."""
         super().__init__(k1, b)
-        self.vectorizer = TfidfVectorizer(
-            lowercase=True,
-            stop_words='english',
-            token_pattern=r'\b\w+\b'
-        )
+        self.analyzer = analyzer or Analyzer()
+        self.index = InvertedIndex(block_size)
     
     def fit_documents(self, documents: List[Document]):
         """Prepare BM25 index from document collection"""
         self.documents = documents
-        texts = [doc.text for doc in documents]
-        self.doc_vectors = self.vectorizer.fit_transform(texts)
+        term_frequencies = [Counter(self.analyzer(doc.text)) for doc in documents]
         
-        # Calculate average document length
-        doc_lengths = [len(text.split()) for text in texts]
-        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths)
+        # Calculate average document length, in analyzed terms
+        doc_lengths = [sum(frequencies.values()) for frequencies in term_frequencies]
+        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0
+        
+        document_frequencies = Counter(term for frequencies in term_frequencies for term in frequencies)
+        idf = {term: self._idf(frequency, len(documents)) for term, frequency in document_frequencies.items()}
+        self.index.build([
+            {term: idf[term] * self._saturate(tf, doc_length) for term, tf in frequencies.items()}
+            for frequencies, doc_length in zip(term_frequencies, doc_lengths)
+        ])
     
+    def clone(self) -> "BM25Retriever":
+        clone = super().clone()
+        clone.index = InvertedIndex(self.index.block_size, self.index.min_pruning_blocks)
+        return clone
+
     def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
         """Retrieve documents using BM25 scoring"""
-        query_vector = self.vectorizer.transform([query])
-        
-        # Calculate BM25 scores
-        scores = []
-        for i, doc_vector in enumerate(self.doc_vectors):
-            score = self._calculate_bm25_score(query_vector, doc_vector, i)
-        scores.append((str(i), score))
-        
-        # Sort by score and return top-k
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:top_k]
-    
-    def _calculate_bm25_score(self, query_vector, doc_vector, doc_idx: int) -> float:
-        """Calculate BM25 score for query-document pair"""
-        doc_length = len(self.documents[doc_idx].text.split())
+        # Repeated query terms count once per occurrence
+        query_weights = Counter(self.analyzer(query))
+        return [(str(doc_id), score) for doc_id, score in self.index.search(query_weights, top_k)]
+
+    def _memory(self) -> Dict[str, int]:
+        return {**super()._memory(), **{f"index_{name}": size for name, size in self.index.stats()["bytes"].items()}}
+
+    def _counts(self) -> Dict[str, Any]:
+        index_stats = self.index.stats()
+        index_stats.pop("bytes")
+        return {**super()._counts(), **index_stats, "average_document_length": self.avg_doc_length}
+
+    @staticmethod
+    def _idf(document_frequency: int, num_documents: int) -> float:
+        # Lucene / RediSearch BM25STD idf, always positive
+        return math.log(1 + (num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _saturate(self, tf: int, doc_length: int) -> float:
+        """Term frequency saturation with document length normalization"""
         length_norm = self.k1 * ((1 - self.b) + self.b * (doc_length / self.avg_doc_length))
-        
-        # Simplified BM25 calculation using TF-IDF vectors
-        tf_scores = doc_vector.toarray()[0]
-        query_terms = query_vector.toarray()[0]
-        
-        bm25_score = 0
-        for term_idx, query_weight in enumerate(query_terms):
-            if query_weight > 0:
-                tf = tf_scores[term_idx]
-                bm25_score += query_weight * (tf * (self.k1 + 1)) / (tf + length_norm)
-        
-        return bm25_score
+        return tf * (self.k1 + 1) / (tf + length_norm)
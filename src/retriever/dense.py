@@ -1,29 +1,141 @@
+import os
 import numpy as np
-from typing import List, Tuple
+from typing import Any, Dict, List, Literal, Optional, Tuple
 from documents import Document
+from helpers.memory import array_nbytes, mapped_nbytes
 from .base import BaseDenseRetriever
+from .quantization import truncate_embeddings, quantize_int8, int8_scores, quantize_binary, hamming_distances
+
+class DenseRetriever(BaseDenseRetriever):
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        *,
+        vector_dim: Optional[int] = None,
+        truncate_dim: Optional[int] = None,
+        quantization: Optional[Literal['int8', 'binary']] = None,
+        rescore_multiplier: int = 4,
+        embeddings_path: Optional[str] = None,
+        **model_kwargs,
+    ):
+        """Initialize dense retriever with embedding model
+        Arguments:
+            vector_dim: Dimension of the stored full-precision embeddings, the model embeddings are truncated to it when smaller
+            truncate_dim: Keep the first `truncate_dim` dimensions of the normalized document embeddings as a coarse index
+                for the first pass (Matryoshka embeddings), the candidates are re-scored with the full vectors
+            quantization: Keep an 'int8' or 'binary' (sign-bit) copy of the normalized document embeddings for a fast first pass,
+                whose best `top_k * rescore_multiplier` candidates are re-scored with the full-precision embeddings
+            rescore_multiplier: Number of first pass candidates per requested result
+            embeddings_path: `.npy` file where the full-precision embeddings are saved and memory-mapped from,
+                so that only the re-scored rows are read into memory
+        """
+        super().__init__(model_name, vector_dim=vector_dim, **model_kwargs)
+        if quantization not in (None, 'int8', 'binary'):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.truncate_dim = truncate_dim
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier
+        self.embeddings_path = embeddings_path
+        self.document_norms: Optional[np.ndarray] = None
+        self.coarse_embeddings: Optional[np.ndarray] = None
+        self.codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
 
-class DenseRetriever(BaseDenseRetriever):    
     def encode_documents(self, documents: List[Document]) -> np.ndarray:
         """Convert documents to dense vectors"""
-        self.documents = documents
         texts = [doc.text for doc in documents]
-        self.document_embeddings = np.array(self.model.encode(texts), copy=True)
+        return self.index_embeddings(documents, self.embed_documents(texts))
+
+    def index_embeddings(self, documents: List[Document], embeddings: np.ndarray) -> np.ndarray:
+        """Index documents whose embeddings were already computed, e.g. by a streaming ingestion"""
+        self.documents = documents
+        if self.embeddings_path is not None:
+            # Written aside then renamed: the retriever this one was cloned from may still be reading the mapped file
+            temporary_path = f"{self.embeddings_path}.tmp.npy"
+            np.save(temporary_path, embeddings)
+            os.replace(temporary_path, self.embeddings_path)
+            embeddings = np.load(self.embeddings_path, mmap_mode='r')
+        self.document_embeddings = embeddings
+        self.document_norms = np.linalg.norm(embeddings, axis=1).astype(np.float32)
+        self.document_norms[self.document_norms == 0] = 1.0
+
+        if self.truncate_dim is not None or self.quantization is not None:
+            self._build_first_pass(embeddings)
         return self.document_embeddings
-    
-    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
-        """Find most similar documents using cosine similarity"""
-        query_embedding = np.array(self.model.encode(query))
-        
-        # Calculate cosine similarity
-        similarities = np.dot(query_embedding, self.document_embeddings.T)
-        similarities = similarities / (
-            np.linalg.norm(query_embedding) * 
-            np.linalg.norm(self.document_embeddings, axis=1)
-        )
-        
-        # Get top-k results
-        top_indices = np.argsort(similarities[0])[::-1][:top_k]
-        results = [(str(idx), similarities[0][idx]) for idx in top_indices]
-        
+
+    def _memory(self) -> Dict[str, int]:
+        return {
+            **super()._memory(),
+            "document_embeddings": array_nbytes(self.document_embeddings),
+            "document_norms": array_nbytes(self.document_norms),
+            "coarse_embeddings": array_nbytes(self.coarse_embeddings),
+            "codes": array_nbytes(self.codes) + array_nbytes(self.scales),
+        }
+
+    def _counts(self) -> Dict[str, Any]:
+        return {
+            **super()._counts(),
+            "truncate_dim": self.truncate_dim,
+            "quantization": self.quantization,
+            # Memory-mapped embeddings are paged in by the OS, they are not part of the resident bytes
+            "mapped_embeddings_bytes": mapped_nbytes(self.document_embeddings),
+        }
+
+    def _build_first_pass(self, embeddings: np.ndarray):
+        coarse = self._coarse(embeddings / self.document_norms[:, None])
+        if self.quantization == 'int8':
+            self.codes, self.scales = quantize_int8(coarse)
+        elif self.quantization == 'binary':
+            self.codes = quantize_binary(coarse)
+        else:
+            self.coarse_embeddings = coarse
+
+    def _coarse(self, normalized: np.ndarray) -> np.ndarray:
+        if self.truncate_dim is None or self.truncate_dim >= normalized.shape[1]:
+            return normalized
+        return truncate_embeddings(normalized, self.truncate_dim)
+
+    def search_by_vectors(self, query_embeddings: List[List[float]], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """Find most similar documents using cosine similarity, scoring all queries in one matrix product"""
+        if self.document_embeddings is None:
+            # Nothing indexed yet, e.g. a new tenant
+            return [[] for _ in query_embeddings]
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        query_norms = np.linalg.norm(query_embeddings, axis=1)
+        query_norms[query_norms == 0] = 1.0
+        query_embeddings = query_embeddings / query_norms[:, None]
+
+        if self.truncate_dim is None and self.quantization is None:
+            # Calculate cosine similarity
+            similarities = np.dot(query_embeddings, self.document_embeddings.T) / self.document_norms[None, :]
+            return [self._top_k(row, np.arange(len(row)), top_k) for row in similarities]
+
+        # First pass on the truncated and/or quantized embeddings, then exact cosine similarity of the best candidates
+        coarse_queries = self._coarse(query_embeddings)
+        if self.quantization == 'int8':
+            approximate = int8_scores(coarse_queries, self.codes, self.scales)
+        elif self.quantization == 'binary':
+            approximate = -hamming_distances(quantize_binary(coarse_queries), self.codes)
+        else:
+            approximate = coarse_queries @ self.coarse_embeddings.T
+        num_candidates = min(top_k * self.rescore_multiplier, approximate.shape[1])
+        if num_candidates <= 0:
+            return [[] for _ in query_embeddings]
+        candidates = np.argpartition(-approximate, num_candidates - 1, axis=1)[:, :num_candidates]
+
+        results = []
+        for query_embedding, candidate_indices in zip(query_embeddings, candidates):
+            candidate_indices = np.sort(candidate_indices)  # Sequential reads from memory-mapped embeddings
+            similarities = (self.document_embeddings[candidate_indices] @ query_embedding) / self.document_norms[candidate_indices]
+            results.append(self._top_k(similarities, candidate_indices, top_k))
         return results
+
+    @staticmethod
+    def _top_k(similarities: np.ndarray, indices: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        # Get top-k results
+        top_k = min(top_k, len(similarities))
+        if top_k <= 0:
+            return []
+        best = np.argpartition(-similarities, top_k - 1)[:top_k]
+        best = best[np.argsort(-similarities[best])]
+        return [(str(indices[position]), similarities[position]) for position in best]
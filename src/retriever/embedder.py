@@ -1,8 +1,10 @@
-from typing import Union, List, Literal
+import threading
+from typing import Any, Dict, Tuple, Union, List, Literal
+
+import numpy as np
 
 from helpers.config import EmbedderConfig
-from sentence_transformers import SentenceTransformer
-from langchain_openai.embeddings import OpenAIEmbeddings
+from .offline_embeddings import HashEmbeddings, RandomProjectionEmbeddings
 
 class Embedder:
     """A class responsible for abstracting any use of external embedding models, such as sentence-transformers or OpenAI's embedding API, ...
@@ -10,33 +12,78 @@ class Embedder:
     Arguments:
         model_name: The name of the embedding model to use. For example, "all-MiniLM-L6-v2"
         embedding_module: The embedding module to use. Options are 'sentence-transformers', 'local-dmr', or 'openai-api' (see [LangChain's OpenAIEmbeddings](https://docs.langchain.com/oss/python/integrations/text_embedding/openai)).
+            'hash' and 'random-projection' produce deterministic offline embeddings (see `HashEmbeddings` and `RandomProjectionEmbeddings`),
+            `dimension` sets their size and `cost_profile` simulates the latency of a real backend.
         kwargs: Additional keyword arguments to pass to the embedding model constructor (e.g., API keys, base URLs, etc.)
+    > Backends are imported and the model loaded on first use, so only the selected module's dependencies are loaded.
+    > Use `get_embedder` to share one instance per model across retrievers, rather than loading the same model several times.
     """
     def __init__(self, 
                  model_name: str, 
-                 embedding_module: Literal['sentence-transformers', 'local-dmr', 'openai-api'] = 'sentence-transformers', 
+                 embedding_module: Literal['sentence-transformers', 'local-dmr', 'openai-api', 'hash', 'random-projection'] = 'sentence-transformers', 
                  **kwargs):
         self.model_name = model_name
-        self._model = None
+        self.__model = None
         self._embedding_module = embedding_module
-        self.__set_model_instance(**kwargs)
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._dimension = None
+
+    @property
+    def _model(self):
+        # Double-checked locking, so that concurrent first calls load the model once
+        if self.__model is None:
+            with self._lock:
+                if self.__model is None:
+                    self.__model = self.__create_model_instance(**self._kwargs)
+        return self.__model
+
+    @property
+    def loaded(self) -> bool:
+        return self.__model is not None
+
+    def unload(self):
+        """Release the model, it is loaded again on next use"""
+        with self._lock:
+            self.__model = None
+
+    @property
+    def dimension(self) -> int:
+        """Size of the embeddings, from the model when it tells it, else measured on a probe text (an API call) once"""
+        if self._dimension is None:
+            model = self._model
+            if hasattr(model, "get_sentence_embedding_dimension"):
+                self._dimension = model.get_sentence_embedding_dimension()
+            if self._dimension is None and isinstance(getattr(model, "dimension", None), int):
+                self._dimension = model.dimension
+            if self._dimension is None:
+                self._dimension = int(self.encode_array("dimension").shape[1])
+        return self._dimension
 
-    def __set_model_instance(self, **kwargs):
+    def __create_model_instance(self, **kwargs):
         if self._embedding_module == 'sentence-transformers':
-            self._model = SentenceTransformer(self.model_name)
+            from sentence_transformers import SentenceTransformer
+            return SentenceTransformer(self.model_name)
         elif self._embedding_module == 'local-dmr':
+            from langchain_openai.embeddings import OpenAIEmbeddings
             kwargs.setdefault('base_url', "http://localhost:12434/engines/v1")
             kwargs.setdefault('api_key', "some-pass-key")
-            self._model = OpenAIEmbeddings(model=self.model_name, **kwargs)
+            return OpenAIEmbeddings(model=self.model_name, **kwargs)
         elif self._embedding_module == 'openai-api':
-            self._model = OpenAIEmbeddings(model=self.model_name, **kwargs)
+            from langchain_openai.embeddings import OpenAIEmbeddings
+            return OpenAIEmbeddings(model=self.model_name, **kwargs)
+        elif self._embedding_module == 'hash':
+            return HashEmbeddings(**kwargs)
+        elif self._embedding_module == 'random-projection':
+            return RandomProjectionEmbeddings(**kwargs)
+        raise ValueError(f"Unknown embedding module: {self._embedding_module}")
 
     def encode(self, text: Union[List[str], str]) -> list[float]:
         """Encode a single string or a list of strings into dense vectors."""
         if isinstance(text, str):
             text = [text]
         
-        if self._embedding_module == 'sentence-transformers':
+        if self._embedding_module in ['sentence-transformers', 'hash', 'random-projection']:
             return self._model.encode(text).tolist()
         elif self._embedding_module in ['local-dmr', 'openai-api']:
             return self._model.embed_documents(text)
@@ -47,9 +94,58 @@ class Embedder:
         # elif hasattr(self._model, 'embed'):
         #     return self._model.embed(text)
 
+    def encode_array(self, text: Union[List[str], str]) -> np.ndarray:
+        """Encode a single string or a list of strings into a float32 matrix, one row per string.
+        Avoids the round trip through Python lists when the backend already produces arrays."""
+        if isinstance(text, str):
+            text = [text]
+        
+        if self._embedding_module in ['sentence-transformers', 'hash', 'random-projection']:
+            return np.asarray(self._model.encode(text), dtype=np.float32)
+        return np.asarray(self.encode(text), dtype=np.float32)
+
+
+# Process-wide registry of shared embedders, keyed by model name, module and constructor arguments
+_embedders: Dict[Tuple[str, str, str], Embedder] = {}
+_embedders_lock = threading.Lock()
+
+def _registry_key(model_name: str, embedding_module: str, kwargs: Dict[str, Any]) -> Tuple[str, str, str]:
+    return (model_name, embedding_module, repr(sorted(kwargs.items())))
+
+def get_embedder(model_name: str, embedding_module: str = 'sentence-transformers', **kwargs) -> Embedder:
+    """Shared Embedder for this model configuration, created on first request (the model itself loads on first use)"""
+    key = _registry_key(model_name, embedding_module, kwargs)
+    with _embedders_lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            embedder = _embedders[key] = Embedder(model_name, embedding_module, **kwargs)
+        return embedder
+
+def unload_embedder(model_name: str, embedding_module: str = 'sentence-transformers', **kwargs) -> bool:
+    """Release a shared model, it stays registered and is loaded again by the next retriever using it.
+    Returns False if no such embedder was registered."""
+    with _embedders_lock:
+        embedder = _embedders.get(_registry_key(model_name, embedding_module, kwargs))
+    if embedder is None:
+        return False
+    embedder.unload()
+    return True
+
+def unload_embedders():
+    """Release every shared model"""
+    with _embedders_lock:
+        embedders = list(_embedders.values())
+    for embedder in embedders:
+        embedder.unload()
+
+def loaded_embedders() -> List[Tuple[str, str]]:
+    """(model_name, embedding_module) of the shared embedders whose model is currently loaded"""
+    with _embedders_lock:
+        return [(embedder.model_name, embedder._embedding_module) for embedder in _embedders.values() if embedder.loaded]
+
 
 if __name__ == "__main__":
     conf = EmbedderConfig()
     print(*conf, end="\n\n")
-    embedder = Embedder(**conf)
+    embedder = get_embedder(**conf)
     print(embedder._model)
\ No newline at end of file
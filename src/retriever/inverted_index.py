@@ -0,0 +1,195 @@
+import sys
+from typing import Any, Dict, Hashable, List, Mapping, Tuple
+
+import numpy as np
+
+from helpers.memory import value_nbytes
+
+class InvertedIndex:
+    """Impact-ordered inverted index with block-max dynamic pruning.
+
+    Every posting holds a precomputed impact, the contribution of the term to the document score (e.g. its BM25 weight),
+    so a query score is the weighted sum of its terms' impacts. The document id space is split into blocks of `block_size`
+    documents, and each term keeps the maximum impact of its postings in every block it appears in.
+    A query sums these block maxima into an upper bound per block, then scores blocks by decreasing upper bound and stops
+    as soon as the next bound cannot beat the current k-th best score: exact top-k results without scoring every matching document.
+    Postings are stored in CSR layout (flat numpy arrays sliced by per-term offsets).
+    Indexes of less than `min_pruning_blocks` blocks are scored exhaustively, pruning does not pay off on them.
+    """
+
+    def __init__(self, block_size: int = 128, min_pruning_blocks: int = 64):
+        self.block_size = block_size
+        self.min_pruning_blocks = min_pruning_blocks
+        self.vocabulary: Dict[Hashable, int] = {}
+        self.num_documents = 0
+        # Postings of term t: doc_ids / impacts[posting_offsets[t]:posting_offsets[t + 1]], sorted by document
+        self.posting_offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int32)
+        self.impacts = np.empty(0, dtype=np.float32)
+        # Blocks of term t: block_ids / block_maxes / block_starts / block_ends[block_offsets[t]:block_offsets[t + 1]],
+        # where block_starts and block_ends delimit the postings of the block in doc_ids / impacts
+        self.block_offsets = np.zeros(1, dtype=np.int64)
+        self.block_ids = np.empty(0, dtype=np.int32)
+        self.block_maxes = np.empty(0, dtype=np.float32)
+        self.block_starts = np.empty(0, dtype=np.int64)
+        self.block_ends = np.empty(0, dtype=np.int64)
+
+    def build(self, document_impacts: List[Mapping[Hashable, float]]) -> "InvertedIndex":
+        """Index documents given as {term: impact} mappings, document ids being their positions in the list"""
+        vocabulary: Dict[Hashable, int] = {}
+        term_ids, doc_ids, impacts = [], [], []
+        for doc_id, terms in enumerate(document_impacts):
+            for term, impact in terms.items():
+                if impact <= 0:
+                    continue
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                impacts.append(impact)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        # Stable sort keeps the postings of each term sorted by document
+        order = np.argsort(term_ids, kind="stable")
+        self.vocabulary = vocabulary
+        self.num_documents = len(document_impacts)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.impacts = np.asarray(impacts, dtype=np.float32)[order]
+        self.posting_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=self.posting_offsets[1:])
+        self._build_blocks(term_ids[order])
+        return self
+
+    def _build_blocks(self, sorted_term_ids: np.ndarray):
+        # A new block starts wherever the term or the document block changes
+        blocks = self.doc_ids // self.block_size
+        boundaries = np.ones(len(blocks), dtype=bool)
+        boundaries[1:] = (sorted_term_ids[1:] != sorted_term_ids[:-1]) | (blocks[1:] != blocks[:-1])
+        starts = np.flatnonzero(boundaries)
+
+        self.block_ids = blocks[starts].astype(np.int32)
+        self.block_maxes = np.maximum.reduceat(self.impacts, starts) if len(starts) else np.empty(0, dtype=np.float32)
+        self.block_starts = starts.astype(np.int64)
+        self.block_ends = np.append(starts[1:], len(blocks)).astype(np.int64) if len(starts) else self.block_starts.copy()
+        self.block_offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sorted_term_ids[starts], minlength=len(self.vocabulary)), out=self.block_offsets[1:])
+
+    def postings(self, term: Hashable) -> Tuple[np.ndarray, np.ndarray]:
+        """Document ids and impacts of a term"""
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return self.doc_ids[:0], self.impacts[:0]
+        start, end = self.posting_offsets[term_id], self.posting_offsets[term_id + 1]
+        return self.doc_ids[start:end], self.impacts[start:end]
+
+    def document_frequency(self, term: Hashable) -> int:
+        """Number of documents containing a term"""
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return 0
+        return int(self.posting_offsets[term_id + 1] - self.posting_offsets[term_id])
+
+    def search(self, query_weights: Mapping[Hashable, float], top_k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (document id, score) pairs, the score being the sum of `weight * impact` over the query terms"""
+        terms = [(self.vocabulary[term], weight) for term, weight in query_weights.items() if term in self.vocabulary and weight > 0]
+        if not terms or top_k <= 0:
+            return []
+
+        num_blocks = (self.num_documents + self.block_size - 1) // self.block_size
+        if num_blocks < self.min_pruning_blocks:
+            return self.search_exhaustive(query_weights, top_k)
+
+        # Upper bound of the score of every block
+        upper_bounds = np.zeros(num_blocks)
+        for term_id, weight in terms:
+            start, end = self.block_offsets[term_id], self.block_offsets[term_id + 1]
+            upper_bounds[self.block_ids[start:end]] += weight * self.block_maxes[start:end]
+        candidates = np.flatnonzero(upper_bounds)
+        candidates = candidates[np.argsort(-upper_bounds[candidates], kind="stable")]
+        candidate_bounds = upper_bounds[candidates]
+
+        # Entry of every candidate block in the block list of every term (-1 when the term is absent from the block)
+        term_blocks = []
+        for term_id, weight in terms:
+            start, end = self.block_offsets[term_id], self.block_offsets[term_id + 1]
+            positions = np.searchsorted(self.block_ids[start:end], candidates)
+            present = positions < end - start
+            present[present] = self.block_ids[start + positions[present]] == candidates[present]
+            term_blocks.append((weight, np.where(present, start + positions, -1)))
+
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0)
+        threshold = 0.0
+        # Blocks are scored in batches of doubling size, the threshold being updated in between
+        begin, batch_size = 0, 1
+        while begin < len(candidates):
+            end = min(begin + batch_size, len(candidates))
+            if len(best_scores) == top_k:
+                # Blocks are sorted by upper bound, those not above the k-th best score cannot enter the top-k
+                end = min(end, begin + int(np.searchsorted(-candidate_bounds[begin:end], -threshold)))
+                if end == begin:
+                    break
+            doc_ids, scores = self._score_blocks(candidates[begin:end], [(weight, entries[begin:end]) for weight, entries in term_blocks])
+
+            matches = np.flatnonzero(scores > threshold)
+            best_ids = np.concatenate([best_ids, doc_ids[matches]])
+            best_scores = np.concatenate([best_scores, scores[matches]])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_ids, best_scores = best_ids[keep], best_scores[keep]
+            if len(best_scores) == top_k:
+                threshold = best_scores.min()
+            begin, batch_size = end, batch_size * 2
+
+        # Ties are broken by document id
+        order = np.lexsort((best_ids, -best_scores))
+        return [(int(best_ids[i]), float(best_scores[i])) for i in order]
+
+    def _score_blocks(self, blocks: np.ndarray, term_blocks: List[Tuple[float, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact scores of every document of the given blocks, term at a time over the concatenated postings"""
+        scores = np.zeros(len(blocks) * self.block_size)
+        # Offset mapping a document id to its slot in `scores`
+        slot_offsets = (np.arange(len(blocks)) - blocks) * self.block_size
+        for weight, entries in term_blocks:
+            present = np.flatnonzero(entries >= 0)
+            if len(present) == 0:
+                continue
+            starts, ends = self.block_starts[entries[present]], self.block_ends[entries[present]]
+            lengths = ends - starts
+            # Positions of all the postings of these blocks
+            positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            slots = self.doc_ids[positions] + np.repeat(slot_offsets[present], lengths)
+            scores[slots] += weight * self.impacts[positions]
+        slots = np.arange(len(scores))
+        return blocks[slots // self.block_size] * self.block_size + slots % self.block_size, scores
+
+    def search_exhaustive(self, query_weights: Mapping[Hashable, float], top_k: int = 10) -> List[Tuple[int, float]]:
+        """Reference term-at-a-time scoring of every matching document, without pruning"""
+        scores = np.zeros(self.num_documents)
+        for term, weight in query_weights.items():
+            doc_ids, impacts = self.postings(term)
+            scores[doc_ids] += weight * impacts
+        matches = np.flatnonzero(scores)
+        order = matches[np.lexsort((matches, -scores[matches]))][:top_k]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in order]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in (
+            "posting_offsets", "doc_ids", "impacts", "block_offsets", "block_ids", "block_maxes", "block_starts", "block_ends"
+        ))
+
+    def stats(self) -> Dict[str, Any]:
+        """Term, posting and block counts, and bytes of the postings, the block maxima and the vocabulary"""
+        num_terms, num_postings = len(self.vocabulary), len(self.doc_ids)
+        return {
+            "terms": num_terms,
+            "postings": num_postings,
+            "average_postings_length": num_postings / num_terms if num_terms else 0.0,
+            "blocks": len(self.block_ids),
+            "bytes": {
+                "postings": sum(getattr(self, name).nbytes for name in ("posting_offsets", "doc_ids", "impacts")),
+                "blocks": sum(getattr(self, name).nbytes for name in (
+                    "block_offsets", "block_ids", "block_maxes", "block_starts", "block_ends"
+                )),
+                "vocabulary": sys.getsizeof(self.vocabulary) + sum(value_nbytes(term) for term in self.vocabulary),
+            },
+        }
@@ -0,0 +1,115 @@
+import hashlib, re, time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# (seconds per call, seconds per token) of typical backends, so that offline embeddings cost what real ones would
+COST_PROFILES: Dict[str, Tuple[float, float]] = {
+    "none": (0.0, 0.0),
+    "cpu-small": (0.002, 0.00002),  # MiniLM-class model on CPU
+    "cpu-base": (0.005, 0.0001),    # 300M-class model on CPU, e.g. Docker Model Runner
+    "gpu": (0.003, 0.000002),
+    "api": (0.08, 0.000001),        # Remote embedding API, dominated by the network round trip
+}
+
+class _OfflineEmbeddings:
+    _TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, cost_profile: str = "none", seconds_per_call: Optional[float] = None, seconds_per_token: Optional[float] = None):
+        if cost_profile not in COST_PROFILES:
+            raise ValueError(f"Unknown cost profile: {cost_profile}, expected one of {list(COST_PROFILES)}")
+        per_call, per_token = COST_PROFILES[cost_profile]
+        self.seconds_per_call = per_call if seconds_per_call is None else seconds_per_call
+        self.seconds_per_token = per_token if seconds_per_token is None else seconds_per_token
+
+    def _tokenize(self, text: str) -> List[str]:
+        return self._TOKEN_PATTERN.findall(text.lower())
+
+    def _simulate_cost(self, num_tokens: int):
+        # Sleeping releases the GIL like network calls and native inference do, so concurrency behaves as with real backends
+        delay = self.seconds_per_call + self.seconds_per_token * num_tokens
+        if delay > 0:
+            time.sleep(delay)
+
+class HashEmbeddings(_OfflineEmbeddings):
+    """Deterministic embeddings computed without any model or network access.
+    Each token is hashed to a signed position of a `dimension`-sized vector (feature hashing) and the
+    vector is L2-normalized, so texts sharing words get similar embeddings. Meant for benchmarks and tests.
+    Arguments:
+        dimension: Size of the produced vectors
+        cost_profile: Simulated latency of every `encode` call, see `COST_PROFILES`
+        seconds_per_call, seconds_per_token: Override the latency of the cost profile
+    """
+
+    def __init__(self, dimension: int = 384, cost_profile: str = "none", seconds_per_call: Optional[float] = None, seconds_per_token: Optional[float] = None):
+        super().__init__(cost_profile, seconds_per_call, seconds_per_token)
+        self.dimension = dimension
+        self._token_cache: Dict[str, Tuple[int, float]] = {}
+
+    def _hash_token(self, token: str) -> Tuple[int, float]:
+        cached = self._token_cache.get(token)
+        if cached is None:
+            digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            cached = (digest % self.dimension, 1.0 if digest >> 63 else -1.0)
+            self._token_cache[token] = cached
+        return cached
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        num_tokens = 0
+        for row, text in enumerate(texts):
+            tokens = self._tokenize(text)
+            num_tokens += len(tokens)
+            for token in tokens:
+                position, sign = self._hash_token(token)
+                embeddings[row, position] += sign
+        self._simulate_cost(num_tokens)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+class RandomProjectionEmbeddings(_OfflineEmbeddings):
+    """Deterministic dense embeddings computed without any model or network access.
+    Each token gets a random Gaussian vector seeded by its hash (a random projection of the one-hot vocabulary), a text is the
+    L2-normalized sum of its token vectors. Unlike `HashEmbeddings`, every dimension is used, so that vector indexes,
+    quantization and truncation behave as with real models. Meant for benchmarks and tests.
+    Arguments:
+        dimension: Size of the produced vectors
+        seed: Changes every token vector, e.g. to simulate another model
+        cost_profile: Simulated latency of every `encode` call, see `COST_PROFILES`
+        seconds_per_call, seconds_per_token: Override the latency of the cost profile
+    """
+
+    def __init__(
+        self,
+        dimension: int = 384,
+        seed: int = 0,
+        cost_profile: str = "none",
+        seconds_per_call: Optional[float] = None,
+        seconds_per_token: Optional[float] = None,
+    ):
+        super().__init__(cost_profile, seconds_per_call, seconds_per_token)
+        self.dimension = dimension
+        self.seed = seed
+        self._token_vectors: Dict[str, np.ndarray] = {}
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            vector = np.random.default_rng([self.seed, digest]).standard_normal(self.dimension).astype(np.float32)
+            self._token_vectors[token] = vector
+        return vector
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        num_tokens = 0
+        for row, text in enumerate(texts):
+            tokens = self._tokenize(text)
+            num_tokens += len(tokens)
+            for token in tokens:
+                embeddings[row] += self._token_vector(token)
+        self._simulate_cost(num_tokens)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
@@ -0,0 +1,51 @@
+from typing import Tuple
+
+import numpy as np
+
+def truncate_embeddings(embeddings: np.ndarray, dim: int) -> np.ndarray:
+    """Matryoshka truncation: keep the first `dim` dimensions and L2-normalize them again"""
+    truncated = np.ascontiguousarray(embeddings[:, :dim], dtype=np.float32)
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return truncated / norms
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Scalar quantization: each vector is scaled so its largest component maps to 127.
+    Returns the int8 codes and the per-vector scales (`embeddings ~ codes * scales[:, None]`)."""
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(embeddings / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def int8_scores(query_embeddings: np.ndarray, codes: np.ndarray, scales: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Approximate dot products between float queries and int8-quantized vectors.
+    Codes are dequantized chunk by chunk, so the full-precision matrix is never materialized."""
+    scores = np.empty((len(query_embeddings), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), chunk_size):
+        chunk = codes[start:start + chunk_size].astype(np.float32)
+        scores[:, start:start + chunk_size] = (query_embeddings @ chunk.T) * scales[start:start + chunk_size]
+    return scores
+
+def quantize_binary(embeddings: np.ndarray) -> np.ndarray:
+    """Binary (sign-bit) quantization: one bit per dimension, packed in 64-bit words"""
+    packed = np.packbits(embeddings > 0, axis=1)
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def _popcount64(words: np.ndarray) -> np.ndarray:
+    # SWAR bit counting on whole 64-bit words
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+def hamming_distances(query_codes: np.ndarray, codes: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Hamming distances between binary-quantized queries and vectors (popcount of the XOR)"""
+    distances = np.empty((len(query_codes), len(codes)), dtype=np.int32)
+    for start in range(0, len(codes), chunk_size):
+        chunk = codes[start:start + chunk_size]
+        for row, query_code in enumerate(query_codes):
+            distances[row, start:start + chunk_size] = _popcount64(np.bitwise_xor(chunk, query_code)).sum(axis=1)
+    return distances
@@ -1,8 +1,8 @@
-from typing import List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 
 from .base import BaseBM25Retriever
 from documents import Document
-from store import RedisController
+from store import RedisController, create_controller
 
 
 class RedisBM25Retriever(BaseBM25Retriever):
@@ -12,35 +12,59 @@ class RedisBM25Retriever(BaseBM25Retriever):
         redis_host: str = "localhost",
         redis_port: int = 6379,
         redis_db: int = 0,
+        redis_shards: Optional[List[str]] = None,
+        redis_controller: Optional[RedisController] = None,
         index_name: str = "bm25_idx",
         index_prefix: str = "doc:",
         create_index: bool = True,
         fuzziness: int = 0,
+        prefix: bool = False,
+        max_terms: int = 16,
         k1: float = 1.2,
         b: float = 0.75,
     ):
+        """BM25 retriever backed by a RediSearch full-text index, scored with BM25STD.
+        Queries match any of their terms, `fuzziness` (0 to 3) and `prefix` expand the longest terms (see `store.build_text_query`).
+        k1 and b are kept for config compatibility, RediSearch uses its own BM25 parameters.
+        `redis_controller` replaces the controller built from the connection arguments, e.g. a `FakeRedisController`."""
         super().__init__(k1, b)
-        self.redis = RedisController(host=redis_host, port=redis_port, db=redis_db)
+        self.redis = redis_controller or create_controller(redis_host, redis_port, redis_db, shards=redis_shards)
         self.index_name = index_name
         self.index_prefix = index_prefix
         self.create_index = create_index
+        self._index_created = False
         self.fuzziness = fuzziness
+        self.prefix = prefix
+        self.max_terms = max_terms
 
     def fit_documents(self, documents: List[Document]):
-        self.documents = documents
+        self.documents = []
+        self.add_documents(documents)
+        # Drop copies left on shards that no longer own their key
+        self.redis.rebalance(self.index_prefix)
 
-        if self.create_index:
+    def add_documents(self, documents: List[Document], start: Optional[int] = None):
+        """Append documents to the index, their positions following the documents already indexed (or starting at `start`)"""
+        start = len(self.documents) if start is None else start
+        self.documents.extend(documents)
+
+        if self.create_index and not self._index_created:
+            self._index_created = True
             self.redis.create_text_index(self.index_name, self.index_prefix)
 
-        for idx, doc in enumerate(documents):
-            key = f"{self.index_prefix}:{doc.idx}:{doc.chunk}"
-            self.redis.add_document(
-                key,
+        self.redis.add_documents([
+            (
+                f"{self.index_prefix}:{doc.idx}:{doc.chunk}",
                 {
-                    "metadata": f"{idx}/{doc.idx}/{doc.chunk}",
+                    "metadata": f"{start + idx}/{doc.idx}/{doc.chunk}",
                     "content": doc.text,
                 },
             )
+            for idx, doc in enumerate(documents)
+        ])
+
+    def _counts(self) -> Dict[str, Any]:
+        return {**super()._counts(), "redis": self.redis.index_info(self.index_name)}
 
     def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
         results = self.redis.search_text(
@@ -49,5 +73,7 @@ class RedisBM25Retriever(BaseBM25Retriever):
             top_k=top_k,
             fuzziness=self.fuzziness,
             scorer="BM25STD",
+            prefix=self.prefix,
+            max_terms=self.max_terms,
         )
         return results
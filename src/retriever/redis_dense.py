@@ -1,8 +1,11 @@
-from typing import List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
+
+import numpy as np
 
 from .base import BaseDenseRetriever
+from .quantization import truncate_embeddings
 from documents import Document
-from store import RedisController, to_binary
+from store import RedisController, create_controller, to_binary
 
 
 class RedisDenseRetriever(BaseDenseRetriever):
@@ -13,65 +16,136 @@ class RedisDenseRetriever(BaseDenseRetriever):
         redis_host: str = "localhost",
         redis_port: int = 6379,
         redis_db: int = 0,
+        redis_shards: Optional[List[str]] = None,
+        redis_controller: Optional[RedisController] = None,
         index_name: str = "dense_idx",
         index_prefix: str = "doc:",
         vector_dim: Optional[int] = None,
+        truncate_dim: Optional[int] = None,
+        rescore_multiplier: int = 4,
         distance_metric: str = "COSINE",
         create_index: bool = True,
         **model_kwargs,
     ):
-        super().__init__(model_name, **model_kwargs)
-        self.redis = RedisController(host=redis_host, port=redis_port, db=redis_db)
+        """Dense retriever backed by a RediSearch vector index.
+        With `truncate_dim`, the index only holds the first `truncate_dim` dimensions of the (Matryoshka) embeddings:
+        the KNN query returns `top_k * rescore_multiplier` candidates whose full vectors, stored alongside but not indexed,
+        are re-scored client side. Scores are distances under `distance_metric` in both modes.
+        `redis_controller` replaces the controller built from the connection arguments, e.g. a `FakeRedisController`.
+        With `truncate_dim` and no `vector_dim`, the dimension of the model is read (or measured) at construction."""
+        super().__init__(model_name, vector_dim=vector_dim, **model_kwargs)
+        if truncate_dim is not None and self.vector_dim is None:
+            # Needed by `coarse` before any document is embedded, e.g. when searching an index built by another process
+            self.vector_dim = self.model.dimension
+        self.redis = redis_controller or create_controller(redis_host, redis_port, redis_db, shards=redis_shards)
         self.index_name = index_name
         self.index_prefix = index_prefix
-        self.vector_dim = vector_dim
+        self.truncate_dim = truncate_dim
+        self.rescore_multiplier = rescore_multiplier
         self.distance_metric = distance_metric
         self.create_index = create_index
+        self._index_created = False
+
+    @property
+    def coarse(self) -> bool:
+        return self.truncate_dim is not None and self.vector_dim is not None and self.truncate_dim < self.vector_dim
 
-    def encode_documents(self, documents: List[Document]) -> List[List[float]]:
-        self.documents = documents
+    def encode_documents(self, documents: List[Document]) -> np.ndarray:
+        self.documents = []
         texts = [doc.text for doc in documents]
-        embeddings = self.model.encode(texts)
-        
-        if not embeddings:
-            return []
+        embeddings = self.embed_documents(texts)
+        self.add_embedded_documents(documents, embeddings)
+        # Drop copies left on shards that no longer own their key
+        self.redis.rebalance(self.index_prefix)
+
+        return embeddings
+
+    def add_embedded_documents(self, documents: List[Document], embeddings: np.ndarray, start: Optional[int] = None):
+        """Append already embedded documents to the index, their positions following the documents already indexed
+        (or starting at `start`, e.g. when resuming an ingestion). Writing the same documents again at the same positions
+        overwrites them, so that interrupted ingestions can be replayed."""
+        start = len(self.documents) if start is None else start
+        self.documents.extend(documents)
+        if not len(embeddings):
+            return
         
         for e, d in zip(embeddings, documents):
             d.embedding = e
 
         if self.vector_dim is None:
-            self.vector_dim = len(embeddings[0])
+            self.vector_dim = embeddings.shape[1]
 
-        if self.create_index:
+        if self.create_index and not self._index_created:
+            self._index_created = True
             self.redis.create_vector_index(
                 self.index_name,
                 self.index_prefix,
-                self.vector_dim,
+                self.truncate_dim if self.coarse else self.vector_dim,
                 self.distance_metric,
+                vector_field="embedding_coarse" if self.coarse else "embedding",
             )
 
-        for idx, doc in enumerate(documents):
-            key = f"{self.index_prefix}:{doc.idx}:{doc.chunk}"
-            self.redis.add_document(
-                key,
+        coarse_embeddings = truncate_embeddings(embeddings, self.truncate_dim) if self.coarse else None
+        self.redis.add_documents([
+            (
+                f"{self.index_prefix}:{doc.idx}:{doc.chunk}",
                 {
-                    "metadata": f"{idx}/{doc.idx}/{doc.chunk}",
+                    "metadata": f"{start + idx}/{doc.idx}/{doc.chunk}",
                     "content": doc.text,
                     "embedding": to_binary(doc.embedding),
+                    **({"embedding_coarse": to_binary(coarse_embeddings[idx])} if self.coarse else {}),
                 },
             )
+            for idx, doc in enumerate(documents)
+        ])
 
-        return embeddings
+    def search_by_vectors(self, query_embeddings: List[List[float]], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        knn_vectors, knn_k, vector_field = self.knn_queries(query_embeddings, top_k)
+        candidates = [
+            self.redis.search_vector(self.index_name, list(knn_vector), knn_k, vector_field=vector_field)
+            for knn_vector in knn_vectors
+        ]
+        return self.rescore(query_embeddings, candidates, top_k)
+
+    def knn_queries(self, query_embeddings: List[List[float]], top_k: int = 10) -> Tuple[np.ndarray, int, str]:
+        """Vectors, depth and field of the KNN queries sent to Redis for `top_k` results: the truncated vectors on the coarse field
+        and `top_k * rescore_multiplier` candidates when the index is coarse"""
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if not self.coarse:
+            return query_embeddings, top_k, "embedding"
+        return truncate_embeddings(query_embeddings, self.truncate_dim), top_k * self.rescore_multiplier, "embedding_coarse"
 
-    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
-        query_vector = self._normalize_query_embedding(self.model.encode(query))
-        results = self.redis.search_vector(self.index_name, query_vector, top_k)
-        return results
+    def rescore(self, query_embeddings: List[List[float]], candidates: List[List[Tuple[str, float]]], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """Final results of KNN queries built with `knn_queries`, coarse candidates are re-scored on their full vectors"""
+        if not self.coarse:
+            return candidates
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        return [self._rescore(query_vector, results, top_k) for query_vector, results in zip(query_embeddings, candidates)]
+
+    def _rescore(self, query_vector: np.ndarray, candidates: List[Tuple[str, float]], top_k: int) -> List[Tuple[str, float]]:
+        # Exact distances on the full vectors of the coarse candidates
+        keys = [key for key, _ in candidates]
+        stored = self.redis.get_field(keys, "embedding")
+        found = [(key, vector) for key, vector in zip(keys, stored) if vector is not None]
+        if not found:
+            return []
+        vectors = np.stack([np.frombuffer(vector, dtype='<f4') for _, vector in found])
+
+        metric = self.distance_metric.upper()
+        if metric == "L2":
+            distances = ((vectors - query_vector) ** 2).sum(axis=1)
+        elif metric == "IP":
+            distances = 1.0 - vectors @ query_vector
+        else:
+            norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+            norms[norms == 0] = 1.0
+            distances = 1.0 - (vectors @ query_vector) / norms
+        best = np.argsort(distances)[:top_k]
+        return [(found[position][0], float(distances[position])) for position in best]
 
-    def _normalize_query_embedding(self, embedding) -> List[float]:
-        if embedding and isinstance(embedding[0], list):
-            return embedding[0]
-        return embedding
+    def _counts(self) -> Dict[str, Any]:
+        # Documents keep their embedding attribute, counted in the 'documents' bytes
+        return {**super()._counts(), "truncate_dim": self.truncate_dim, "redis": self.redis.index_info(self.index_name)}
 
     def _normalize_score(self, score: float) -> float:
         metric = self.distance_metric.upper()
@@ -0,0 +1,115 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from documents import Document
+from .base import BaseSparseRetriever
+from .inverted_index import InvertedIndex
+
+class SpladeEncoder:
+    """SPLADE encoder: a masked language model whose output logits are turned into one weight per vocabulary term,
+    `max over tokens of log(1 + relu(logit))`. Most weights are zero, so texts become sparse, expanded term vectors.
+    transformers and torch are imported and the model loaded on first use, inference runs on CPU.
+    Arguments:
+        model_name: Hugging Face SPLADE checkpoint
+        batch_size: Number of texts per forward pass, texts are sorted by length to limit padding
+        max_length: Texts are truncated to this number of tokens
+        top_terms: Keep only the `top_terms` highest weights of every vector, None to keep them all
+        num_threads: Torch CPU threads, defaults to torch's own setting
+    """
+    def __init__(
+        self,
+        model_name: str = "naver/splade-cocondenser-ensembledistil",
+        batch_size: int = 32,
+        max_length: int = 256,
+        top_terms: Optional[int] = None,
+        num_threads: Optional[int] = None,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.top_terms = top_terms
+        self.num_threads = num_threads
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import torch
+                    from transformers import AutoModelForMaskedLM, AutoTokenizer
+                    if self.num_threads:
+                        torch.set_num_threads(self.num_threads)
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                    model = AutoModelForMaskedLM.from_pretrained(self.model_name)
+                    model.eval()
+                    self._model = model
+
+    def encode(self, texts: List[str]) -> List[Dict[int, float]]:
+        """One {token id: weight} mapping per text"""
+        import torch
+        self._load()
+        vectors: List[Optional[Dict[int, float]]] = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda position: len(texts[position]))
+        for start in range(0, len(order), self.batch_size):
+            positions = order[start:start + self.batch_size]
+            tokens = self._tokenizer(
+                [texts[position] for position in positions],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="pt",
+            )
+            with torch.inference_mode():
+                logits = self._model(**tokens).logits
+            weights = torch.log1p(torch.relu(logits)) * tokens["attention_mask"].unsqueeze(-1)
+            weights = weights.max(dim=1).values
+            for position, row in zip(positions, weights):
+                term_ids = torch.nonzero(row).squeeze(1)
+                values = row[term_ids]
+                if self.top_terms is not None and len(term_ids) > self.top_terms:
+                    values, best = torch.topk(values, self.top_terms)
+                    term_ids = term_ids[best]
+                vectors[position] = dict(zip(term_ids.tolist(), values.tolist()))
+        return vectors
+
+    def decode(self, vector: Dict[int, float]) -> Dict[str, float]:
+        """Readable version of a vector, mapping tokens to weights"""
+        self._load()
+        return {self._tokenizer.convert_ids_to_tokens(term_id): weight for term_id, weight in vector.items()}
+
+class SpladeRetriever(BaseSparseRetriever):
+    def __init__(self, encoder: Optional[SpladeEncoder] = None, block_size: int = 128, **encoder_kwargs):
+        """Learned sparse retriever: documents are expanded into weighted term vectors at indexing time and stored in an
+        `InvertedIndex`, so queries cost an inverted index lookup (with block-max pruning) instead of a vector scan.
+        The score of a document is the dot product of the query and document vectors.
+        `encoder_kwargs` are passed to `SpladeEncoder` when no encoder is given, use **SpladeConfig() from helpers.config to easily create them."""
+        self.encoder = encoder or SpladeEncoder(**encoder_kwargs)
+        self.index = InvertedIndex(block_size)
+        self.documents: List[Document] = []
+
+    def fit_documents(self, documents: List[Document]):
+        """Expand the documents with the encoder and index their term weights"""
+        self.documents = documents
+        self.index.build(self.encoder.encode([doc.text for doc in documents]))
+
+    def clone(self) -> "SpladeRetriever":
+        clone = super().clone()
+        clone.index = InvertedIndex(self.index.block_size, self.index.min_pruning_blocks)
+        return clone
+
+    def _memory(self) -> Dict[str, int]:
+        return {**super()._memory(), **{f"index_{name}": size for name, size in self.index.stats()["bytes"].items()}}
+
+    def _counts(self) -> Dict[str, Any]:
+        index_stats = self.index.stats()
+        index_stats.pop("bytes")
+        return {**super()._counts(), **index_stats}
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        return self.search_batch([query], top_k)[0]
+
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """Encode all queries in batched forward passes, then look each one up in the inverted index"""
+        return [
+            [(str(doc_id), score) for doc_id, score in self.index.search(query_vector, top_k)]
+            for query_vector in self.encoder.encode(queries)
+        ]
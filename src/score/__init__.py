@@ -1,5 +1,7 @@
 from .fusion import ScoreFusion
-from .performance import PerformanceMonitor
+from .performance import PerformanceMonitor, LatencyHistogram, stats_to_prometheus
 from .metrics import RetrievalMetrics
+from .aggregation import aggregate_by_parent
+from .profiling import QueryProfiler, QueryProfile
 
-__all__ = ["ScoreFusion", "optimize_fusion_weights", "PerformanceMonitor", "RetrievalMetrics"]
\ No newline at end of file
+__all__ = ["ScoreFusion", "optimize_fusion_weights", "PerformanceMonitor", "LatencyHistogram", "stats_to_prometheus", "RetrievalMetrics", "aggregate_by_parent", "QueryProfiler", "QueryProfile"]
\ No newline at end of file
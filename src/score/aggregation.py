@@ -0,0 +1,36 @@
+from typing import Callable, Dict, Hashable, List, Literal, Tuple
+
+Aggregation = Literal["max", "sum", "top_n"]
+ParentResult = Tuple[int, float, List[Tuple[str, float]]]
+
+def aggregate_by_parent(
+    results: List[Tuple[str, float]],
+    parent_of: Callable[[str], Hashable],
+    method: Aggregation = "max",
+    top_n: int = 3,
+    max_chunks_per_parent: int = 1,
+) -> List[ParentResult]:
+    """Group ranked chunk results by parent document and score every parent from its chunks:
+    'max' takes the best chunk score, 'sum' adds all of them and 'top_n' adds the `top_n` best ones.
+    Returns (parent, score, chunks) tuples sorted by decreasing score, with at most `max_chunks_per_parent`
+    chunks per parent (the best ones), so that a single long document cannot fill the results."""
+    if method not in ("max", "sum", "top_n"):
+        raise ValueError(f"Unknown aggregation method: {method}")
+
+    # Results are sorted by decreasing score, so are the chunks of every parent
+    groups: Dict[Hashable, List[Tuple[str, float]]] = {}
+    for chunk_id, score in results:
+        groups.setdefault(parent_of(chunk_id), []).append((chunk_id, score))
+
+    parents = []
+    for parent, chunks in groups.items():
+        if method == "max":
+            score = float(chunks[0][1])
+        elif method == "sum":
+            score = float(sum(chunk_score for _, chunk_score in chunks))
+        else:
+            score = float(sum(chunk_score for _, chunk_score in chunks[:top_n]))
+        parents.append((parent, score, chunks[:max_chunks_per_parent]))
+    # Stable sort: ties keep the order of the best chunks
+    parents.sort(key=lambda parent: parent[1], reverse=True)
+    return parents
@@ -35,15 +35,17 @@ class ScoreFusion:
         dense_results: List[Tuple[str, float]],
         sparse_results: List[Tuple[str, float]],
         dense_weight: float = 0.7,
-        sparse_weight: float = 0.3
+        sparse_weight: float = 0.3,
+        normalization: str = "min_max"
     ) -> List[Tuple[int, float]]:
         """
         Combine scores using weighted sum
         Final score = (dense_weight * dense_score) + (sparse_weight * sparse_score)
+        Scores of each list are first normalized with `normalization` ('min_max', 'z_score' or 'none')
         """
-        # Normalize scores to [0, 1] range
-        dense_scores = ScoreFusion._normalize_scores(dense_results)
-        sparse_scores = ScoreFusion._normalize_scores(sparse_results)
+        # Normalize scores so both lists are comparable
+        dense_scores = ScoreFusion._normalize_scores(dense_results, normalization)
+        sparse_scores = ScoreFusion._normalize_scores(sparse_results, normalization)
         
         # Combine scores
         combined_scores = {}
@@ -69,12 +71,22 @@ class ScoreFusion:
         return [(doc_id, score) for doc_id, score in sorted_results]
     
     @staticmethod
-    def _normalize_scores(results: List[Tuple[str, float]]) -> Dict[int, float]:
-        """Normalize scores to [0, 1] range"""
+    def _normalize_scores(results: List[Tuple[str, float]], method: str = "min_max") -> Dict[int, float]:
+        """Normalize scores, to [0, 1] range with 'min_max', to zero mean and unit variance with 'z_score'"""
         if not results:
             return {}
         
-        scores = [score for _, score in results]
+        scores = [float(score) for _, score in results]
+        if method == "none":
+            return {doc_id: score for (doc_id, _), score in zip(results, scores)}
+        if method == "z_score":
+            mean, std = float(np.mean(scores)), float(np.std(scores))
+            if std == 0:
+                return {doc_id: 0.0 for doc_id, _ in results}
+            return {doc_id: (score - mean) / std for (doc_id, _), score in zip(results, scores)}
+        if method != "min_max":
+            raise ValueError(f"Unknown normalization method: {method}")
+        
         min_score = min(scores)
         max_score = max(scores)
         
@@ -82,7 +94,7 @@ class ScoreFusion:
             return {doc_id: 1.0 for doc_id, _ in results}
         
         normalized = {}
-        for doc_id, score in results:
+        for (doc_id, _), score in zip(results, scores):
             normalized[doc_id] = (score - min_score) / (max_score - min_score)
         
         return normalized
@@ -1,5 +1,5 @@
 import numpy as np
-from typing import List, Set
+from typing import Dict, List, Set, Tuple
 
 class RetrievalMetrics:
     """Calculate retrieval quality metrics"""
@@ -50,4 +50,51 @@ class RetrievalMetrics:
         ideal_relevance = [1] * min(len(relevant), k) + [0] * max(0, k - len(relevant))
         idcg = dcg_at_k(ideal_relevance, k)
         
-        return dcg / idcg if idcg > 0 else 0
\ No newline at end of file
+        return dcg / idcg if idcg > 0 else 0
+
+    @staticmethod
+    def relevance_matrix(retrieved_lists: List[List[int]], relevant_lists: List[Set[int]], max_k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Build the binary relevance matrix of the top `max_k` results of every query.
+        Returns the (n_queries, max_k) relevance matrix, the number of distinct retrieved documents
+        and the number of relevant documents per query. Repeated documents only count once."""
+        relevance = np.zeros((len(retrieved_lists), max_k), dtype=bool)
+        num_retrieved = np.zeros(len(retrieved_lists), dtype=np.int64)
+        num_relevant = np.array([len(relevant) for relevant in relevant_lists], dtype=np.int64)
+        
+        for row, (retrieved, relevant) in enumerate(zip(retrieved_lists, relevant_lists)):
+            seen = set()
+            for rank, doc_id in enumerate(retrieved[:max_k]):
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                relevance[row, rank] = doc_id in relevant
+            num_retrieved[row] = len(seen)
+        
+        return relevance, num_retrieved, num_relevant
+    
+    @staticmethod
+    def batch_metrics(relevance: np.ndarray, num_retrieved: np.ndarray, num_relevant: np.ndarray, k_values: List[int]) -> Dict[str, np.ndarray]:
+        """Per-query precision@k, recall@k, nDCG@k for every k, and reciprocal rank, from a relevance matrix.
+        Same definitions as the single-query methods, computed as array operations over all queries."""
+        max_k = relevance.shape[1]
+        hits = np.cumsum(relevance, axis=1)
+        discounts = 1 / np.log2(np.arange(2, max_k + 2))
+        dcg = np.cumsum(relevance * discounts, axis=1)
+        ideal_dcg = np.concatenate([[0], np.cumsum(discounts)])
+        
+        results = {}
+        for k in k_values:
+            column = min(k, max_k) - 1
+            hits_k = hits[:, column] if max_k else np.zeros(len(relevance))
+            retrieved_k = np.minimum(num_retrieved, k)
+            results[f'precision@{k}'] = np.divide(hits_k, retrieved_k, out=np.zeros(len(hits_k)), where=retrieved_k > 0)
+            results[f'recall@{k}'] = np.divide(hits_k, num_relevant, out=np.zeros(len(hits_k)), where=num_relevant > 0)
+            idcg = ideal_dcg[np.minimum(num_relevant, min(k, max_k))]
+            dcg_k = dcg[:, column] if max_k else np.zeros(len(relevance))
+            results[f'ndcg@{k}'] = np.divide(dcg_k, idcg, out=np.zeros(len(hits_k)), where=idcg > 0)
+        
+        first_hit = np.argmax(relevance, axis=1)
+        has_hit = relevance.any(axis=1)
+        results['mrr'] = np.where(has_hit, 1 / (first_hit + 1), 0.0)
+        
+        return results
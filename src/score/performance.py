@@ -1,39 +1,285 @@
-from typing import Dict, Any
+import threading, time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+class LatencyHistogram:
+    """HDR-style latency histogram (values in nanoseconds)
+
+    Values are counted in log-linear buckets: each power of two is split into 2^`sub_bucket_bits`
+    linear sub-buckets, so any recorded value is reported with a relative error below 2^-`sub_bucket_bits`
+    while memory stays constant whatever the number of recorded values. Not thread-safe on its own,
+    `PerformanceMonitor` serializes access to its histograms."""
+
+    def __init__(self, sub_bucket_bits: int = 5):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.counts: List[int] = [0] * ((64 - sub_bucket_bits) * self.sub_bucket_count)
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _bucket_index(self, value: int) -> int:
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - 1 - self.sub_bucket_bits
+        return (shift + 1) * self.sub_bucket_count + (value >> shift) - self.sub_bucket_count
+
+    def _bucket_upper_bound(self, index: int) -> int:
+        if index < self.sub_bucket_count:
+            return index
+        shift = index // self.sub_bucket_count - 1
+        sub_bucket = index % self.sub_bucket_count + self.sub_bucket_count
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value: int):
+        value = max(int(value), 0)
+        self.counts[self._bucket_index(value)] += 1
+        self.min = value if self.count == 0 else min(self.min, value)
+        self.max = max(self.max, value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percentile: float) -> int:
+        """Value below which `percentile` % of the recorded values fall"""
+        if self.count == 0:
+            return 0
+        threshold = max(1, round(self.count * percentile / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(self._bucket_upper_bound(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
 
 class PerformanceMonitor:
-    """Monitor hybrid search performance metrics"""
-    
-    def __init__(self):
+    """Monitor hybrid search performance metrics
+
+    Thread-safe. Query latencies and per-stage timings (embed, dense, sparse, fusion, rerank, cache...)
+    are kept in `LatencyHistogram`s; throughput is measured over the last `window_seconds` of completed
+    queries rather than derived from the average latency, which is wrong as soon as queries overlap.
+    """
+
+    QUANTILES = (50, 95, 99)
+
+    def __init__(self, window_seconds: float = 60.0):
         self.metrics = {
             'queries_processed': 0,
             'avg_response_time': 0,
             'cache_hits': 0,
+            'cache_lookups': 0,
             'total_time': 0
         }
-    
+        self.window_seconds = window_seconds
+        self.latency = LatencyHistogram()
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self._completions = deque()  # [second, count] pairs over the throughput window
+        self._started_at = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
     def record_query(self, query_time: float, cache_hit: bool = False):
-        """Record performance metrics for a query"""
-        self.metrics['queries_processed'] += 1
-        self.metrics['total_time'] += query_time
-        
-        if cache_hit:
-            self.metrics['cache_hits'] += 1
-        
-        # Update average response time
-        self.metrics['avg_response_time'] = (
-            self.metrics['total_time'] / self.metrics['queries_processed']
-        )
-    
+        """Record performance metrics for a query, `query_time` in seconds"""
+        self.record_query_ns(int(query_time * 1e9), cache_hit)
+
+    def record_query_ns(self, duration_ns: int, cache_hit: bool = False):
+        """Record performance metrics for a query, `duration_ns` in nanoseconds"""
+        now_second = time.perf_counter_ns() // 1_000_000_000
+        with self._lock:
+            self.latency.record(duration_ns)
+            self.metrics['queries_processed'] += 1
+            self.metrics['total_time'] += duration_ns / 1e9
+
+            if cache_hit:
+                self.metrics['cache_hits'] += 1
+                self.metrics['cache_lookups'] += 1
+
+            # Update average response time
+            self.metrics['avg_response_time'] = (
+                self.metrics['total_time'] / self.metrics['queries_processed']
+            )
+
+            if self._completions and self._completions[-1][0] == now_second:
+                self._completions[-1][1] += 1
+            else:
+                self._completions.append([now_second, 1])
+            self._expire_completions(now_second)
+
+    def record_stage(self, stage: str, duration_ns: int):
+        """Record the time spent in one stage of a query"""
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = LatencyHistogram()
+            self.stages[stage].record(duration_ns)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block as `stage`"""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter_ns() - start)
+
+    def record_cache_lookup(self, hit: bool):
+        """Record a result cache lookup"""
+        with self._lock:
+            self.metrics['cache_lookups'] += 1
+            if hit:
+                self.metrics['cache_hits'] += 1
+
+    def queries_per_second(self) -> float:
+        """Completed queries per second over the throughput window"""
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            self._expire_completions(now_ns // 1_000_000_000)
+            completed = sum(count for _, count in self._completions)
+        span = min(self.window_seconds, (now_ns - self._started_at) / 1e9)
+        return completed / span if span > 0 else 0
+
+    def _expire_completions(self, now_second: int):
+        while self._completions and self._completions[0][0] <= now_second - self.window_seconds:
+            self._completions.popleft()
+
     def get_performance_report(self) -> Dict[str, Any]:
         """Generate performance summary"""
-        cache_rate = (
-            self.metrics['cache_hits'] / self.metrics['queries_processed'] 
-            if self.metrics['queries_processed'] > 0 else 0
-        )
-        
-        return {
-            'total_queries': self.metrics['queries_processed'],
-            'average_response_time_ms': self.metrics['avg_response_time'] * 1000,
-            'cache_hit_rate': cache_rate,
-            'queries_per_second': 1 / self.metrics['avg_response_time'] if self.metrics['avg_response_time'] > 0 else 0
-        }
+        queries_per_second = self.queries_per_second()
+        with self._lock:
+            cache_rate = (
+                self.metrics['cache_hits'] / self.metrics['cache_lookups']
+                if self.metrics['cache_lookups'] > 0 else 0
+            )
+            report = {
+                'total_queries': self.metrics['queries_processed'],
+                'average_response_time_ms': self.metrics['avg_response_time'] * 1000,
+                'cache_hit_rate': cache_rate,
+                'queries_per_second': queries_per_second,
+                **self._latency_summary(self.latency),
+                'stages': {stage: self._latency_summary(histogram) for stage, histogram in self.stages.items()},
+            }
+        return report
+
+    def _latency_summary(self, histogram: LatencyHistogram) -> Dict[str, float]:
+        summary = {f'p{quantile}_ms': histogram.percentile(quantile) / 1e6 for quantile in self.QUANTILES}
+        summary['max_ms'] = histogram.max / 1e6
+        summary['count'] = histogram.count
+        return summary
+
+    def to_prometheus(self, prefix: str = "hybrid_search") -> str:
+        """Export the metrics in the Prometheus / OpenMetrics text exposition format"""
+        queries_per_second = self.queries_per_second()
+        lines = []
+        with self._lock:
+            lines += [
+                f"# HELP {prefix}_query_latency_seconds Query latency",
+                f"# TYPE {prefix}_query_latency_seconds summary",
+            ]
+            lines += self._prometheus_summary(f"{prefix}_query_latency_seconds", self.latency)
+            lines += [
+                f"# HELP {prefix}_stage_latency_seconds Time spent per query stage",
+                f"# TYPE {prefix}_stage_latency_seconds summary",
+            ]
+            for stage, histogram in sorted(self.stages.items()):
+                lines += self._prometheus_summary(f"{prefix}_stage_latency_seconds", histogram, f'stage="{stage}"')
+            lines += [
+                f"# HELP {prefix}_cache_lookups_total Result cache lookups",
+                f"# TYPE {prefix}_cache_lookups_total counter",
+                f"{prefix}_cache_lookups_total {self.metrics['cache_lookups']}",
+                f"# HELP {prefix}_cache_hits_total Result cache hits",
+                f"# TYPE {prefix}_cache_hits_total counter",
+                f"{prefix}_cache_hits_total {self.metrics['cache_hits']}",
+            ]
+        lines += [
+            f"# HELP {prefix}_queries_per_second Completed queries per second over the last {self.window_seconds:g}s",
+            f"# TYPE {prefix}_queries_per_second gauge",
+            f"{prefix}_queries_per_second {queries_per_second}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def _prometheus_summary(self, name: str, histogram: LatencyHistogram, labels: Optional[str] = None) -> List[str]:
+        label_prefix = f"{labels}," if labels else ""
+        lines = [
+            f'{name}{{{label_prefix}quantile="{quantile / 100}"}} {histogram.percentile(quantile) / 1e9}'
+            for quantile in self.QUANTILES
+        ]
+        lines.append(f'{name}{{{label_prefix}quantile="1.0"}} {histogram.max / 1e9}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.total / 1e9}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+def stats_to_prometheus(stats: Dict[str, Any], prefix: str = "hybrid_search") -> str:
+    """Export the `stats()` of a search system as Prometheus gauges (and the routing counters, when it has a router).
+    Memory is broken down by component and structure so that the series add up to the total."""
+    lines = [
+        f"# HELP {prefix}_chunks Indexed chunks",
+        f"# TYPE {prefix}_chunks gauge",
+        f"{prefix}_chunks {stats['chunks']}",
+        f"# HELP {prefix}_parents Indexed parent documents",
+        f"# TYPE {prefix}_parents gauge",
+        f"{prefix}_parents {stats['parents']}",
+        f"# HELP {prefix}_snapshot_version Version of the served index snapshot, incremented by every re-indexing or settings change",
+        f"# TYPE {prefix}_snapshot_version gauge",
+        f"{prefix}_snapshot_version {stats.get('snapshot_version', 0)}",
+        f"# HELP {prefix}_memory_bytes Approximate resident bytes per component and structure",
+        f"# TYPE {prefix}_memory_bytes gauge",
+    ]
+    # Documents are shared, they are reported once by the search system
+    lines += [
+        f'{prefix}_memory_bytes{{component="search",structure="{structure}"}} {stats["bytes"][structure]}'
+        for structure in ("documents", "pinned_results", "page_pools") if structure in stats["bytes"]
+    ]
+    components = [(component, stats[component]) for component in ("dense", "sparse")]
+    for component, component_stats in components:
+        lines += [
+            f'{prefix}_memory_bytes{{component="{component}",structure="{structure}"}} {size}'
+            for structure, size in component_stats["bytes"].items() if structure != "documents"
+        ]
+    lines += [
+        f"# HELP {prefix}_memory_total_bytes Approximate resident bytes of the search system",
+        f"# TYPE {prefix}_memory_total_bytes gauge",
+        f"{prefix}_memory_total_bytes {stats['total_bytes']}",
+    ]
+
+    for name, description in (
+        ("terms", "Distinct terms of the inverted index"),
+        ("postings", "Postings of the inverted index"),
+        ("average_postings_length", "Average number of postings per term"),
+    ):
+        values = [(component, component_stats[name]) for component, component_stats in components if name in component_stats]
+        if values:
+            lines += [f"# HELP {prefix}_index_{name} {description}", f"# TYPE {prefix}_index_{name} gauge"]
+            lines += [f'{prefix}_index_{name}{{component="{component}"}} {value}' for component, value in values]
+
+    redis_values = [
+        f'{prefix}_redis_index_info{{component="{component}",field="{field}"}} {value}'
+        for component, component_stats in components
+        for field, value in component_stats.get("redis", {}).items()
+    ]
+    if redis_values:
+        lines += [f"# HELP {prefix}_redis_index_info FT.INFO figures of the Redis indexes (sizes in MB)", f"# TYPE {prefix}_redis_index_info gauge"]
+        lines += redis_values
+
+    router = stats.get("router")
+    if router:
+        lines += [
+            f"# HELP {prefix}_routed_queries_total Queries per route chosen by the query router",
+            f"# TYPE {prefix}_routed_queries_total counter",
+        ]
+        lines += [f'{prefix}_routed_queries_total{{route="{route}"}} {count}' for route, count in router["routes"].items()]
+        lines += [
+            f"# HELP {prefix}_embeddings_skipped_total Query embeddings skipped by the query router",
+            f"# TYPE {prefix}_embeddings_skipped_total counter",
+            f"{prefix}_embeddings_skipped_total {router['embeddings_skipped']}",
+            f"# HELP {prefix}_dense_fallbacks_total Sparse-only routed queries whose dense leg ran, their sparse results being too few",
+            f"# TYPE {prefix}_dense_fallbacks_total counter",
+            f"{prefix}_dense_fallbacks_total {router['dense_fallbacks']}",
+            f"# HELP {prefix}_routing_saved_seconds_total Estimated search time saved by the query router",
+            f"# TYPE {prefix}_routing_saved_seconds_total counter",
+            f"{prefix}_routing_saved_seconds_total {router['estimated_seconds_saved']}",
+        ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,187 @@
+import cProfile, os, random, sys, threading, time
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Deque, Iterator, List, Optional, Tuple
+
+class QueryProfile:
+    """Profile of one sampled search: nested stage spans, and optionally stack samples and a cProfile of the searching thread"""
+
+    def __init__(self, label: str, queries: List[str], cprofile: Optional[cProfile.Profile] = None):
+        self.label = label
+        self.queries = queries
+        self.cprofile = cprofile
+        self.started_at = time.time()
+        self.duration_ns = 0
+        # (span path, duration, self time), the path joins the names of the enclosing spans with ';'
+        self.spans: List[Tuple[str, int, int]] = []
+        self.stack_samples: Counter = Counter()
+        self._path: List[str] = []
+        self._children_ns: List[int] = []
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        self._path.append(name)
+        self._children_ns.append(0)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            children = self._children_ns.pop()
+            self.spans.append((";".join(self._path), duration, duration - children))
+            self._path.pop()
+            if self._children_ns:
+                self._children_ns[-1] += duration
+
+    def folded_spans(self) -> List[str]:
+        """Spans in the folded stack format of flame graph tools (flamegraph.pl, inferno, speedscope), weighted by self time in µs"""
+        self_times = Counter()
+        for path, _, self_ns in self.spans:
+            self_times[path] += self_ns
+        return [f"{path} {self_ns // 1000}" for path, self_ns in self_times.items()]
+
+    def folded_stacks(self) -> List[str]:
+        """Stack samples in the folded stack format, weighted by number of samples"""
+        return [f"{stack} {count}" for stack, count in self.stack_samples.items()]
+
+class _StackSampler(threading.Thread):
+    """Samples the Python stack of a thread every `interval` seconds into a Counter of folded stacks"""
+
+    def __init__(self, thread_id: int, interval: float, samples: Counter):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = samples
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.samples[";".join(reversed(frames))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+class QueryProfiler:
+    """Profiling hook of search systems: a `sample_rate` fraction of searches is profiled, with per-stage spans and optionally
+    a cProfile (`cprofile`) and stack samples every `stack_interval` seconds of the searching thread.
+    Unsampled searches only cost a random draw. Profiles of searches slower than `slow_query_ms` are kept (the last `max_profiles`)
+    and, with `output_dir`, written as folded stacks (`.spans.folded`, `.stacks.folded`) readable by flame graph tools
+    and as `.prof` pstats files (snakeviz, flameprof).
+    Arguments:
+        sample_rate: Fraction of the searches to profile, 0 to 1
+        cprofile: Also run cProfile during sampled searches, one at a time as Python allows a single active profiler
+        stack_interval: Seconds between two stack samples, None to disable stack sampling
+        slow_query_ms: Only keep the profiles of searches lasting at least this long
+        output_dir: Directory receiving the kept profiles, None to only keep them in memory
+        max_profiles: Number of profiles kept in memory
+        seed: Seed of the sampling draws, for reproducible sampling
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.01,
+        cprofile: bool = False,
+        stack_interval: Optional[float] = None,
+        slow_query_ms: float = 0.0,
+        output_dir: Optional[str] = None,
+        max_profiles: int = 100,
+        seed: Optional[int] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.cprofile = cprofile
+        self.stack_interval = stack_interval
+        self.slow_query_ms = slow_query_ms
+        self.output_dir = output_dir
+        self.profiles: Deque[QueryProfile] = deque(maxlen=max_profiles)
+        self._random = random.Random(seed)
+        self._local = threading.local()
+        self._cprofile_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._written = 0
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def active(self) -> Optional[QueryProfile]:
+        """Profile of the search running in this thread, None when it is not sampled"""
+        return getattr(self._local, "profile", None)
+
+    def span(self, name: str) -> ContextManager:
+        """Time a stage of the current search, when it is sampled"""
+        profile = self.active()
+        return nullcontext() if profile is None else profile.span(name)
+
+    @contextmanager
+    def profile(self, label: str, queries: List[str]) -> Iterator[Optional[QueryProfile]]:
+        """Profile a search if it is sampled, yields its profile or None"""
+        if self.sample_rate <= 0 or self._random.random() >= self.sample_rate:
+            yield None
+            return
+
+        profiler = None
+        if self.cprofile and self._cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        profile = QueryProfile(label, queries, profiler)
+        sampler = None
+        if self.stack_interval:
+            sampler = _StackSampler(threading.get_ident(), self.stack_interval, profile.stack_samples)
+            sampler.start()
+        self._local.profile = profile
+        start = time.perf_counter_ns()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            with profile.span(label):
+                yield profile
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._cprofile_lock.release()
+            profile.duration_ns = time.perf_counter_ns() - start
+            self._local.profile = None
+            if sampler is not None:
+                sampler.stop()
+            if profile.duration_ns >= self.slow_query_ms * 1e6:
+                self._keep(profile)
+
+    def _keep(self, profile: QueryProfile):
+        with self._lock:
+            self.profiles.append(profile)
+            self._written += 1
+            number = self._written
+        if self.output_dir is None:
+            return
+        try:
+            name = os.path.join(self.output_dir, f"{int(profile.started_at * 1000)}-{number}-{profile.label}")
+            with open(f"{name}.spans.folded", "w", encoding="utf-8") as f:
+                f.write("\n".join(profile.folded_spans()) + "\n")
+            if profile.stack_samples:
+                with open(f"{name}.stacks.folded", "w", encoding="utf-8") as f:
+                    f.write("\n".join(profile.folded_stacks()) + "\n")
+            if profile.cprofile is not None:
+                profile.cprofile.dump_stats(f"{name}.prof")
+        except Exception as e:
+            print(f"Profile write error: {e}")
+
+    def folded(self, kind: str = "spans") -> List[str]:
+        """Kept profiles aggregated in the folded stack format, of their 'spans' or 'stacks' samples"""
+        with self._lock:
+            profiles = list(self.profiles)
+        totals = Counter()
+        for profile in profiles:
+            for line in (profile.folded_spans() if kind == "spans" else profile.folded_stacks()):
+                stack, _, value = line.rpartition(" ")
+                totals[stack] += int(value)
+        return [f"{stack} {value}" for stack, value in totals.items()]
+
+    def write_folded(self, path: str, kind: str = "spans"):
+        """Write the aggregated kept profiles to a folded stacks file, e.g. for `flamegraph.pl path > flame.svg`"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("".join(f"{line}\n" for line in self.folded(kind)))
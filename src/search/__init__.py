@@ -1,8 +1,36 @@
-from .hybrid_rag import HybridSearchSystem
-from .monitored_hybrid_rag import MonitoredHybridSearch
-from .staged_hybrid_rag import MultiStageHybridSearch
-from .cached_hybrid_rag import CachedHybridSearch
-from .optimize import optimize_fusion_weights
-from .evaluate import evaluate_search_system
-
-__all__ = ["HybridSearchSystem", "MonitoredHybridSearch", "MultiStageHybridSearch", "CachedHybridSearch", "optimize_fusion_weights", "evaluate_search_system"]
\ No newline at end of file
+from importlib import import_module
+
+# Search variants are imported on first access (PEP 562), e.g. the Redis client is only loaded with CachedHybridSearch
+_LAZY_IMPORTS = {
+    "HybridSearchSystem": ".hybrid_rag",
+    "MonitoredHybridSearch": ".monitored_hybrid_rag",
+    "MultiStageHybridSearch": ".staged_hybrid_rag",
+    "CachedHybridSearch": ".cached_hybrid_rag",
+    "RedisHybridSearch": ".redis_hybrid_rag",
+    "QueryRouter": ".router",
+    "Route": ".router",
+    "IndexSnapshot": ".snapshot",
+    "ResultPage": ".pagination",
+    "TenantManager": ".tenants",
+    "TenantQuota": ".tenants",
+    "TenantQuotaExceeded": ".tenants",
+    "redis_tenant_factory": ".tenants",
+    "local_tenant_factory": ".tenants",
+    "optimize_fusion_weights": ".optimize",
+    "optimize_fusion_params": ".optimize",
+    "FusionCandidates": ".optimize",
+    "evaluate_search_system": ".evaluate",
+    "EvaluationEngine": ".evaluate",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
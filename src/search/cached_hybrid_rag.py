@@ -1,20 +1,27 @@
 import redis, pickle, hashlib
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from .hybrid_rag import HybridSearchSystem
+from .pagination import CandidatePool
 
 class CachedHybridSearch(HybridSearchSystem):
     """Hybrid search with Redis caching of search results"""
     
-    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379, cache_hour_duration:float = 1.0, *args, **kwargs):
+    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379, cache_hour_duration:float = 1.0, *args, redis_client=None, cache_prefix: str = "hybrid_search:", **kwargs):
+        """`redis_client` replaces the client built from `redis_host` and `redis_port`, the 'memory' host uses the in-process fake store.
+        Cached results and pages are stored under `cache_prefix` keys."""
         super().__init__(*args, **kwargs)
-        self.redis_client = redis.Redis(host=redis_host, port=redis_port, decode_responses=False)
+        if redis_client is None and redis_host == "memory":
+            from store import get_memory_client
+            redis_client = get_memory_client()
+        self.redis_client = redis_client or redis.Redis(host=redis_host, port=redis_port, decode_responses=False)
         self.cache_ttl = int(cache_hour_duration * 60 * 60)  # 60*60 = 3600 = 1 hour cache TTL
+        self.cache_prefix = cache_prefix
     
     def _generate_cache_key(self, query: str, top_k: int) -> str:
-        """Generate cache key for query"""
-        query_hash = hashlib.md5(f"{query}:{top_k}".encode()).hexdigest()
-        return f"hybrid_search:{query_hash}"
+        """Generate cache key for query, results of an older index snapshot are not served once a new one is swapped in"""
+        query_hash = hashlib.md5(f"{query}:{top_k}:{self.snapshot.version}".encode()).hexdigest()
+        return f"{self.cache_prefix}{query_hash}"
         
     def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
         """Search with caching"""
@@ -22,7 +29,9 @@ class CachedHybridSearch(HybridSearchSystem):
         
         # Try to get from cache
         try:
-            cached_result = self.redis_client.get(cache_key)
+            with self._stage("cache"):
+                cached_result = self.redis_client.get(cache_key)
+            self._record_cache_lookups(1, 1 if cached_result else 0)
             if cached_result:
                 return pickle.loads(cached_result)
         except Exception as e:
@@ -43,9 +52,67 @@ class CachedHybridSearch(HybridSearchSystem):
         
         return results
     
-    def invalidate_cache(self, pattern: str = "hybrid_search:*"):
-        """Clear search cache"""
-        for key in self.redis_client.scan_iter(match=pattern):
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        """Batch search with caching, only the cache misses are searched (in one batch)"""
+        cache_keys = [self._generate_cache_key(query, top_k) for query in queries]
+
+        try:
+            with self._stage("cache"):
+                cached_results = self.redis_client.mget(cache_keys)
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            cached_results = [None] * len(queries)
+
+        results = [pickle.loads(cached) if cached else None for cached in cached_results]
+        misses = [i for i, result in enumerate(results) if result is None]
+        self._record_cache_lookups(len(queries), len(queries) - len(misses))
+        if not misses:
+            return results
+
+        searched = super().search_batch([queries[i] for i in misses], top_k)
+        for i, result in zip(misses, searched):
+            results[i] = result
+
+        # Cache results
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for i in misses:
+                pipeline.setex(cache_keys[i], self.cache_ttl, pickle.dumps(results[i]))
+            pipeline.execute()
+        except Exception as e:
+            print(f"Cache write error: {e}")
+
+        return results
+    
+    def _load_pool(self, query: str, version: int) -> Optional[CandidatePool]:
+        """Candidate pools of paginated queries are cached in Redis, so that any process can serve the next pages"""
+        try:
+            with self._stage("cache"):
+                cached_pool = self.redis_client.get(self._generate_pool_key(query, version))
+            return pickle.loads(cached_pool) if cached_pool else None
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return None
+
+    def _store_pool(self, query: str, version: int, pool: CandidatePool):
+        try:
+            self.redis_client.setex(self._generate_pool_key(query, version), self.cache_ttl, pickle.dumps(pool))
+        except Exception as e:
+            print(f"Cache write error: {e}")
+
+    def _generate_pool_key(self, query: str, version: int) -> str:
+        query_hash = hashlib.md5(f"{query}:{version}".encode()).hexdigest()
+        return f"{self.cache_prefix}pool:{query_hash}"
+
+    def _record_cache_lookups(self, lookups: int, hits: int):
+        if self.monitor is None:
+            return
+        for position in range(lookups):
+            self.monitor.record_cache_lookup(position < hits)
+    
+    def invalidate_cache(self, pattern: Optional[str] = None):
+        """Clear search cache, every key under `cache_prefix` by default"""
+        for key in self.redis_client.scan_iter(match=pattern or f"{self.cache_prefix}*"):
             self.redis_client.delete(key)
 
 
@@ -55,17 +122,19 @@ if __name__ == "__main__":
     from helpers.config import EmbedderConfig, HybridSearchConfig
     from os import getenv
     
+    redis_host = getenv("REDIS_HOST")
     try:
-        redis.Redis(retry=False).ping()
+        if redis_host != "memory":
+            redis.Redis(host=redis_host, retry=False).ping()
     except redis.exceptions.ConnectionError as e:
         raise Exception(f"Could not connect to Redis server: you need to create a Redis server and ensure it's running. Error details: {e}")
     except Exception as e:
         print(f"Redis connection error: {e}")
 
     embed_conf = EmbedderConfig(
-        model_name=getenv("EMBEDDING_MODEL"), embedding_module='local-dmr')
+        model_name=getenv("EMBEDDING_MODEL"), embedding_module=getenv("EMBEDDING_MODULE"))
     search_conf = HybridSearchConfig(dense_weight=0.6, sparse_weight=0.4)
-    cached_search = CachedHybridSearch(config=search_conf, embedder_config=embed_conf)
+    cached_search = CachedHybridSearch(redis_host, config=search_conf, embedder_config=embed_conf)
     cached_search.index_documents(documents)
     
     query = "What is the capital of France?"
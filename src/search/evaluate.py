@@ -1,53 +1,105 @@
 import numpy as np
-from typing import List, Set, Dict
+import threading, weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Set, Dict, Hashable, Optional, Tuple
 
 from .hybrid_rag import HybridSearchSystem
 from score import RetrievalMetrics
 
+class EvaluationEngine:
+    """Run evaluation queries in parallel batches and cache their results per search system.
+
+    Each query is retrieved once at the largest k needed; later evaluations of the same system (with the
+    same configuration) reuse the cached rankings instead of querying again.
+    Arguments:
+        batch_size: Number of queries sent together to `search_batch`
+        num_workers: Number of batches searched concurrently
+        cache: Keep retrieved rankings for later evaluations
+    """
+    def __init__(self, batch_size: int = 64, num_workers: int = 4, cache: bool = True):
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.cache = cache
+        self._results: "weakref.WeakKeyDictionary[HybridSearchSystem, Dict[Hashable, Dict[str, Tuple[list, int]]]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(search_system: HybridSearchSystem) -> Hashable:
+        # Settings changing the rankings of a system without changing its identity
+        return (
+            getattr(search_system, "fusion_method", None),
+            getattr(search_system, "dense_weight", None),
+            getattr(search_system, "sparse_weight", None),
+            getattr(search_system, "rrf_k", None),
+            getattr(search_system, "normalization", None),
+            getattr(search_system, "candidate_multiplier", None),
+            len(getattr(search_system, "documents", [])),
+            getattr(getattr(search_system, "snapshot", None), "version", None),
+        )
+
+    def retrieve(self, search_system: HybridSearchSystem, queries: List[str], top_k: int) -> List[List]:
+        """Ranked document ids of the top `top_k` results of every query"""
+        with self._lock:
+            system_cache = self._results.setdefault(search_system, {}) if self.cache else {}
+            cached = system_cache.setdefault(self._fingerprint(search_system), {})
+
+        # Queries never retrieved, or retrieved at a smaller depth
+        missing = [query for query in dict.fromkeys(queries) if query not in cached or cached[query][1] < top_k]
+        batches = [missing[start:start + self.batch_size] for start in range(0, len(missing), self.batch_size)]
+
+        def search_batch(batch: List[str]):
+            results = search_system.search_batch(batch, top_k=top_k)
+            return batch, [([doc_idx for doc_idx, _ in result], top_k) for result in results]
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for batch, rankings in executor.map(search_batch, batches):
+                cached.update(zip(batch, rankings))
+
+        return [cached[query][0][:top_k] for query in queries]
+
+    def evaluate(
+        self,
+        search_system: HybridSearchSystem,
+        test_queries: List[str],
+        ground_truth: List[Set[int]],
+        k_values: List[int] = [5, 10, 20]
+    ) -> Dict[str, float]:
+        """Mean precision@k, recall@k, nDCG@k for every k, and MRR over the test queries"""
+        max_k = max(k_values)
+        all_retrieved = self.retrieve(search_system, test_queries, max_k)
+        
+        relevance, num_retrieved, num_relevant = RetrievalMetrics.relevance_matrix(all_retrieved, ground_truth, max_k)
+        per_query = RetrievalMetrics.batch_metrics(relevance, num_retrieved, num_relevant, k_values)
+        
+        evaluation_results = {}
+        for k in k_values:
+            for metric in ('precision', 'recall', 'ndcg'):
+                evaluation_results[f'{metric}@{k}'] = float(np.mean(per_query[f'{metric}@{k}']))
+        evaluation_results['mrr'] = float(np.mean(per_query['mrr']))
+        
+        return evaluation_results
+
+    def clear_cache(self, search_system: Optional[HybridSearchSystem] = None):
+        with self._lock:
+            if search_system is None:
+                self._results.clear()
+            else:
+                self._results.pop(search_system, None)
+
+# Not caching: a process-wide cache could serve stale rankings of systems changed in ways the fingerprint does not see
+_default_engine = EvaluationEngine(cache=False)
+
 def evaluate_search_system(
     search_system: HybridSearchSystem,
     test_queries: List[str],
     ground_truth: List[Set[int]],
-    k_values: List[int] = [5, 10, 20]
+    k_values: List[int] = [5, 10, 20],
+    engine: Optional[EvaluationEngine] = None
 ) -> Dict[str, float]:
-    """Comprehensive evaluation of search system"""
-    
-    all_retrieved = []
-    metrics = RetrievalMetrics()
-    
-    # Collect results for all queries
-    for query in test_queries:
-        results = search_system.search(query, top_k=max(k_values))
-        retrieved_indices = [doc_idx for doc_idx, _ in results]
-        all_retrieved.append(retrieved_indices)
-    
-    # Calculate metrics
-    evaluation_results = {}
-    
-    for k in k_values:
-        precisions = [
-            metrics.precision_at_k(retrieved, relevant, k)
-            for retrieved, relevant in zip(all_retrieved, ground_truth)
-        ]
-        recalls = [
-            metrics.recall_at_k(retrieved, relevant, k)
-            for retrieved, relevant in zip(all_retrieved, ground_truth)
-        ]
-        ndcgs = [
-            metrics.normalized_dcg_at_k(retrieved, relevant, k)
-            for retrieved, relevant in zip(all_retrieved, ground_truth)
-        ]
-        
-        evaluation_results.update({
-            f'precision@{k}': np.mean(precisions),
-            f'recall@{k}': np.mean(recalls),
-            f'ndcg@{k}': np.mean(ndcgs)
-        })
-    
-    # Calculate MRR
-    evaluation_results['mrr'] = metrics.mean_reciprocal_rank(all_retrieved, ground_truth)
-    
-    return evaluation_results
+    """Comprehensive evaluation of search system
+    Queries are searched in parallel batches by `engine` (a shared, non-caching engine by default,
+    pass an `EvaluationEngine()` to reuse rankings across evaluations)."""
+    return (engine or _default_engine).evaluate(search_system, test_queries, ground_truth, k_values)
 
 if __name__ == "__main__":
     from ._samples import documents, queries as test_queries, ground_truth
@@ -58,7 +110,7 @@ if __name__ == "__main__":
     from tabulate import tabulate
 
     embed_conf = EmbedderConfig(
-        model_name=getenv("EMBEDDING_MODEL"), embedding_module='local-dmr')
+        model_name=getenv("EMBEDDING_MODEL"), embedding_module=getenv("EMBEDDING_MODULE"))
     base_conf = HybridSearchConfig(dense_weight=0.5, sparse_weight=0.5, fusion_method="weighted_sum")
     base_system = HybridSearchSystem(config=base_conf, embedder_config=embed_conf)
     base_system.index_documents(documents)
@@ -1,30 +1,101 @@
-from typing import List, Tuple, Optional
+import functools, math, threading, time
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Optional, ContextManager
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import replace
 from os import getenv
+import numpy as np
 import default_env
 
-from retriever import DenseRetriever, BM25Retriever, BaseDenseRetriever, BaseBM25Retriever, BaseRetriever
+from retriever import BaseDenseRetriever, BaseSparseRetriever, BaseRetriever
 from documents import Document
-from score import ScoreFusion
+from score import ScoreFusion, PerformanceMonitor, aggregate_by_parent
+from score.aggregation import Aggregation, ParentResult
+from score.profiling import QueryProfiler
 from helpers.config import HybridSearchConfig, EmbedderConfig, BM25Config
+from helpers.memory import documents_nbytes, value_nbytes
+from helpers.cache import LRUCache
+from .router import QueryRouter
+from .snapshot import IndexSnapshot
+from .pagination import CandidatePool, ResultPage, encode_cursor, decode_cursor
+
+ENTRY_POINTS = ("search", "search_batch", "search_page", "search_parents", "search_parents_batch")
+
+def entry_point(method: Callable) -> Callable:
+    """Pin the current index snapshot for the whole call of a search entry point, so that nested calls (super(), per query searches)
+    all use the same index even if a new one is swapped in meanwhile, and profile the call with the system's profiler"""
+    @functools.wraps(method)
+    def wrapper(self, queries, *args, **kwargs):
+        if getattr(self._local, "snapshot", None) is not None:
+            return method(self, queries, *args, **kwargs)
+        with self._pinned(self._snapshot):
+            if self.profiler is None:
+                return method(self, queries, *args, **kwargs)
+            with self.profiler.profile(method.__name__, [queries] if isinstance(queries, str) else list(queries)):
+                return method(self, queries, *args, **kwargs)
+    wrapper._entry_point = True
+    return wrapper
+
+def _snapshot_property(name: str) -> property:
+    def get(self):
+        return getattr(self.snapshot, name)
+    def set(self, value):
+        self.swap(**{name: value})
+    return property(get, set, doc=f"`{name}` of the index snapshot, assigning it swaps in a new snapshot")
+
+@contextmanager
+def _both(first: ContextManager, second: ContextManager):
+    with first, second:
+        yield
 
 class HybridSearchSystem(BaseRetriever):
+    """Hybrid search over a dense and a sparse retriever, whose results are fused.
+    The index state (retrievers, documents, pinned results, fusion settings) is an immutable `IndexSnapshot`: searches read
+    the current one without locking, and indexing or setting a fusion parameter swaps in a new one, so that one instance can
+    be shared by threads and re-indexed under live traffic (see `index_documents_async`)."""
+
+    dense_retriever = _snapshot_property("dense_retriever")
+    sparse_retriever = _snapshot_property("sparse_retriever")
+    documents = _snapshot_property("documents")
+    pinned_results = _snapshot_property("pinned_results")
+    fusion_method = _snapshot_property("fusion_method")
+    dense_weight = _snapshot_property("dense_weight")
+    sparse_weight = _snapshot_property("sparse_weight")
+    rrf_k = _snapshot_property("rrf_k")
+    normalization = _snapshot_property("normalization")
+    candidate_multiplier = _snapshot_property("candidate_multiplier")
+
+    def __init_subclass__(cls, **kwargs):
+        # Entry points overridden by subclasses pin the snapshot and are profiled too
+        super().__init_subclass__(**kwargs)
+        for name in ENTRY_POINTS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "_entry_point", False):
+                setattr(cls, name, entry_point(method))
+
     def __init__(
         self, 
         dense_retriever: Optional[BaseDenseRetriever] = None,
-        sparse_retriever: Optional[BaseBM25Retriever] = None,
+        sparse_retriever: Optional[BaseSparseRetriever] = None,
         config: HybridSearchConfig = None,
         embedder_config: EmbedderConfig = None,
-        bm25_config: BM25Config = None
+        bm25_config: BM25Config = None,
+        monitor: Optional[PerformanceMonitor] = None,
+        router: Optional[QueryRouter] = None,
+        profiler: Optional[QueryProfiler] = None
     ):
         """
         Initialize hybrid search system
         
         Args:
             dense_retriever: Pre-configured dense retriever instance
-            sparse_retriever: Pre-configured sparse retriever instance
+            sparse_retriever: Pre-configured sparse retriever instance (BM25 or learned sparse, e.g. `SpladeRetriever`)
             config: Configuration for hybrid search (fusion method, weights, etc.)
             embedder_config: Configuration for dense retriever's embedding model
             bm25_config: Configuration for BM25 retriever parameters
+            monitor: Performance monitor receiving per-stage timings (embed, dense, sparse, fusion...)
+            router: Query router skipping the dense or sparse leg when the other one is enough, see `QueryRouter`
+            profiler: Query profiler capturing the stage spans of a sample of the searches, see `QueryProfiler`
         > The configurations objects will be ignored if the corresponding retriever instances are provided.
         """
         if config is None:
@@ -33,27 +104,142 @@ class HybridSearchSystem(BaseRetriever):
             embedder_config = EmbedderConfig()
         if bm25_config is None:
             bm25_config = BM25Config()
-        self.dense_retriever = dense_retriever or DenseRetriever(**embedder_config)
-        self.sparse_retriever = sparse_retriever or BM25Retriever(**bm25_config)
-        self.fusion_method = config.fusion_method
-        self.dense_weight = config.dense_weight
-        self.sparse_weight = config.sparse_weight
+        if dense_retriever is None:
+            from retriever import DenseRetriever
+            dense_retriever = DenseRetriever(**embedder_config)
+        if sparse_retriever is None:
+            from retriever import BM25Retriever
+            sparse_retriever = BM25Retriever(**bm25_config)
+        self._snapshot = IndexSnapshot(
+            dense_retriever,
+            sparse_retriever,
+            fusion_method=config.fusion_method,
+            dense_weight=config.dense_weight,
+            sparse_weight=config.sparse_weight,
+            rrf_k=config.rrf_k,
+            normalization=config.normalization,
+            candidate_multiplier=config.candidate_multiplier,
+        )
+        # Snapshot pinned by the search running in each thread
+        self._local = threading.local()
+        # Writers build new snapshots one at a time, readers never take it
+        self._write_lock = threading.RLock()
+        self._indexer: Optional[ThreadPoolExecutor] = None
         self.score_fusion = ScoreFusion()
-        self.documents: List[Document] = []
-        
+        self.monitor = monitor
+        self.router = router
+        self.profiler = profiler
+        self.hot_queries: List[str] = []
+        self.hot_top_k = 10
+        # Fused candidates of paginated queries, by (query, snapshot version)
+        self.page_pools = LRUCache(1024)
+
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        """Index snapshot of the search running in this thread, the current one outside of searches"""
+        return getattr(self._local, "snapshot", None) or self._snapshot
+
+    def swap(self, **changes) -> IndexSnapshot:
+        """Atomically replace fields of the current snapshot, e.g. `swap(dense_weight=0.6, sparse_weight=0.4)`.
+        Searches in flight finish on the previous snapshot. Unless given, pinned results are computed again on the new snapshot
+        before it is published, as they were fused with the previous settings."""
+        with self._write_lock:
+            snapshot = replace(self._snapshot, version=self._snapshot.version + 1, **changes)
+            if "pinned_results" not in changes and self.hot_queries:
+                snapshot = replace(snapshot, pinned_results={})
+                snapshot = replace(snapshot, pinned_results=self._pin(snapshot, self.hot_queries, self.hot_top_k))
+            self._snapshot = snapshot
+            return self._snapshot
+
+    def set_fusion_config(self, config: HybridSearchConfig) -> IndexSnapshot:
+        """Switch all fusion settings at once, e.g. to `optimize_fusion_params(...).to_config()`"""
+        return self.swap(**config)
+
     def index_documents(self, documents: List[Document]):
-        """Index documents for both dense and sparse retrieval"""
+        """Index documents for both dense and sparse retrieval.
+        The index is built on clones of the retrievers while searches keep using the current one, then swapped in."""
         print(f"Indexing {len(documents)} documents...")
-        self.documents = documents
-        
-        # Index for dense retrieval
-        self.dense_retriever.encode_documents(documents)
-        
-        # Index for sparse retrieval
-        self.sparse_retriever.fit_documents(documents)
-        
+        self._reindex(documents)
         print("Indexing complete!")
+
+    def index_embeddings(self, documents: List[Document], embeddings: np.ndarray):
+        """Index documents whose embeddings were already computed, e.g. by a streaming ingestion"""
+        self._reindex(documents, embeddings)
+
+    def add_documents(self, documents: List[Document]):
+        """Index documents after the indexed ones, their ids following the current ones.
+        Embeddings of the indexed documents are reused when the dense retriever keeps them in memory,
+        otherwise every document is embedded again. The sparse index is rebuilt, as document frequencies change."""
+        with self._write_lock:
+            current = self._snapshot
+            all_documents = current.documents + list(documents)
+            indexed = current.dense_retriever.document_embeddings
+            if not hasattr(current.dense_retriever, "index_embeddings") or indexed is None or len(indexed) != len(current.documents):
+                return self._reindex(all_documents)
+            embeddings = current.dense_retriever.embed_documents([doc.text for doc in documents])
+            if len(indexed):
+                embeddings = np.concatenate([np.asarray(indexed), embeddings])
+            return self._reindex(all_documents, embeddings)
+
+    def index_documents_async(self, documents: List[Document]) -> Future:
+        """Index documents in a background thread, searches are served by the current index until the new one is swapped in.
+        Indexing requests run one after the other, in submission order."""
+        with self._write_lock:
+            if self._indexer is None:
+                self._indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indexer")
+        return self._indexer.submit(self.index_documents, documents)
+
+    def _reindex(self, documents: List[Document], embeddings: Optional[np.ndarray] = None) -> IndexSnapshot:
+        with self._write_lock:
+            current = self._snapshot
+            dense, sparse = current.dense_retriever.clone(), current.sparse_retriever.clone()
+            self._index_retrievers(dense, sparse, documents, embeddings)
+            snapshot = replace(current, dense_retriever=dense, sparse_retriever=sparse, documents=documents, pinned_results={})
+            # Pinned results of the previous index are stale, compute them again before the new index serves
+            if self.hot_queries:
+                snapshot = replace(snapshot, pinned_results=self._pin(snapshot, self.hot_queries, self.hot_top_k))
+            return self.swap(**{name: getattr(snapshot, name) for name in ("dense_retriever", "sparse_retriever", "documents", "pinned_results")})
+
+    def _index_retrievers(self, dense: BaseDenseRetriever, sparse: BaseSparseRetriever, documents: List[Document], embeddings: Optional[np.ndarray] = None):
+        """Index documents into the retrievers of a new snapshot"""
+        if embeddings is None:
+            dense.encode_documents(documents)
+        else:
+            dense.index_embeddings(documents, embeddings)
+        sparse.fit_documents(documents)
+
+    def _pin(self, snapshot: IndexSnapshot, hot_queries: List[str], top_k: int) -> Dict[Tuple[str, int], List[Tuple[int, float]]]:
+        """Fused results of the hot queries on a snapshot, their embeddings being pinned in the query cache"""
+        snapshot.dense_retriever.pin_queries(hot_queries)
+        with self._pinned(snapshot):
+            results = self._hybrid_search(hot_queries, top_k)
+        return {(query, top_k): result for query, result in zip(hot_queries, results)}
+
+    @contextmanager
+    def _pinned(self, snapshot: IndexSnapshot) -> Iterator[IndexSnapshot]:
+        previous = getattr(self._local, "snapshot", None)
+        self._local.snapshot = snapshot
+        try:
+            yield snapshot
+        finally:
+            self._local.snapshot = previous
+
+    def warm_up(self, hot_queries: List[str], top_k: int = 10):
+        """
+        Precompute and pin the embeddings and fused results of the most frequent queries, e.g. at startup.
+        Pinned results are served for searches with the same `top_k`, and refreshed whenever documents are indexed or the snapshot changes.
+        
+        Args:
+            hot_queries: Most frequent queries, e.g. the top 1000 of the query logs
+            top_k: Number of results pinned per query
+        """
+        hot_queries = list(dict.fromkeys(hot_queries))
+        with self._write_lock:
+            self.hot_queries, self.hot_top_k = hot_queries, top_k
+            current = replace(self._snapshot, pinned_results={})
+            self.swap(pinned_results=self._pin(current, hot_queries, top_k) if hot_queries else {})
     
+    @entry_point
     def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
         """
         Perform hybrid search combining dense and sparse retrieval
@@ -65,27 +251,264 @@ class HybridSearchSystem(BaseRetriever):
         Returns:
             List of (document_index, combined_score) tuples
         """
+        return self._hybrid_search([query], top_k)[0]
+
+    @entry_point
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        """
+        Perform hybrid search for several queries, batching the embedding and scoring work
+        
+        Args:
+            queries: Search query strings
+            top_k: Number of results to return per query
+            
+        Returns:
+            One list of (document_index, combined_score) tuples per query
+        """
+        return self._hybrid_search(queries, top_k)
+
+    @entry_point
+    def search_page(self, query: str, page_size: int = 10, cursor: Optional[str] = None, pool_pages: int = 5) -> ResultPage:
+        """
+        Page through the results of a query without searching again for every page: the first page fills a pool of
+        `pool_pages` pages of fused candidates, kept per query and index snapshot, that serves the following pages.
+        The pool is only extended by a deeper search (with new results appended after the served ones, so pages never
+        overlap) when a page goes past its end. A cursor from an older index snapshot continues at its offset on the current one.
+        Pages come from a deeper fusion than `search(query, page_size)`, so the first page may differ slightly from it.
+        
+        Args:
+            query: Search query string
+            page_size: Number of results per page
+            cursor: `next_cursor` of the previous page, None for the first page
+            pool_pages: Number of pages fetched by each search filling the pool
+            
+        Returns:
+            The page of (document_index, combined_score) tuples and the cursor of the next one
+        """
+        offset = decode_cursor(cursor)[0] if cursor else 0
+        version = self.snapshot.version
+        pool = self._load_pool(query, version) or CandidatePool([])
+        if len(pool.results) < offset + page_size and not pool.exhausted:
+            depth = max(offset + page_size, 2 * pool.depth, page_size * pool_pages)
+            deeper = self.search(query, depth)
+            served = {doc_id for doc_id, _ in pool.results}
+            pool = CandidatePool(
+                pool.results + [result for result in deeper if result[0] not in served],
+                depth,
+                len(deeper) < depth,
+            )
+            self._store_pool(query, version, pool)
+        end = offset + page_size
+        has_more = end < len(pool.results) or not pool.exhausted
+        return ResultPage(pool.results[offset:end], encode_cursor(end, version) if has_more else None, offset)
+
+    def _load_pool(self, query: str, version: int) -> Optional[CandidatePool]:
+        return self.page_pools.get((query, version))
+
+    def _store_pool(self, query: str, version: int, pool: CandidatePool):
+        self.page_pools.put((query, version), pool)
+
+    def _hybrid_search(self, queries: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+        if self.pinned_results:
+            results = [self.pinned_results.get((query, top_k)) for query in queries]
+            misses = [position for position, result in enumerate(results) if result is None]
+            if misses:
+                searched = self._search_unpinned([queries[position] for position in misses], top_k)
+                for position, result in zip(misses, searched):
+                    results[position] = result
+            # Copies, so that callers cannot alter the pinned lists
+            return [list(result) for result in results]
+        return self._search_unpinned(queries, top_k)
+
+    def _search_unpinned(self, queries: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+        if self.router is not None:
+            return self._search_routed(queries, top_k)
         # Get results from both retrievers
-        dense_results = self.dense_retriever.search(query, top_k * 2)
-        sparse_results = self.sparse_retriever.search(query, top_k * 2)
+        with self._stage("embed"):
+            query_embeddings = self.dense_retriever.embed_queries(queries)
+        with self._stage("dense"):
+            dense_batch = self.dense_retriever.search_by_vectors(query_embeddings, self._candidates(top_k))
+        with self._stage("sparse"):
+            sparse_batch = self.sparse_retriever.search_batch(queries, self._candidates(top_k))
+
+        with self._stage("fusion"):
+            return [
+                self._fuse(dense_results, sparse_results)[:top_k]
+                for dense_results, sparse_results in zip(dense_batch, sparse_batch)
+            ]
+
+    def _search_routed(self, queries: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+        """Run for every query only the legs chosen by the router, each leg batched over the queries that need it"""
+        routes = self.router.route_batch(queries, top_k, self._candidates(top_k), self.sparse_retriever, self.dense_retriever)
+        dense_batch: List[List[Tuple[str, float]]] = [[] for _ in queries]
+        sparse_batch: List[List[Tuple[str, float]]] = [[] for _ in queries]
+
+        sparse_positions = [position for position, route in enumerate(routes) if route.sparse_k]
+        if sparse_positions:
+            start = time.perf_counter()
+            with self._stage("sparse"):
+                depth = max(routes[position].sparse_k for position in sparse_positions)
+                results = self.sparse_retriever.search_batch([queries[position] for position in sparse_positions], depth)
+            self.router.record_leg("sparse", time.perf_counter() - start, len(sparse_positions))
+            for position, result in zip(sparse_positions, results):
+                sparse_batch[position] = result[:routes[position].sparse_k]
+
+        # Sparse-only queries matching fewer than top_k documents fall back to the dense leg, to fill their results
+        fallbacks = [position for position, route in enumerate(routes) if not route.dense_k and len(sparse_batch[position]) < top_k]
+        if fallbacks:
+            self.router.record_fallbacks(len(fallbacks))
+        dense_k = {position: route.dense_k for position, route in enumerate(routes) if route.dense_k}
+        dense_k.update((position, top_k) for position in fallbacks)
+        dense_positions = sorted(dense_k)
+        if dense_positions:
+            start = time.perf_counter()
+            with self._stage("embed"):
+                query_embeddings = self.dense_retriever.embed_queries([queries[position] for position in dense_positions])
+            with self._stage("dense"):
+                depth = max(dense_k.values())
+                results = self.dense_retriever.search_by_vectors(query_embeddings, depth)
+            self.router.record_leg("dense", time.perf_counter() - start, len(dense_positions))
+            for position, result in zip(dense_positions, results):
+                dense_batch[position] = result[:dense_k[position]]
+
+        with self._stage("fusion"):
+            # Single legs go through fusion too, so that scores keep the same scale whatever the route
+            return [
+                self._fuse(dense_results, sparse_results)[:top_k]
+                for dense_results, sparse_results in zip(dense_batch, sparse_batch)
+            ]
 
+    def _candidates(self, top_k: int) -> int:
+        """Number of results requested from each retriever before fusion"""
+        return max(top_k, math.ceil(top_k * self.candidate_multiplier))
+
+    @entry_point
+    def search_parents(
+        self,
+        query: str,
+        top_k: int = 10,
+        aggregation: Aggregation = "max",
+        top_n: int = 3,
+        max_chunks_per_parent: int = 1,
+        max_rounds: int = 4,
+    ) -> List[ParentResult]:
+        """
+        Search parent documents rather than chunks, see `search_parents_batch`
+        
+        Returns:
+            List of (document idx, parent score, [(chunk id, chunk score)]) tuples
+        """
+        return self.search_parents_batch([query], top_k, aggregation, top_n, max_chunks_per_parent, max_rounds)[0]
+
+    @entry_point
+    def search_parents_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        aggregation: Aggregation = "max",
+        top_n: int = 3,
+        max_chunks_per_parent: int = 1,
+        max_rounds: int = 4,
+    ) -> List[List[ParentResult]]:
+        """
+        Search parent documents: chunk results are grouped by `Document.idx` and every parent is scored from its chunks
+        ('max', 'sum' or 'top_n' best chunks), keeping at most `max_chunks_per_parent` chunks per parent.
+        Chunks are first fetched at depth `top_k`; queries whose chunks span less than `top_k` parents are searched again
+        with a doubled depth, at most `max_rounds` times, so that only queries dominated by long documents pay for over-fetching.
+        
+        Args:
+            queries: Search query strings
+            top_k: Number of parent documents to return per query
+            aggregation: How chunk scores make a parent score
+            top_n: Number of chunks summed by the 'top_n' aggregation
+            max_chunks_per_parent: Diversity cap, number of chunks returned per parent
+            max_rounds: Maximum number of searches per query
+        """
+        results: List[List[ParentResult]] = [[] for _ in queries]
+        pending = list(range(len(queries)))
+        depth = top_k
+        for _ in range(max_rounds):
+            chunk_results = self.search_batch([queries[position] for position in pending], depth)
+            retry = []
+            for position, chunks in zip(pending, chunk_results):
+                results[position] = aggregate_by_parent(chunks, self._parent_of, aggregation, top_n, max_chunks_per_parent)
+                # A full chunk list means deeper results exist, which may belong to other parents
+                if len(results[position]) < top_k and len(chunks) >= depth:
+                    retry.append(position)
+            pending, depth = retry, depth * 2
+            if not pending or depth > 2 * max(len(self.documents), 1):
+                break
+        return [parents[:top_k] for parents in results]
+
+    def _parent_of(self, chunk_id: str) -> int:
+        """Parent document of a result: in-memory ids are positions in `documents`, Redis keys end with `:<idx>:<chunk>`"""
+        chunk_id = str(chunk_id)
+        if chunk_id.isdigit():
+            return self.documents[int(chunk_id)].idx
+        return int(chunk_id.split(":")[-2])
+
+    def _stage(self, name: str) -> ContextManager:
+        """Time a stage of the search when a monitor is attached, and record its span when the search is profiled"""
+        profile = self.profiler.active() if self.profiler is not None else None
+        if profile is None:
+            return nullcontext() if self.monitor is None else self.monitor.stage(name)
+        if self.monitor is None:
+            return profile.span(name)
+        return _both(self.monitor.stage(name), profile.span(name))
+
+    def _fuse(self, dense_results: List[Tuple[str, float]], sparse_results: List[Tuple[str, float]]) -> List[Tuple[int, float]]:
         # Combine results using specified fusion method
-        if self.fusion_method == "rrf":
-            combined_results = self.score_fusion.reciprocal_rank_fusion(
-                [dense_results, sparse_results]
+        snapshot = self.snapshot
+        if snapshot.fusion_method == "rrf":
+            return self.score_fusion.reciprocal_rank_fusion(
+                [dense_results, sparse_results],
+                snapshot.rrf_k
             )
-        elif self.fusion_method == "weighted_sum":
-            combined_results = self.score_fusion.weighted_sum_fusion(
+        elif snapshot.fusion_method == "weighted_sum":
+            return self.score_fusion.weighted_sum_fusion(
                 dense_results, 
                 sparse_results,
-                self.dense_weight,
-                self.sparse_weight
+                snapshot.dense_weight,
+                snapshot.sparse_weight,
+                snapshot.normalization
             )
         else:
-            raise ValueError(f"Unknown fusion method: {self.fusion_method}")
-        
-        return combined_results[:top_k]
+            raise ValueError(f"Unknown fusion method: {snapshot.fusion_method}")
     
+    def stats(self) -> Dict[str, Any]:
+        """
+        Index statistics and approximate memory footprint, for capacity planning: the `stats()` of both retrievers
+        (structure bytes, term and posting counts, FT.INFO figures for Redis) and the bytes of the whole system,
+        counting documents shared by the system and its retrievers once. Export them with `score.stats_to_prometheus`.
+        """
+        snapshot = self.snapshot
+        dense, sparse = snapshot.dense_retriever.stats(), snapshot.sparse_retriever.stats()
+        seen = set()
+        documents = sum(
+            documents_nbytes(docs, seen)
+            for docs in (snapshot.documents, snapshot.dense_retriever.documents, getattr(snapshot.sparse_retriever, "documents", []))
+        )
+        memory = {
+            "documents": documents,
+            "dense": dense["total_bytes"] - dense["bytes"]["documents"],
+            "sparse": sparse["total_bytes"] - sparse["bytes"]["documents"],
+            "pinned_results": value_nbytes(snapshot.pinned_results),
+            "page_pools": self.page_pools.nbytes,
+        }
+        stats = {
+            "type": type(self).__name__,
+            "snapshot_version": snapshot.version,
+            "chunks": len(snapshot.documents),
+            "parents": len({doc.idx for doc in snapshot.documents}),
+            "dense": dense,
+            "sparse": sparse,
+            "bytes": memory,
+            "total_bytes": sum(memory.values()),
+        }
+        if self.router is not None:
+            stats["router"] = self.router.stats()
+        return stats
+
     def get_documents_by_indices(self, indices: List[int]) -> List[Document]:
         """Retrieve document objects by their indices"""
         return [self.documents[i] for i in indices]
@@ -96,7 +519,7 @@ if __name__ == "__main__":
     from ._samples import documents
     
     embed_conf = EmbedderConfig(
-        model_name=getenv("EMBEDDING_MODEL"), embedding_module='local-dmr')
+        model_name=getenv("EMBEDDING_MODEL"), embedding_module=getenv("EMBEDDING_MODULE"))
     search_conf = HybridSearchConfig(dense_weight=0.6, sparse_weight=0.4)
     # Initialize hybrid search
     hybrid_search = HybridSearchSystem(
@@ -1,29 +1,49 @@
 from typing import List, Tuple, Dict, Any
 import time
 from search import HybridSearchSystem
-from score import PerformanceMonitor
+from score import PerformanceMonitor, stats_to_prometheus
 import default_env
 
 # Integrate monitoring into hybrid search
 class MonitoredHybridSearch(HybridSearchSystem):
+    """Hybrid search recording query latencies and per-stage timings.
+    Combine it with other variants through inheritance, e.g. `class MonitoredCachedSearch(MonitoredHybridSearch, CachedHybridSearch)`
+    also records the cache lookups and hit rate."""
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.monitor = PerformanceMonitor()
+        if self.monitor is None:
+            self.monitor = PerformanceMonitor()
     
     def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
         """Search with performance monitoring"""
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         results = super().search(query, top_k)
         
-        query_time = time.time() - start_time
-        self.monitor.record_query(query_time)
+        self.monitor.record_query_ns(time.perf_counter_ns() - start_time)
         
         return results
+
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        """Batch search with performance monitoring, the batch time is spread over its queries"""
+        start_time = time.perf_counter_ns()
+
+        results = super().search_batch(queries, top_k)
+
+        query_time = (time.perf_counter_ns() - start_time) // max(len(queries), 1)
+        for _ in queries:
+            self.monitor.record_query_ns(query_time)
+
+        return results
     
     def get_performance_stats(self) -> Dict[str, Any]:
         """Get current performance statistics"""
         return self.monitor.get_performance_report()
+
+    def get_prometheus_metrics(self) -> str:
+        """Get current performance and index statistics in the Prometheus text format"""
+        return self.monitor.to_prometheus() + stats_to_prometheus(self.stats())
     
 if __name__ == "__main__":
     from ._samples import documents
@@ -34,7 +54,7 @@ if __name__ == "__main__":
     # Example usage
     monitored_search = MonitoredHybridSearch(embedder_config=EmbedderConfig(
         model_name=getenv("EMBEDDING_MODEL"), 
-        embedding_module='local-dmr'
+        embedding_module=getenv("EMBEDDING_MODULE")
         ))
     monitored_search.index_documents(documents)
 
@@ -1,9 +1,223 @@
-from typing import List, Tuple, Set
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Set, Union
+from dataclasses import dataclass, field
 from numpy import arange
 from os import getenv
+import numpy as np
+import warnings
 import default_env
 
 from search import HybridSearchSystem
+from score import RetrievalMetrics
+from helpers.config import HybridSearchConfig
+
+Objective = Union[str, Callable[[np.ndarray, np.ndarray, np.ndarray], float]]
+
+class FusionCandidates:
+    """Raw dense and sparse candidates of a set of queries, retrieved once and kept as padded matrices.
+
+    Row `q` holds the union of the dense and sparse candidates of query `q` (dense ones first, in rank order,
+    as the fusion methods see them). Any fusion setting can then be evaluated offline, for all queries at
+    once, without calling the retrievers or the embedding model again.
+    """
+    def __init__(
+        self,
+        dense_lists: List[List[Tuple[str, float]]],
+        sparse_lists: List[List[Tuple[str, float]]],
+        relevant_lists: List[Set[int]],
+    ):
+        unions = [
+            list(dict.fromkeys([doc_id for doc_id, _ in dense] + [doc_id for doc_id, _ in sparse]))
+            for dense, sparse in zip(dense_lists, sparse_lists)
+        ]
+        num_queries, width = len(unions), max((len(union) for union in unions), default=0)
+
+        self.doc_ids = unions
+        self.valid = np.zeros((num_queries, width), dtype=bool)
+        self.relevant = np.zeros((num_queries, width), dtype=bool)
+        self.num_relevant = np.array([len(relevant) for relevant in relevant_lists], dtype=np.int64)
+        self.dense_scores = np.full((num_queries, width), np.nan)
+        self.sparse_scores = np.full((num_queries, width), np.nan)
+        self.dense_ranks = np.full((num_queries, width), np.inf)
+        self.sparse_ranks = np.full((num_queries, width), np.inf)
+
+        for row, (union, dense, sparse, relevant) in enumerate(zip(unions, dense_lists, sparse_lists, relevant_lists)):
+            column_of = {doc_id: column for column, doc_id in enumerate(union)}
+            self.valid[row, :len(union)] = True
+            self.relevant[row, :len(union)] = [doc_id in relevant for doc_id in union]
+            for scores, ranks, results in ((self.dense_scores, self.dense_ranks, dense), (self.sparse_scores, self.sparse_ranks, sparse)):
+                # Only the first occurrence of a document counts, as in ScoreFusion
+                for rank, (doc_id, score) in reversed(list(enumerate(results))):
+                    scores[row, column_of[doc_id]] = float(score)
+                    ranks[row, column_of[doc_id]] = rank
+
+    @classmethod
+    def retrieve(
+        cls,
+        hybrid_search: HybridSearchSystem,
+        test_queries: List[str],
+        ground_truth: List[Set[int]],
+        depth: int,
+        batch_size: int = 64,
+    ) -> "FusionCandidates":
+        """Retrieve `depth` candidates per query from both retrievers of `hybrid_search`"""
+        # Every batch reads the same index, even if a new one is swapped in meanwhile
+        snapshot = getattr(hybrid_search, "snapshot", hybrid_search)
+        dense_lists, sparse_lists = [], []
+        for start in range(0, len(test_queries), batch_size):
+            batch = test_queries[start:start + batch_size]
+            dense_lists += snapshot.dense_retriever.search_batch(batch, depth)
+            sparse_lists += snapshot.sparse_retriever.search_batch(batch, depth)
+        return cls(dense_lists, sparse_lists, ground_truth)
+
+    @staticmethod
+    def _normalize(scores: np.ndarray, method: str) -> np.ndarray:
+        if method == "none":
+            return scores
+        # Rows without any candidate from this retriever are all NaN
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            if method == "z_score":
+                mean = np.nanmean(scores, axis=1, keepdims=True)
+                std = np.nanstd(scores, axis=1, keepdims=True)
+                return np.where(std > 0, (scores - mean) / std, 0.0)
+            if method == "min_max":
+                low = np.nanmin(scores, axis=1, keepdims=True)
+                high = np.nanmax(scores, axis=1, keepdims=True)
+                return np.where(high > low, (scores - low) / (high - low), 1.0)
+        raise ValueError(f"Unknown normalization method: {method}")
+
+    def fuse(
+        self,
+        fusion_method: str = "rrf",
+        dense_weight: float = 0.7,
+        sparse_weight: float = 0.3,
+        rrf_k: int = 60,
+        normalization: str = "min_max",
+    ) -> np.ndarray:
+        """Fused score of every candidate, -inf for padding"""
+        if fusion_method == "rrf":
+            fused = 1 / (self.dense_ranks + rrf_k) + 1 / (self.sparse_ranks + rrf_k)
+        elif fusion_method == "weighted_sum":
+            dense = np.nan_to_num(self._normalize(self.dense_scores, normalization) * (~np.isnan(self.dense_scores)), nan=0.0)
+            sparse = np.nan_to_num(self._normalize(self.sparse_scores, normalization) * (~np.isnan(self.sparse_scores)), nan=0.0)
+            fused = dense_weight * dense + sparse_weight * sparse
+        else:
+            raise ValueError(f"Unknown fusion method: {fusion_method}")
+        return np.where(self.valid, fused, -np.inf)
+
+    def rank(self, fused: np.ndarray, max_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Relevance matrix of the top `max_k` fused results and the number of results of every query"""
+        order = np.argsort(-fused, axis=1, kind="stable")[:, :max_k]
+        relevance = np.take_along_axis(self.relevant & self.valid, order, axis=1)
+        num_retrieved = np.minimum(self.valid.sum(axis=1), max_k)
+        if relevance.shape[1] < max_k:
+            relevance = np.pad(relevance, ((0, 0), (0, max_k - relevance.shape[1])))
+        return relevance, num_retrieved
+
+def r_precision(relevance: np.ndarray, num_retrieved: np.ndarray, num_relevant: np.ndarray) -> float:
+    """Mean precision at R, R being the number of relevant documents of each query"""
+    hits = np.cumsum(relevance, axis=1)
+    cutoff = np.clip(num_relevant, 1, relevance.shape[1])
+    hits_at_r = hits[np.arange(len(hits)), cutoff - 1]
+    retrieved_at_r = np.minimum(cutoff, num_retrieved)
+    return float(np.mean(np.divide(hits_at_r, retrieved_at_r, out=np.zeros(len(hits)), where=retrieved_at_r > 0)))
+
+def _objective_function(objective: Objective) -> Tuple[Callable[[np.ndarray, np.ndarray, np.ndarray], float], int]:
+    """Resolve an objective name ('ndcg@10', 'mrr', 'recall@20', 'r_precision'...) and the depth it needs"""
+    if callable(objective):
+        return objective, 0
+    if objective == "r_precision":
+        return r_precision, 0
+    _, _, k = objective.partition("@")
+    k_values = [int(k)] if k else [1]
+
+    def compute(relevance: np.ndarray, num_retrieved: np.ndarray, num_relevant: np.ndarray) -> float:
+        per_query = RetrievalMetrics.batch_metrics(relevance, num_retrieved, num_relevant, k_values)
+        if objective not in per_query:
+            raise ValueError(f"Unknown objective: {objective}")
+        return float(np.mean(per_query[objective]))
+
+    return compute, int(k) if k else 0
+
+@dataclass
+class FusionOptimizationResult:
+    best_params: Dict[str, Any]
+    best_score: float
+    trials: List[Tuple[Dict[str, Any], float]] = field(default_factory=list)
+
+    def to_config(self) -> HybridSearchConfig:
+        return HybridSearchConfig(**self.best_params)
+
+def optimize_fusion_params(
+    hybrid_search: HybridSearchSystem,
+    test_queries: List[str],
+    ground_truth: List[Set[int]],
+    objective: Objective = "ndcg@10",
+    depth: Optional[int] = None,
+    fusion_methods: Iterable[str] = ("rrf", "weighted_sum"),
+    weight_step: float = 0.05,
+    rrf_k_values: Iterable[int] = (1, 5, 10, 20, 30, 45, 60, 80, 100, 150),
+    normalizations: Iterable[str] = ("min_max", "z_score", "none"),
+    refine_steps: int = 4,
+    candidates: Optional[FusionCandidates] = None,
+) -> FusionOptimizationResult:
+    """
+    Find the best fusion settings (method, weights, RRF k, normalization) using validation data
+
+    Candidates are retrieved once per query, then every setting is scored offline as array operations.
+    A grid over all settings is followed by a coordinate refinement of the dense weight around the best one.
+
+    Args:
+        hybrid_search: Hybrid search instance, only its retrievers are used and it is not modified
+        test_queries: List of test queries
+        ground_truth: List of relevant document indices for each query
+        objective: Metric name ('ndcg@k', 'recall@k', 'precision@k', 'mrr', 'r_precision')
+            or a callable(relevance, num_retrieved, num_relevant) -> float, higher is better
+        depth: Number of candidates retrieved per query and retriever (twice the objective's k by default)
+        weight_step: Step of the dense weight grid, the sparse weight being 1 - dense weight
+        refine_steps: Number of halvings of the weight step around the best weight
+        candidates: Already retrieved candidates, to tune several objectives without retrieving again
+
+    Returns:
+        The best parameters, their objective value and every evaluated setting
+    """
+    score_fn, objective_k = _objective_function(objective)
+    max_k = objective_k or max((len(relevant) for relevant in ground_truth), default=10) or 10
+    if candidates is None:
+        candidates = FusionCandidates.retrieve(hybrid_search, test_queries, ground_truth, depth or int(max_k * getattr(hybrid_search, "candidate_multiplier", 2)))
+
+    trials = []
+    def evaluate(params: Dict[str, Any]) -> float:
+        relevance, num_retrieved = candidates.rank(candidates.fuse(**params), max_k)
+        score = score_fn(relevance, num_retrieved, candidates.num_relevant)
+        trials.append((params, score))
+        return score
+
+    settings = []
+    for fusion_method in fusion_methods:
+        if fusion_method == "rrf":
+            settings += [{"fusion_method": "rrf", "rrf_k": int(rrf_k)} for rrf_k in rrf_k_values]
+        else:
+            settings += [
+                {"fusion_method": fusion_method, "dense_weight": float(weight), "sparse_weight": float(1 - weight), "normalization": normalization}
+                for normalization in normalizations
+                for weight in np.round(arange(0.0, 1.0 + weight_step / 2, weight_step), 6)
+            ]
+
+    best_params, best_score = max(((params, evaluate(params)) for params in settings), key=lambda trial: trial[1])
+
+    # Coordinate refinement of the weight around the best grid point
+    step = weight_step
+    for _ in range(refine_steps if best_params["fusion_method"] == "weighted_sum" else 0):
+        step /= 2
+        for weight in (best_params["dense_weight"] - step, best_params["dense_weight"] + step):
+            if 0 <= weight <= 1:
+                params = {**best_params, "dense_weight": float(weight), "sparse_weight": float(1 - weight)}
+                score = evaluate(params)
+                if score > best_score:
+                    best_params, best_score = params, score
+
+    return FusionOptimizationResult(best_params, best_score, trials)
 
 def optimize_fusion_weights(
     hybrid_search: HybridSearchSystem,
@@ -13,44 +227,36 @@ def optimize_fusion_weights(
 ) -> Tuple[float, float]:
     """
     Find optimal fusion weights using validation data
-    
+
     Args:
         hybrid_search: Hybrid search instance
         test_queries: List of test queries
         ground_truth: List of relevant document indices for each query
         weight_range: Range of weights to test
-        
+
     Returns:
         Optimal (dense_weight, sparse_weight) tuple
     """
+    # Candidates are retrieved once, each weight combination is then evaluated offline
+    max_relevant = max((len(relevant) for relevant in ground_truth), default=1)
+    candidates = FusionCandidates.retrieve(hybrid_search, test_queries, ground_truth, 2 * max_relevant)
+
     best_score = 0
     best_weights = (0.5, 0.5)
-    
+
     # Test different weight combinations
     for dense_weight in arange(weight_range[0], weight_range[1], 0.1):
         sparse_weight = 1.0 - dense_weight
-        
-        # Update weights
-        hybrid_search.dense_weight = dense_weight
-        hybrid_search.sparse_weight = sparse_weight
-        
-        # Calculate average precision
-        total_precision = 0
-        for query, relevant_docs in zip(test_queries, ground_truth):
-            results = hybrid_search.search(query, top_k=len(relevant_docs))
-            retrieved_docs = [doc_idx for doc_idx, _ in results]
-            
-            # Calculate precision at k
-            relevant_retrieved = len(set(retrieved_docs) & set(relevant_docs))
-            precision = relevant_retrieved / len(retrieved_docs)
-            total_precision += precision
-        
-        avg_precision = total_precision / len(test_queries)
-        
+        fused = candidates.fuse("weighted_sum", dense_weight, sparse_weight, normalization=hybrid_search.normalization)
+        relevance, num_retrieved = candidates.rank(fused, max_relevant)
+
+        # Average precision at the number of relevant documents of each query
+        avg_precision = r_precision(relevance, num_retrieved, candidates.num_relevant)
+
         if avg_precision > best_score:
             best_score = avg_precision
             best_weights = (dense_weight, sparse_weight)
-    
+
     return best_weights
 
 if __name__ == "__main__":
@@ -59,11 +265,13 @@ if __name__ == "__main__":
 
     # Example usage
     hybrid_search = HybridSearchSystem(embedder_config=EmbedderConfig(
-        model_name=getenv("EMBEDDING_MODEL"), 
-        embedding_module='local-dmr')
+        model_name=getenv("EMBEDDING_MODEL"),
+        embedding_module=getenv("EMBEDDING_MODULE"))
     )
     hybrid_search.index_documents(documents)
 
     optimal_weights = optimize_fusion_weights(hybrid_search, test_queries, ground_truth)
     print(f"Optimal Weights: Dense={optimal_weights[0]:.2f}, Sparse={optimal_weights[1]:.2f}")
-    
\ No newline at end of file
+
+    result = optimize_fusion_params(hybrid_search, test_queries, ground_truth, objective="ndcg@5")
+    print(f"Best fusion settings: {result.best_params} (ndcg@5={result.best_score:.4f}, {len(result.trials)} settings tried)")
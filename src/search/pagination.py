@@ -0,0 +1,30 @@
+import base64
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+@dataclass
+class ResultPage:
+    """A page of fused results, `next_cursor` fetches the following page and is None after the last one"""
+    results: List[Tuple[int, float]]
+    next_cursor: Optional[str]
+    offset: int
+
+@dataclass
+class CandidatePool:
+    """Fused results of a query kept between pages, in the order they are served.
+    `depth` is the `top_k` of the last search filling it, `exhausted` tells that it returned fewer results, so no deeper search can add any."""
+    results: List[Tuple[int, float]]
+    depth: int = 0
+    exhausted: bool = False
+
+def encode_cursor(offset: int, version: int) -> str:
+    """Opaque cursor of the page starting at `offset`, in the results of the index snapshot `version`"""
+    return base64.urlsafe_b64encode(f"{version}:{offset}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Offset and snapshot version of a cursor, raises ValueError for invalid cursors"""
+    try:
+        version, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(offset), int(version)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
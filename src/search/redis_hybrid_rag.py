@@ -0,0 +1,78 @@
+from typing import List, Optional, Tuple
+import numpy as np
+
+from retriever import RedisDenseRetriever, RedisBM25Retriever
+from documents import Document
+from .hybrid_rag import HybridSearchSystem
+
+class RedisHybridSearch(HybridSearchSystem):
+    """Hybrid search over a single RediSearch index holding both the vector and the text fields.
+    The KNN and full-text queries of a search (or of a whole batch) are pipelined in one round trip per node,
+    and documents are indexed once instead of once per retriever. Results are fused client side as usual.
+    The sparse retriever only provides the text query settings (fuzziness, prefix, max_terms), it always queries the dense index.
+    """
+
+    def __init__(self, dense_retriever: RedisDenseRetriever, sparse_retriever: Optional[RedisBM25Retriever] = None, *args, **kwargs):
+        if sparse_retriever is None:
+            sparse_retriever = RedisBM25Retriever(create_index=False)
+        # Text queries go to the combined index, through the dense retriever's connections
+        sparse_retriever.redis = dense_retriever.redis
+        sparse_retriever.index_name = dense_retriever.index_name
+        sparse_retriever.index_prefix = dense_retriever.index_prefix
+        sparse_retriever.create_index = False
+        super().__init__(dense_retriever, sparse_retriever, *args, **kwargs)
+
+    def _index_retrievers(self, dense: RedisDenseRetriever, sparse: RedisBM25Retriever, documents: List[Document], embeddings: Optional[np.ndarray] = None):
+        """Index documents once, the vector index also holds their text"""
+        if embeddings is None:
+            dense.encode_documents(documents)
+        else:
+            dense.documents = []
+            dense.add_embedded_documents(documents, embeddings)
+        sparse.documents = list(documents)
+
+    def _search_unpinned(self, queries: List[str], top_k: int) -> List[List[Tuple[int, float]]]:
+        if self.router is not None:
+            # Routed legs are searched separately, still on the combined index
+            return super()._search_unpinned(queries, top_k)
+
+        candidates = self._candidates(top_k)
+        dense, sparse = self.dense_retriever, self.sparse_retriever
+        with self._stage("embed"):
+            query_embeddings = dense.embed_queries(queries)
+        knn_vectors, knn_k, vector_field = dense.knn_queries(query_embeddings, candidates)
+        with self._stage("redis"):
+            knn_batch, sparse_batch = dense.redis.search_hybrid(
+                dense.index_name,
+                queries,
+                knn_vectors,
+                knn_k,
+                text_top_k=candidates,
+                fuzziness=sparse.fuzziness,
+                prefix=sparse.prefix,
+                max_terms=sparse.max_terms,
+                vector_field=vector_field,
+            )
+        with self._stage("dense"):
+            dense_batch = dense.rescore(query_embeddings, knn_batch, candidates)
+
+        with self._stage("fusion"):
+            return [
+                self._fuse(dense_results, sparse_results)[:top_k]
+                for dense_results, sparse_results in zip(dense_batch, sparse_batch)
+            ]
+
+
+if __name__ == "__main__":
+    from ._samples import documents
+    from helpers.print import print_query_results
+    from os import getenv
+
+    hybrid_search = RedisHybridSearch(
+        RedisDenseRetriever(model_name=getenv("EMBEDDING_MODEL"), embedding_module=getenv("EMBEDDING_MODULE"), index_name="hybrid_idx", redis_host=getenv("REDIS_HOST")),
+        RedisBM25Retriever(fuzziness=1),
+    )
+    hybrid_search.index_documents(documents)
+
+    query = "neural networks for machine learning"
+    print_query_results(query, hybrid_search.search(query, top_k=5), documents, mode="redis")
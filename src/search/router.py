@@ -0,0 +1,151 @@
+import math, threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, Optional
+
+from retriever import BaseDenseRetriever, BaseSparseRetriever
+
+RouteName = Literal["dense", "sparse", "both"]
+
+@dataclass
+class Route:
+    """Legs to run for a query and their depth, a depth of 0 skips the leg"""
+    name: RouteName
+    dense_k: int
+    sparse_k: int
+    reason: str
+
+class QueryRouter:
+    """Decides per query whether the dense leg, the sparse leg or both are worth running, from cheap features:
+    - number of analyzed terms, and the share of them found in the BM25 index (coverage)
+    - rarest term idf, normalized by the idf of a term found in a single document
+    - number of rare terms, exact keyword hits such as product codes or names
+    - whether the query embedding is already cached, making the dense leg cheap
+    Short queries fully covered by the index with a rare keyword go sparse-only (no embedding call), queries without any
+    indexed term go dense-only, the others run both legs. Single legs only fetch `top_k` results, and sparse-only queries
+    matching fewer than `top_k` documents fall back to the dense leg (counted in `stats` as `dense_fallbacks`).
+    Term statistics come from an in-memory `InvertedIndex` (`BM25Retriever`), other sparse retrievers always run both legs.
+    Counters of routes and of the estimated latency saved are available with `stats`.
+    Use **RouterConfig() from helpers.config to easily create the arguments.
+    Arguments:
+        short_query_terms: Maximum number of terms of a sparse-only query
+        rare_idf: Normalized idf (0 to 1) from which a term is a rare keyword
+        min_sparse_coverage: Minimum share of indexed terms of a sparse-only query
+        shallow_sparse_coverage: When both legs run, the sparse leg only fetches `top_k` results under this coverage
+    """
+
+    def __init__(
+        self,
+        short_query_terms: int = 3,
+        rare_idf: float = 0.5,
+        min_sparse_coverage: float = 1.0,
+        shallow_sparse_coverage: float = 0.5,
+    ):
+        self.short_query_terms = short_query_terms
+        self.rare_idf = rare_idf
+        self.min_sparse_coverage = min_sparse_coverage
+        self.shallow_sparse_coverage = shallow_sparse_coverage
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.route_counts: Dict[str, int] = {"dense": 0, "sparse": 0, "both": 0}
+            self.reason_counts: Dict[str, int] = {}
+            self.skipped = {"dense": 0, "sparse": 0}
+            self.dense_fallbacks = 0
+            # Average seconds per query of every leg, measured when it runs, to estimate what skipping it saved
+            self.leg_seconds = {"dense": 0.0, "sparse": 0.0}
+            self.leg_queries = {"dense": 0, "sparse": 0}
+
+    def features(self, query: str, sparse_retriever: BaseSparseRetriever, dense_retriever: Optional[BaseDenseRetriever] = None) -> Dict[str, Any]:
+        """Cheap features of a query, term statistics are None when the sparse retriever exposes none"""
+        cached = dense_retriever is not None and query in dense_retriever.query_cache
+        analyzer = getattr(sparse_retriever, "analyzer", None)
+        index = getattr(sparse_retriever, "index", None)
+        if analyzer is None or index is None or not hasattr(index, "document_frequency") or not index.num_documents:
+            return {"terms": None, "coverage": None, "max_idf": None, "keyword_hits": None, "cached": cached}
+
+        terms = list(dict.fromkeys(analyzer(query)))
+        frequencies = [index.document_frequency(term) for term in terms]
+        found = [frequency for frequency in frequencies if frequency]
+        idfs = [self._normalized_idf(frequency, index.num_documents) for frequency in found]
+        return {
+            "terms": len(terms),
+            "coverage": len(found) / len(terms) if terms else 0.0,
+            "max_idf": max(idfs, default=0.0),
+            "keyword_hits": sum(idf >= self.rare_idf for idf in idfs),
+            "cached": cached,
+        }
+
+    def route(self, query: str, top_k: int, candidates: int, sparse_retriever: BaseSparseRetriever, dense_retriever: Optional[BaseDenseRetriever] = None) -> Route:
+        """Route of a query, `candidates` being the depth of each leg when both run"""
+        features = self.features(query, sparse_retriever, dense_retriever)
+        if features["terms"] is None:
+            route = Route("both", candidates, candidates, "no_term_statistics")
+        elif features["coverage"] == 0:
+            route = Route("dense", top_k, 0, "no_indexed_term")
+        elif features["cached"]:
+            route = Route("both", candidates, candidates, "cached_embedding")
+        elif (
+            features["terms"] <= self.short_query_terms
+            and features["coverage"] >= self.min_sparse_coverage
+            and features["keyword_hits"] > 0
+        ):
+            route = Route("sparse", 0, top_k, "short_keyword_query")
+        elif features["coverage"] < self.shallow_sparse_coverage:
+            route = Route("both", candidates, top_k, "low_coverage")
+        else:
+            route = Route("both", candidates, candidates, "default")
+        self._count(route)
+        return route
+
+    def route_batch(self, queries: List[str], top_k: int, candidates: int, sparse_retriever: BaseSparseRetriever, dense_retriever: Optional[BaseDenseRetriever] = None) -> List[Route]:
+        return [self.route(query, top_k, candidates, sparse_retriever, dense_retriever) for query in queries]
+
+    def record_fallbacks(self, num_queries: int):
+        """Record sparse-only queries whose dense leg ran after all, their sparse results being too few"""
+        with self._lock:
+            self.dense_fallbacks += num_queries
+            self.skipped["dense"] -= num_queries
+
+    def record_leg(self, leg: str, seconds: float, num_queries: int):
+        """Record the duration of a leg run for `num_queries` queries"""
+        if num_queries <= 0:
+            return
+        with self._lock:
+            self.leg_seconds[leg] += seconds
+            self.leg_queries[leg] += num_queries
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing mix and latency saved, estimated from the average duration of the skipped legs"""
+        with self._lock:
+            total = sum(self.route_counts.values())
+            average = {
+                leg: self.leg_seconds[leg] / self.leg_queries[leg] if self.leg_queries[leg] else 0.0
+                for leg in self.leg_seconds
+            }
+            return {
+                "queries": total,
+                "routes": dict(self.route_counts),
+                "route_shares": {name: count / total if total else 0.0 for name, count in self.route_counts.items()},
+                "reasons": dict(self.reason_counts),
+                "embeddings_skipped": self.skipped["dense"],
+                "dense_fallbacks": self.dense_fallbacks,
+                "average_leg_seconds": average,
+                "estimated_seconds_saved": sum(self.skipped[leg] * average[leg] for leg in self.skipped),
+            }
+
+    def _count(self, route: Route):
+        with self._lock:
+            self.route_counts[route.name] += 1
+            self.reason_counts[route.reason] = self.reason_counts.get(route.reason, 0) + 1
+            if not route.dense_k:
+                self.skipped["dense"] += 1
+            if not route.sparse_k:
+                self.skipped["sparse"] += 1
+
+    @staticmethod
+    def _normalized_idf(document_frequency: int, num_documents: int) -> float:
+        # BM25 idf, divided by the idf of a term found in a single document
+        idf = math.log(1 + (num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+        return idf / math.log(1 + (num_documents - 0.5) / 1.5) if num_documents > 1 else 1.0
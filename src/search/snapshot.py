@@ -0,0 +1,30 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from retriever import BaseDenseRetriever, BaseSparseRetriever
+from documents import Document
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Immutable state of a hybrid search system: the indexed retrievers, their documents, the pinned results and
+    the fusion settings. Searches read one snapshot from start to end without locking, writers build a new snapshot
+    and swap it in, so that a search never sees a half-built index or a half-updated pair of weights.
+    Retrievers and documents of a published snapshot must not be modified, build new ones with `BaseRetriever.clone`."""
+    dense_retriever: BaseDenseRetriever
+    sparse_retriever: BaseSparseRetriever
+    documents: List[Document] = field(default_factory=list)
+    pinned_results: Dict[Tuple[str, int], List[Tuple[int, float]]] = field(default_factory=dict)
+    fusion_method: str = "rrf"
+    dense_weight: float = 0.7
+    sparse_weight: float = 0.3
+    rrf_k: int = 60
+    normalization: str = "min_max"
+    candidate_multiplier: float = 2.0
+    # Incremented by every swap, e.g. to tell cached results of an older index apart
+    version: int = 0
+
+# Snapshot fields that can be set one by one on a search system, each assignment swapping in a new snapshot
+SNAPSHOT_FIELDS = (
+    "dense_retriever", "sparse_retriever", "documents", "pinned_results",
+    "fusion_method", "dense_weight", "sparse_weight", "rrf_k", "normalization", "candidate_multiplier",
+)
@@ -1,8 +1,8 @@
 from typing import List, Tuple
 
+import numpy as np
+
 from search import HybridSearchSystem
-from retriever import DenseRetriever
-from helpers.config import EmbedderConfig
 
 class MultiStageHybridSearch(HybridSearchSystem):
     """Multi-stage hybrid search with progressive refinement"""
@@ -16,36 +16,47 @@ class MultiStageHybridSearch(HybridSearchSystem):
         """Multi-stage search with progressive refinement"""
         
         # Stage 1: Fast, broad retrieval
-        sparse_candidates = self.sparse_retriever.search(query, self.stage1_k)
+        with self._stage("sparse"):
+            sparse_candidates = self.sparse_retriever.search(query, self.stage1_k)
         candidate_indices = [idx for idx, _ in sparse_candidates]
         
         # Stage 2: Dense re-ranking of candidates
-        if len(candidate_indices) > 0:
-            candidate_docs = [
-                self.dense_retriever.documents[idx] 
-                for idx in candidate_indices
-            ]
-            
-            # Create temporary dense retriever for candidates
-            temp_retriever = DenseRetriever(**EmbedderConfig(
-                model_name=self.dense_retriever.model.model_name,
-                embedding_module=self.dense_retriever.model._embedding_module
-            ))
-            temp_retriever.encode_documents(candidate_docs)
-            
-            # Dense search within candidates
-            dense_results = temp_retriever.search(query, self.stage2_k)
-            
-            # Map back to original indices
-            final_results = [
-                (candidate_indices[idx], score) 
-                for idx, score in dense_results
-            ]
-        else:
-            final_results = []
+        with self._stage("rerank"):
+            final_results = self._rerank(query, candidate_indices)
         
         return final_results[:top_k]
 
+    def _rerank(self, query: str, candidate_indices: List[str]) -> List[Tuple[str, float]]:
+        if len(candidate_indices) == 0:
+            return []
+
+        positions = [int(idx) for idx in candidate_indices]
+        document_embeddings = self.dense_retriever.document_embeddings
+        if isinstance(document_embeddings, np.ndarray) and len(document_embeddings):
+            # Reuse the vectors computed at indexing time
+            candidate_embeddings = np.asarray(document_embeddings[positions], dtype=np.float32)
+        else:
+            candidate_embeddings = self.dense_retriever.model.encode_array(
+                [self.dense_retriever.documents[position].text for position in positions]
+            )
+            candidate_embeddings = self.dense_retriever.truncate(candidate_embeddings)
+        query_embedding = self.dense_retriever.embed_queries([query])[0]
+
+        # Dense search within candidates
+        norms = np.linalg.norm(candidate_embeddings, axis=1) * (np.linalg.norm(query_embedding) or 1.0)
+        norms[norms == 0] = 1.0
+        similarities = (candidate_embeddings @ query_embedding) / norms
+        best = np.argsort(-similarities)[:self.stage2_k]
+
+        # Map back to original indices
+        return [(candidate_indices[position], similarities[position]) for position in best]
+
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        """Stage 2 is specific to each query's candidates, queries are searched one by one
+        after embedding them all in one call (the embeddings are then served from the query cache)"""
+        self.dense_retriever.embed_queries(queries)
+        return [self.search(query, top_k) for query in queries]
+
 
 if __name__ == "__main__":
     from ._samples import documents
@@ -55,7 +66,7 @@ if __name__ == "__main__":
 
     multi_stage_search = MultiStageHybridSearch(embedder_config=EmbedderConfig(
         model_name=getenv("EMBEDDING_MODEL"),
-        embedding_module='local-dmr'
+        embedding_module=getenv("EMBEDDING_MODULE")
     ))
     multi_stage_search.index_documents(documents)
 
@@ -0,0 +1,302 @@
+import os, re, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from documents import Document
+from helpers.config import EmbedderConfig
+from helpers.memory import documents_nbytes
+from .hybrid_rag import HybridSearchSystem
+from .snapshot import SNAPSHOT_FIELDS
+from .pagination import ResultPage
+
+TENANT_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class TenantQuotaExceeded(RuntimeError):
+    """Raised when a tenant request is rejected because it would exceed the tenant's quota"""
+
+@dataclass
+class TenantQuota:
+    """Resource limits of a tenant, None for no limit
+    Arguments:
+        max_concurrency: Maximum number of the tenant's queries processed at the same time
+        max_memory_bytes: Maximum approximate memory of the tenant's index, `stats()["total_bytes"]` plus the FT.INFO memory of its RediSearch indexes
+        acquire_timeout: Time a query may wait for one of the tenant's slots
+    """
+    max_concurrency: Optional[int] = 8
+    max_memory_bytes: Optional[int] = None
+    acquire_timeout: float = 0.0
+
+class _Tenant:
+    def __init__(self, quota: TenantQuota):
+        self.quota = quota
+        self.system: Optional[HybridSearchSystem] = None
+        # Quota error of the last load, raised again without calling the factory until the quota changes
+        self.load_error: Optional[TenantQuotaExceeded] = None
+        self.slots = threading.BoundedSemaphore(quota.max_concurrency) if quota.max_concurrency else None
+        # Serializes the loading and indexing of the tenant, searches never take it
+        self.load_lock = threading.Lock()
+        self.active = 0
+        self.nbytes = 0
+        self.last_used = 0.0
+        self.counters = {"queries": 0, "rejected": 0, "loads": 0, "evictions": 0}
+
+class TenantManager:
+    """Hosts the hybrid search indexes of many tenants in one process, routing requests by tenant id.
+    Tenant systems are created on first use by `factory(tenant_id)`, which builds (and loads) the tenant's index, e.g.
+    `redis_tenant_factory` (one RediSearch index and key prefix per tenant on a shared connection) or `local_tenant_factory`
+    (ingestion state directories). Loaded systems are kept in LRU order: beyond `max_loaded` systems, or `memory_budget_bytes`
+    of approximate memory, the least recently used idle ones are unloaded, to be loaded again by the factory when needed.
+    Every tenant gets a `TenantQuota` (`quotas`, else `default_quota`) bounding its concurrent queries and its index memory.
+    Use **TenantConfig() from helpers.config to easily create the `max_loaded` and `memory_budget_bytes` arguments.
+    Arguments:
+        factory: Builds the search system of a tenant
+        max_loaded: Maximum number of systems kept loaded
+        memory_budget_bytes: Approximate memory of all the loaded systems, None for no budget
+        default_quota: Quota of the tenants without their own
+        quotas: Quotas per tenant id
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], HybridSearchSystem],
+        max_loaded: int = 32,
+        memory_budget_bytes: Optional[int] = None,
+        default_quota: Optional[TenantQuota] = None,
+        quotas: Optional[Dict[str, TenantQuota]] = None,
+    ):
+        self.factory = factory
+        self.max_loaded = max_loaded
+        self.memory_budget_bytes = memory_budget_bytes
+        self.default_quota = default_quota or TenantQuota()
+        self.quotas = dict(quotas or {})
+        self._tenants: Dict[str, _Tenant] = {}
+        # Loaded tenants, least recently used first
+        self._loaded: "OrderedDict[str, _Tenant]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_quota(self, tenant_id: str, quota: TenantQuota):
+        """Change the quota of a tenant, applied to its next requests"""
+        with self._lock:
+            self.quotas[tenant_id] = quota
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                # Queries in progress release the slots they acquired
+                tenant.quota = quota
+                tenant.load_error = None
+                tenant.slots = threading.BoundedSemaphore(quota.max_concurrency) if quota.max_concurrency else None
+
+    @contextmanager
+    def acquire(self, tenant_id: str) -> Iterator[HybridSearchSystem]:
+        """Search system of a tenant, loaded if needed, holding one of the tenant's query slots while in use.
+        Raises `TenantQuotaExceeded` when the tenant has no free slot within its `acquire_timeout`."""
+        tenant = self._tenant(tenant_id)
+        slots = tenant.slots
+        if slots is not None and not slots.acquire(timeout=tenant.quota.acquire_timeout):
+            with self._lock:
+                tenant.counters["rejected"] += 1
+            raise TenantQuotaExceeded(f"Tenant {tenant_id} has {tenant.quota.max_concurrency} queries in progress")
+        try:
+            with self._lock:
+                tenant.counters["queries"] += 1
+            with self._in_use(tenant):
+                yield self._load(tenant_id, tenant)
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def search(self, tenant_id: str, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        with self.acquire(tenant_id) as system:
+            return system.search(query, top_k)
+
+    def search_batch(self, tenant_id: str, queries: List[str], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        with self.acquire(tenant_id) as system:
+            return system.search_batch(queries, top_k)
+
+    def search_page(self, tenant_id: str, query: str, page_size: int = 10, cursor: Optional[str] = None) -> ResultPage:
+        with self.acquire(tenant_id) as system:
+            return system.search_page(query, page_size, cursor)
+
+    def index_documents(self, tenant_id: str, documents: List[Document]):
+        """Index the documents of a tenant. `TenantQuotaExceeded` is raised, and nothing written, when an estimate of
+        the new index (documents and their embeddings) already exceeds the tenant's memory quota. The measured index is
+        checked again once built: in-memory systems then keep their previous index, but Redis keys are already overwritten.
+        In-memory indexes unloaded later are rebuilt by the factory, so they must also be persisted where it loads them from
+        (e.g. with the ingestion pipeline's `LocalSink`)."""
+        tenant = self._tenant(tenant_id)
+        with self._in_use(tenant), tenant.load_lock:
+            system = self._load(tenant_id, tenant, locked=True)
+            limit = tenant.quota.max_memory_bytes
+            if limit is not None:
+                estimate = self._estimate_nbytes(system, documents)
+                if estimate > limit:
+                    raise TenantQuotaExceeded(f"Index of tenant {tenant_id} needs at least {estimate} bytes, over its quota of {limit}")
+            previous = system.snapshot
+            system.index_documents(documents)
+            nbytes = self._nbytes(tenant, system)
+            if limit is not None and nbytes > limit:
+                system.swap(**{name: getattr(previous, name) for name in SNAPSHOT_FIELDS})
+                raise TenantQuotaExceeded(f"Index of tenant {tenant_id} needs {nbytes} bytes, over its quota of {limit}")
+            with self._lock:
+                tenant.nbytes = nbytes
+        self._evict(keep=tenant_id)
+
+    def unload(self, tenant_id: str) -> bool:
+        """Drop the loaded system of a tenant, returns whether it was loaded"""
+        with self._lock:
+            tenant = self._loaded.pop(tenant_id, None)
+            if tenant is None:
+                return False
+            tenant.system, tenant.nbytes = None, 0
+            tenant.counters["evictions"] += 1
+            return True
+
+    def loaded(self) -> List[str]:
+        """Ids of the loaded tenants, least recently used first"""
+        with self._lock:
+            return list(self._loaded)
+
+    def stats(self) -> Dict[str, Any]:
+        """Loaded tenants, their approximate memory, and query and loading counters per tenant"""
+        with self._lock:
+            return {
+                "loaded": len(self._loaded),
+                "total_bytes": sum(tenant.nbytes for tenant in self._loaded.values()),
+                "tenants": {
+                    tenant_id: {
+                        "loaded": tenant.system is not None,
+                        "bytes": tenant.nbytes,
+                        "active": tenant.active,
+                        **tenant.counters,
+                    }
+                    for tenant_id, tenant in self._tenants.items()
+                },
+            }
+
+    def _tenant(self, tenant_id: str) -> _Tenant:
+        if not TENANT_ID.match(tenant_id):
+            raise ValueError(f"Invalid tenant id {tenant_id!r}, expected 1 to 64 letters, digits, '_' or '-'")
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is None:
+                tenant = self._tenants[tenant_id] = _Tenant(self.quotas.get(tenant_id, self.default_quota))
+            return tenant
+
+    @contextmanager
+    def _in_use(self, tenant: _Tenant) -> Iterator[None]:
+        # Tenants in use are never evicted
+        with self._lock:
+            tenant.active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                tenant.active -= 1
+                tenant.last_used = time.time()
+
+    def _load(self, tenant_id: str, tenant: _Tenant, locked: bool = False) -> HybridSearchSystem:
+        """System of a tenant, built by the factory if it is not loaded. `locked` when the caller holds the tenant's load lock."""
+        with self._lock:
+            system = tenant.system
+            if system is not None:
+                self._loaded.move_to_end(tenant_id)
+                return system
+        with (nullcontext() if locked else tenant.load_lock):
+            if tenant.load_error is not None:
+                raise tenant.load_error
+            if tenant.system is None:
+                system = self.factory(tenant_id)
+                nbytes = self._nbytes(tenant, system)
+                if tenant.quota.max_memory_bytes is not None and nbytes > tenant.quota.max_memory_bytes:
+                    tenant.load_error = TenantQuotaExceeded(f"Index of tenant {tenant_id} needs {nbytes} bytes, over its quota of {tenant.quota.max_memory_bytes}")
+                    raise tenant.load_error
+                with self._lock:
+                    tenant.system, tenant.nbytes = system, nbytes
+                    tenant.counters["loads"] += 1
+                    self._loaded[tenant_id] = tenant
+        self._evict(keep=tenant_id)
+        return tenant.system
+
+    def _nbytes(self, tenant: _Tenant, system: HybridSearchSystem) -> int:
+        """Approximate memory of a tenant system, only measured when a quota or the budget needs it"""
+        if tenant.quota.max_memory_bytes is None and self.memory_budget_bytes is None:
+            return 0
+        stats = system.stats()
+        return stats["total_bytes"] + self._index_nbytes(system, stats)
+
+    @staticmethod
+    def _index_nbytes(system: HybridSearchSystem, stats: Dict[str, Any]) -> int:
+        """FT.INFO memory of the RediSearch indexes in a system's `stats()`, once per index, which its 'total_bytes' leave out"""
+        indexes = {}
+        for side in ("dense", "sparse"):
+            retriever = getattr(system, f"{side}_retriever")
+            info = stats[side].get("redis")
+            if info:
+                indexes[(id(retriever.redis), retriever.index_name)] = info
+        total_mb = sum(
+            info.get("total_index_memory_sz_mb", info.get("inverted_sz_mb", 0.0) + info.get("vector_index_sz_mb", 0.0))
+            for info in indexes.values()
+        )
+        return int(total_mb * 2 ** 20)
+
+    @staticmethod
+    def _estimate_nbytes(system: HybridSearchSystem, documents: List[Document]) -> int:
+        """Lower bound of the memory of an index of `documents`, before writing it: the documents and their float32 embeddings"""
+        if not documents:
+            return documents_nbytes(documents)
+        dense = system.dense_retriever
+        dimension = dense.vector_dim or dense.embed_documents([documents[0].text]).shape[1]
+        return documents_nbytes(documents) + len(documents) * dimension * 4
+
+    def _evict(self, keep: str):
+        """Unload the least recently used idle tenants while over `max_loaded` or the memory budget"""
+        with self._lock:
+            for tenant_id, tenant in list(self._loaded.items()):
+                total = sum(loaded.nbytes for loaded in self._loaded.values())
+                over_budget = self.memory_budget_bytes is not None and total > self.memory_budget_bytes
+                if len(self._loaded) <= self.max_loaded and not over_budget:
+                    break
+                # Tenants with queries in progress stay loaded, they are evicted once idle by a later load
+                if tenant_id == keep or tenant.active:
+                    continue
+                del self._loaded[tenant_id]
+                tenant.system, tenant.nbytes = None, 0
+                tenant.counters["evictions"] += 1
+
+def redis_tenant_factory(
+    redis_controller,
+    embedder_config: Optional[EmbedderConfig] = None,
+    index_name: str = "{tenant}_idx",
+    index_prefix: str = "{tenant}:doc:",
+    **search_kwargs,
+) -> Callable[[str], HybridSearchSystem]:
+    """Factory of `RedisHybridSearch` systems sharing one Redis controller (and its connections), each tenant having its own
+    combined index and key prefix, formatted with the tenant id. Tenants with the same embedder config share one Embedder.
+    `search_kwargs` are passed to `RedisHybridSearch` (config, router, monitor...)."""
+    from retriever import RedisDenseRetriever
+    from .redis_hybrid_rag import RedisHybridSearch
+    embedder_config = embedder_config or EmbedderConfig()
+
+    def factory(tenant_id: str) -> HybridSearchSystem:
+        dense = RedisDenseRetriever(
+            **embedder_config,
+            redis_controller=redis_controller,
+            index_name=index_name.format(tenant=tenant_id),
+            index_prefix=index_prefix.format(tenant=tenant_id),
+        )
+        return RedisHybridSearch(dense, **search_kwargs)
+    return factory
+
+def local_tenant_factory(root_directory: str, **system_kwargs) -> Callable[[str], HybridSearchSystem]:
+    """Factory of in-memory `HybridSearchSystem`s loaded from `<root_directory>/<tenant id>`, the state directory of
+    a `LocalSink` ingestion (`python -m ingest.pipeline ... --target local --state-dir <root_directory>/<tenant id>`).
+    Tenants without a directory start empty. `system_kwargs` are passed to `HybridSearchSystem`."""
+    def factory(tenant_id: str) -> HybridSearchSystem:
+        from ingest import load_local_index
+        system = HybridSearchSystem(**system_kwargs)
+        directory = os.path.join(root_directory, tenant_id)
+        if os.path.exists(os.path.join(directory, "documents.jsonl")):
+            load_local_index(directory, system)
+        return system
+    return factory
@@ -0,0 +1,14 @@
+from .workers import SearchWorkerPool, share_indexes, release_indexes
+from .coalescer import RequestCoalescer, ServiceOverloaded
+from .app import SearchService, InvalidRequest, create_server
+
+__all__ = [
+    "SearchWorkerPool",
+    "share_indexes",
+    "release_indexes",
+    "RequestCoalescer",
+    "ServiceOverloaded",
+    "SearchService",
+    "InvalidRequest",
+    "create_server",
+]
@@ -0,0 +1,347 @@
+import json, threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from documents import preprocess_documents
+from search import HybridSearchSystem, MonitoredHybridSearch, TenantManager, TenantQuotaExceeded
+from search.pagination import decode_cursor
+from search.tenants import TENANT_ID
+from score import stats_to_prometheus
+from .coalescer import RequestCoalescer, ServiceOverloaded
+
+class InvalidRequest(ValueError):
+    """Raised when a request body is malformed, answered with a 400 before any search runs"""
+
+def _positive_int(payload: Dict[str, Any], field: str, default: int) -> int:
+    value = payload.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise InvalidRequest(f'"{field}" must be a positive integer')
+    return value
+
+def _strings(payload: Dict[str, Any], field: str) -> List[str]:
+    value = payload.get(field)
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise InvalidRequest(f'"{field}" must be a list of strings')
+    return value
+
+def _serialize_results(results: List[Tuple[str, float]]) -> List[Dict[str, Any]]:
+    return [{"id": str(doc_id), "score": float(score)} for doc_id, score in results]
+
+class SearchService:
+    """HTTP-facing wrapper around a search system.
+
+    Single queries go through a `RequestCoalescer`, so concurrent requests share batched embedding and
+    scoring work. At most `max_concurrency` requests are handled at once; requests that cannot get a slot
+    within `acquire_timeout` seconds, or that find the coalescer queue full, are rejected with a 503.
+    Request bodies are validated before searching (400), searches not answered within `request_timeout` get a 504
+    and unexpected errors a 500.
+    Arguments:
+        search_system: Search system answering the queries
+        max_concurrency: Maximum number of requests processed at the same time
+        acquire_timeout: Time a request may wait for a processing slot
+        request_timeout: Time a request may wait for its results
+        max_batch_queries: Maximum number of queries of a /search/batch request, which bypasses the coalescer queue
+        tenants: Tenant indexes, requests with a "tenant" field are routed to them (without coalescing), within the tenant's quota (429 otherwise)
+        coalescer_kwargs: Passed to `RequestCoalescer` (max_batch_size, max_wait_ms, max_queue)
+    """
+    def __init__(
+        self,
+        search_system: HybridSearchSystem,
+        max_concurrency: int = 64,
+        acquire_timeout: float = 0.1,
+        request_timeout: float = 30.0,
+        max_batch_queries: int = 256,
+        tenants: Optional[TenantManager] = None,
+        **coalescer_kwargs,
+    ):
+        self.search_system = search_system
+        self.tenants = tenants
+        self.coalescer = RequestCoalescer(search_system, **coalescer_kwargs)
+        self.acquire_timeout = acquire_timeout
+        self.request_timeout = request_timeout
+        self.max_batch_queries = max_batch_queries
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def start(self) -> "SearchService":
+        self.coalescer.start()
+        return self
+
+    def stop(self):
+        self.coalescer.stop()
+
+    def handle(self, path: str, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Process a request body for `path`, returns the HTTP status and the response body"""
+        routes = {
+            "/search": self.search,
+            "/search/batch": self.search_batch,
+            "/search/page": self.search_page,
+            "/index": self.index,
+        }
+        if path not in routes:
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {path}"}
+        try:
+            request = self.validate(path, payload)
+        except InvalidRequest as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Invalid request: {e}"}
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Too many concurrent requests"}
+        try:
+            return HTTPStatus.OK, routes[path](request)
+        except ServiceOverloaded as e:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)}
+        except TenantQuotaExceeded as e:
+            return HTTPStatus.TOO_MANY_REQUESTS, {"error": str(e)}
+        except FutureTimeout:
+            # `concurrent.futures.TimeoutError` is only the builtin TimeoutError from Python 3.11
+            return HTTPStatus.GATEWAY_TIMEOUT, {"error": f"No results within {self.request_timeout}s"}
+        except Exception as e:
+            print(f"Request error on {path}: {e!r}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal error"}
+        finally:
+            self._slots.release()
+
+    def validate(self, path: str, payload: Any) -> Dict[str, Any]:
+        """Checked request body of `path`, with the defaults filled in. Raises `InvalidRequest`."""
+        if not isinstance(payload, dict):
+            raise InvalidRequest("the body must be a JSON object")
+        tenant = payload.get("tenant")
+        if tenant is not None:
+            if self.tenants is None:
+                raise InvalidRequest("this server does not host tenant indexes")
+            if not isinstance(tenant, str) or not TENANT_ID.match(tenant):
+                raise InvalidRequest('"tenant" must be 1 to 64 letters, digits, "_" or "-"')
+        request = {"tenant": tenant}
+        if path == "/index":
+            request["documents"] = _strings(payload, "documents")
+            request["chunk_size"] = _positive_int(payload, "chunk_size", 512)
+            return request
+        if path == "/search/batch":
+            request["queries"] = _strings(payload, "queries")
+            if len(request["queries"]) > self.max_batch_queries:
+                raise InvalidRequest(f"at most {self.max_batch_queries} queries per batch")
+        elif not isinstance(payload.get("query"), str):
+            raise InvalidRequest('"query" must be a string')
+        else:
+            request["query"] = payload["query"]
+        if path == "/search/page":
+            request["page_size"] = _positive_int(payload, "page_size", 10)
+            request["cursor"] = payload.get("cursor")
+            if request["cursor"] is not None:
+                if not isinstance(request["cursor"], str):
+                    raise InvalidRequest('"cursor" must be a string')
+                try:
+                    decode_cursor(request["cursor"])
+                except ValueError as e:
+                    raise InvalidRequest(str(e)) from e
+        else:
+            request["top_k"] = _positive_int(payload, "top_k", 10)
+        return request
+
+    def metrics(self) -> str:
+        """Monitoring export in the Prometheus text format: performance metrics when the search system has a monitor, index statistics"""
+        performance = self.search_system.monitor.to_prometheus() if self.search_system.monitor is not None else ""
+        return performance + stats_to_prometheus(self.search_system.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.search_system.stats()
+        if self.tenants is not None:
+            stats["tenants"] = self.tenants.stats()
+        return stats
+
+    def search(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        query, tenant = request["query"], request["tenant"]
+        if tenant is not None:
+            results = self.tenants.search(tenant, query, request["top_k"])
+        else:
+            results = self.coalescer.search(query, request["top_k"], timeout=self.request_timeout)
+        return {"query": query, "results": _serialize_results(results)}
+
+    def search_page(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """A page of results, the "next_cursor" of the response fetches the next one (null after the last page)"""
+        query, tenant = request["query"], request["tenant"]
+        page_size, cursor = request["page_size"], request["cursor"]
+        if tenant is not None:
+            page = self.tenants.search_page(tenant, query, page_size, cursor)
+        else:
+            page = self.search_system.search_page(query, page_size, cursor)
+        return {"query": query, "results": _serialize_results(page.results), "next_cursor": page.next_cursor}
+
+    def search_batch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        # Already a batch: no need to go through the coalescer
+        queries, tenant = request["queries"], request["tenant"]
+        if tenant is not None:
+            results = self.tenants.search_batch(tenant, queries, request["top_k"])
+        else:
+            results = self.search_system.search_batch(queries, request["top_k"])
+        return {
+            "results": [
+                {"query": query, "results": _serialize_results(query_results)}
+                for query, query_results in zip(queries, results)
+            ]
+        }
+
+    def index(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        documents = preprocess_documents(request["documents"], chunk_size=request["chunk_size"])
+        tenant = request["tenant"]
+        # Searches keep being served by the current index until the new one is swapped in
+        if tenant is not None:
+            self.tenants.index_documents(tenant, documents)
+        else:
+            self.search_system.index_documents(documents)
+        return {"indexed_chunks": len(documents)}
+
+def _make_handler(service: SearchService):
+    class SearchRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/stats":
+                self._respond(HTTPStatus.OK, service.stats())
+                return
+            if path == "/metrics":
+                content, content_type = service.metrics().encode(), "text/plain; version=0.0.4"
+            elif path == "/profile" and service.search_system.profiler is not None:
+                # Folded stacks of the sampled searches, e.g. `curl .../profile?kind=stacks | flamegraph.pl > flame.svg`
+                kind = "stacks" if "kind=stacks" in self.path else "spans"
+                content, content_type = "".join(f"{line}\n" for line in service.search_system.profiler.folded(kind)).encode(), "text/plain"
+            else:
+                self._respond(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {self.path}"})
+                return
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as e:
+                self._respond(HTTPStatus.BAD_REQUEST, {"error": f"Invalid JSON body: {e}"})
+                return
+            status, body = service.handle(self.path.split("?")[0], payload)
+            self._respond(status, body)
+
+        def _respond(self, status: int, body: Dict[str, Any]):
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            if status == HTTPStatus.SERVICE_UNAVAILABLE:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass  # Access logs would dominate the cost of small queries
+
+    return SearchRequestHandler
+
+def create_server(service: SearchService, host: str = "0.0.0.0", port: int = 8000) -> ThreadingHTTPServer:
+    """Create the HTTP server exposing `/search`, `/search/batch`, `/search/page` and `/index` (all POST with JSON bodies),
+    and `GET /metrics`, `GET /stats` and `GET /profile` (with a profiler) for monitoring"""
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    import argparse, csv
+    from os import getenv
+    from helpers.config import EmbedderConfig, HybridSearchConfig, RouterConfig, ProfilerConfig, TenantConfig
+    from search import QueryRouter, TenantQuota, local_tenant_factory, redis_tenant_factory
+    from score import QueryProfiler
+
+    parser = argparse.ArgumentParser(description="Serve hybrid search over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--csv", help="CSV file to index at startup")
+    parser.add_argument("--columns", nargs="+", default=["Question", "Answer"], help="Columns concatenated as document text")
+    parser.add_argument("--encoding", default="iso-8859-2")
+    parser.add_argument("--model", default=getenv("EMBEDDING_MODEL"))
+    parser.add_argument("--embedding-module", default="local-dmr")
+    parser.add_argument("--fusion-method", default="rrf", choices=["rrf", "weighted_sum"])
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=1024)
+    parser.add_argument("--max-batch-queries", type=int, default=256, help="Maximum number of queries of a /search/batch request")
+    parser.add_argument("--hot-queries", help="File with one frequent query per line, their results are precomputed at startup")
+    parser.add_argument("--hot-top-k", type=int, default=10)
+    parser.add_argument("--route-queries", action="store_true", help="Skip the dense or sparse leg of queries that do not need it")
+    parser.add_argument("--profile-rate", type=float, default=0.0, help="Fraction of the searches to profile, served as folded stacks by GET /profile")
+    parser.add_argument("--profile-dir", help="Directory receiving the profiles of the sampled searches")
+    parser.add_argument("--profile-slow-ms", type=float, default=0.0, help="Only keep the profiles of searches slower than this")
+    parser.add_argument("--profile-stack-interval", type=float, help="Seconds between stack samples of the profiled searches")
+    parser.add_argument("--profile-cprofile", action="store_true", help="Also cProfile the profiled searches")
+    parser.add_argument("--tenant-root", help="Serve tenant indexes from `<dir>/<tenant>` ingestion state directories")
+    parser.add_argument("--tenant-redis-host", help="Serve tenant indexes from Redis, one index and key prefix per tenant ('memory' for the in-process store)")
+    parser.add_argument("--max-tenants", type=int, default=32, help="Maximum number of tenant indexes kept loaded")
+    parser.add_argument("--tenant-memory-budget-mb", type=float, help="Approximate memory of all the loaded tenant indexes")
+    parser.add_argument("--tenant-max-concurrency", type=int, default=8, help="Maximum concurrent queries per tenant")
+    parser.add_argument("--tenant-memory-mb", type=float, help="Maximum approximate memory of a tenant index")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile_rate > 0:
+        profiler = QueryProfiler(**ProfilerConfig(
+            sample_rate=args.profile_rate,
+            cprofile=args.profile_cprofile,
+            stack_interval=args.profile_stack_interval,
+            slow_query_ms=args.profile_slow_ms,
+            output_dir=args.profile_dir,
+        ))
+    search_system = MonitoredHybridSearch(
+        config=HybridSearchConfig(fusion_method=args.fusion_method),
+        embedder_config=EmbedderConfig(model_name=args.model, embedding_module=args.embedding_module),
+        router=QueryRouter(**RouterConfig()) if args.route_queries else None,
+        profiler=profiler,
+    )
+    if args.csv:
+        with open(args.csv, encoding=args.encoding, newline="") as f:
+            raw_documents = [" ".join(row[column] for column in args.columns) for row in csv.DictReader(f)]
+        search_system.index_documents(preprocess_documents(raw_documents))
+    if args.hot_queries:
+        with open(args.hot_queries, encoding="utf-8") as f:
+            search_system.warm_up([line.strip() for line in f if line.strip()], args.hot_top_k)
+
+    tenants = None
+    embedder_config = EmbedderConfig(model_name=args.model, embedding_module=args.embedding_module)
+    if args.tenant_redis_host:
+        from store import create_controller
+        factory = redis_tenant_factory(create_controller(args.tenant_redis_host), embedder_config, config=HybridSearchConfig(fusion_method=args.fusion_method))
+    elif args.tenant_root:
+        factory = local_tenant_factory(args.tenant_root, config=HybridSearchConfig(fusion_method=args.fusion_method), embedder_config=embedder_config)
+    if args.tenant_redis_host or args.tenant_root:
+        budget = int(args.tenant_memory_budget_mb * 2**20) if args.tenant_memory_budget_mb else None
+        tenants = TenantManager(
+            factory,
+            **TenantConfig(max_loaded=args.max_tenants, memory_budget_bytes=budget),
+            default_quota=TenantQuota(
+                max_concurrency=args.tenant_max_concurrency,
+                max_memory_bytes=int(args.tenant_memory_mb * 2**20) if args.tenant_memory_mb else None,
+            ),
+        )
+
+    service = SearchService(
+        search_system,
+        tenants=tenants,
+        max_concurrency=args.max_concurrency,
+        max_batch_queries=args.max_batch_queries,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue,
+    ).start()
+    server = create_server(service, args.host, args.port)
+    print(f"Serving hybrid search on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
@@ -0,0 +1,116 @@
+import queue, threading, time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import List, Optional, Tuple
+
+from search import HybridSearchSystem
+
+class ServiceOverloaded(RuntimeError):
+    """Raised when a request is rejected because the service is at capacity"""
+
+class RequestCoalescer:
+    """Group concurrent queries into batched searches.
+
+    Queries submitted from many threads are queued; a dispatcher thread takes the first waiting query,
+    waits at most `max_wait_ms` for others to join it (up to `max_batch_size`) and runs them through
+    `search_batch`, i.e. a single embedding call and one matrix-scoring pass for the whole batch.
+    Arguments:
+        search_system: Indexed search system used to answer the queries
+        max_batch_size: Maximum number of queries searched together
+        max_wait_ms: Time window during which a batch collects queries
+        max_queue: Maximum number of waiting queries, further submissions raise `ServiceOverloaded`
+    """
+    def __init__(
+        self,
+        search_system: HybridSearchSystem,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_queue: int = 1024,
+    ):
+        self.search_system = search_system
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Optional[Tuple[str, int, Future]]]" = queue.Queue(maxsize=max_queue)
+        self._dispatcher: Optional[threading.Thread] = None
+        self.batches_processed = 0
+        self.queries_processed = 0
+
+    def start(self) -> "RequestCoalescer":
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def stop(self):
+        if self._dispatcher is not None:
+            self._queue.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
+
+    def submit(self, query: str, top_k: int = 10) -> Future:
+        """Queue a query and return a future resolved with its results"""
+        future = Future()
+        try:
+            self._queue.put_nowait((query, top_k, future))
+        except queue.Full:
+            raise ServiceOverloaded(f"Search queue is full ({self._queue.maxsize} waiting queries)")
+        return future
+
+    def search(self, query: str, top_k: int = 10, timeout: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Results of a query, raises `concurrent.futures.TimeoutError` after `timeout` seconds, the query is then not searched if still queued"""
+        future = self.submit(query, top_k)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.queries_processed / self.batches_processed if self.batches_processed else 0
+
+    def _collect_batch(self) -> Optional[list]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Serve what was collected, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+
+            # Queries asking for a different depth are searched in separate batches,
+            # queries cancelled while waiting (their request timed out) are skipped
+            by_top_k = defaultdict(list)
+            for query, top_k, future in batch:
+                if future.set_running_or_notify_cancel():
+                    by_top_k[top_k].append((query, future))
+
+            for top_k, items in by_top_k.items():
+                try:
+                    results = self.search_system.search_batch([query for query, _ in items], top_k)
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+
+            self.batches_processed += 1
+            self.queries_processed += len(batch)
@@ -0,0 +1,358 @@
+import gc, itertools, multiprocessing, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing.connection import Connection, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from search import HybridSearchSystem
+
+SharedArray = Tuple[SharedMemory, Any, str]
+
+def _share_array(obj: Any, name: str, shared: List[SharedArray]):
+    """Copy the array `obj.<name>` into a shared memory block and replace it with a read-only view over it"""
+    array = getattr(obj, name)
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    view[...] = array
+    view.flags.writeable = False
+    setattr(obj, name, view)
+    shared.append((block, obj, name))
+
+def _share_attributes(obj: Any, shared: List[SharedArray], depth: int = 2):
+    """Share the numpy arrays held by `obj` and by its attributes (e.g. sparse matrices)"""
+    if depth == 0 or not hasattr(obj, "__dict__"):
+        return
+    for name, value in list(vars(obj).items()):
+        if isinstance(value, np.memmap):
+            continue  # Already backed by a file mapping shared between processes
+        if isinstance(value, np.ndarray):
+            if value.dtype != object and value.nbytes > 0:
+                _share_array(obj, name, shared)
+        elif hasattr(value, "__dict__") and not callable(value):
+            _share_attributes(value, shared, depth - 1)
+
+def share_indexes(search_system: HybridSearchSystem) -> List[SharedArray]:
+    """Move the in-memory index arrays of both retrievers into shared memory.
+    Forked workers then map the same physical pages instead of copying them on first touch.
+    Returns the shared arrays, to be given back to `release_indexes` once the workers are stopped."""
+    shared = []
+    for retriever in (search_system.dense_retriever, search_system.sparse_retriever):
+        _share_attributes(retriever, shared)
+    return shared
+
+def release_indexes(shared: List[SharedArray]):
+    """Copy shared arrays back to private memory and free their shared memory blocks"""
+    for block, obj, name in shared:
+        setattr(obj, name, np.array(getattr(obj, name)))
+        block.close()
+        block.unlink()
+
+def _worker_loop(search_system: HybridSearchSystem, requests: Connection, responses: Connection):
+    while True:
+        try:
+            item = requests.recv()
+        except EOFError:
+            break
+        if item is None:
+            break
+        request_id, query, top_k = item
+        start = time.perf_counter()
+        try:
+            results, error = search_system.search(query, top_k), None
+        except Exception as e:
+            results, error = None, repr(e)
+        responses.send((request_id, results, error, time.perf_counter() - start))
+
+class _Worker:
+    """A worker process with its own request and response pipes.
+    No lock is shared between workers, so a killed worker cannot leave the others unable to read or answer requests."""
+
+    def __init__(self, process: multiprocessing.Process, requests: Connection, responses: Connection):
+        self.process = process
+        self.requests = requests
+        self.responses = responses
+        self.send_lock = threading.Lock()
+        # Requests sent and not answered yet, in the order the worker processes them
+        self.pending: "OrderedDict[int, Tuple[int, str, int]]" = OrderedDict()
+        self.closed = False
+
+class SearchWorkerPool:
+    """Pool of pre-forked worker processes, each query being sent to the worker with the fewest pending requests.
+
+    The search system is indexed once in the parent; workers are forked afterwards so they inherit the
+    indexes without re-embedding the corpus. Large arrays are moved to shared memory before forking,
+    so the indexes are mapped once for all workers instead of being duplicated by copy-on-write.
+    Every worker reads its own pipe: when one dies, the request it was processing fails, the worker is forked again
+    and its other pending requests are sent to the new process. Workers are also checked every `check_interval` seconds.
+    Arguments:
+        search_system: An already indexed search system
+        num_workers: Number of worker processes, defaults to the number of CPUs
+        max_pending: Maximum number of unanswered requests, `submit` blocks when they are reached
+        share_memory: Move index arrays to shared memory before forking
+        check_interval: Seconds between two liveness checks of the workers
+    """
+    def __init__(
+        self,
+        search_system: HybridSearchSystem,
+        num_workers: Optional[int] = None,
+        max_pending: int = 1024,
+        share_memory: bool = True,
+        check_interval: float = 1.0,
+    ):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("SearchWorkerPool requires the 'fork' start method")
+        self.search_system = search_system
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.share_memory = share_memory
+        self.check_interval = check_interval
+        self._context = multiprocessing.get_context("fork")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._workers: List[_Worker] = []
+        self._shared: List[SharedArray] = []
+        self._futures: Dict[int, Future] = {}
+        # Guards the workers, their pending requests and the futures
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._collector: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._worker_counts = [0] * self.num_workers
+        self._worker_busy = [0.0] * self.num_workers
+        self._worker_restarts = [0] * self.num_workers
+        self._started_at = 0.0
+        self._closing = False
+
+    def start(self) -> "SearchWorkerPool":
+        if self.share_memory:
+            self._shared = share_indexes(self.search_system)
+        self._closing = False
+        self._stop.clear()
+        self._workers = [self._spawn() for _ in range(self.num_workers)]
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        self._started_at = time.perf_counter()
+        return self
+
+    def submit(self, query: str, top_k: int = 10) -> Future:
+        """Send a query to the least busy worker and return a future resolved with its results"""
+        self._slots.acquire()
+        request_id = next(self._request_ids)
+        item = (request_id, query, top_k)
+        future = Future()
+        with self._lock:
+            if self._closing:
+                self._slots.release()
+                raise RuntimeError("The worker pool is closed")
+            self._futures[request_id] = future
+            worker = min(self._workers, key=lambda worker: len(worker.pending))
+            worker.pending[request_id] = item
+        self._send(worker, [item])
+        return future
+
+    def search(self, query: str, top_k: int = 10, timeout: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Results of a query, raises TimeoutError when they do not arrive within `timeout` seconds"""
+        return self.search_many([query], top_k, timeout)[0]
+
+    def search_many(self, queries: List[str], top_k: int = 10, timeout: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        """Results of several queries, raises TimeoutError when they do not all arrive within `timeout` seconds"""
+        futures = [self.submit(query, top_k) for query in queries]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            return [future.result(None if deadline is None else max(0.0, deadline - time.monotonic())) for future in futures]
+        finally:
+            # Results arriving after a timeout are dropped
+            for future in futures:
+                future.cancel()
+
+    def get_worker_stats(self) -> List[Dict[str, Any]]:
+        """Per-worker query counts and throughput since the pool started"""
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0
+        return [
+            {
+                'worker_id': worker_id,
+                'pid': worker.process.pid,
+                'queries_processed': count,
+                'restarts': restarts,
+                'busy_time_s': busy,
+                'queries_per_second': count / elapsed if elapsed > 0 else 0,
+                'utilization': busy / elapsed if elapsed > 0 else 0,
+            }
+            for worker_id, (worker, count, restarts, busy) in enumerate(
+                zip(self._workers, self._worker_counts, self._worker_restarts, self._worker_busy)
+            )
+        ]
+
+    def close(self, timeout: float = 5.0):
+        """Stop the workers once their pending requests are answered, those still running after `timeout` seconds are killed"""
+        with self._lock:
+            self._closing = True
+            workers = list(self._workers)
+        for worker in workers:
+            self._send(worker, [None])
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join(1.0)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        self._stop.set()
+        if self._collector is not None:
+            self._collector.join()
+        for worker in workers:
+            worker.requests.close()
+            worker.responses.close()
+        with self._lock:
+            unanswered = list(self._futures)
+        for request_id in unanswered:
+            self._resolve(request_id, exception=RuntimeError("The worker pool was closed before answering"))
+        release_indexes(self._shared)
+        self._workers, self._shared = [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _spawn(self) -> _Worker:
+        request_reader, request_writer = self._context.Pipe(duplex=False)
+        response_reader, response_writer = self._context.Pipe(duplex=False)
+        # Objects alive now are never collected in the worker: keeps the GC from touching
+        # (and so copying) their pages after the fork
+        gc.freeze()
+        try:
+            process = self._context.Process(
+                target=_worker_loop,
+                args=(self.search_system, request_reader, response_writer),
+                daemon=True,
+            )
+            process.start()
+        finally:
+            gc.unfreeze()
+        # Only the worker keeps its ends, so that its death closes the response pipe
+        request_reader.close()
+        response_writer.close()
+        return _Worker(process, request_writer, response_reader)
+
+    def _send(self, worker: _Worker, items: list):
+        try:
+            with worker.send_lock:
+                for item in items:
+                    worker.requests.send(item)
+        except OSError:
+            pass  # The worker died, its pending requests are sent again to its replacement
+
+    def _collect(self):
+        while not self._stop.is_set():
+            with self._lock:
+                readers = {worker.responses: worker_id for worker_id, worker in enumerate(self._workers) if not worker.closed}
+            if not readers:
+                self._stop.wait(self.check_interval)
+                continue
+            for connection in wait(list(readers), timeout=self.check_interval):
+                worker_id = readers[connection]
+                try:
+                    request_id, results, error, elapsed = connection.recv()
+                except (EOFError, OSError):
+                    self._replace(worker_id)
+                    continue
+                with self._lock:
+                    self._workers[worker_id].pending.pop(request_id, None)
+                self._worker_counts[worker_id] += 1
+                self._worker_busy[worker_id] += elapsed
+                if error is not None:
+                    self._resolve(request_id, exception=RuntimeError(f"Search worker {worker_id} failed: {error}"))
+                else:
+                    self._resolve(request_id, results)
+            for worker_id, worker in enumerate(list(self._workers)):
+                if not worker.closed and not worker.process.is_alive():
+                    self._replace(worker_id)
+
+    def _resolve(self, request_id: int, results: Any = None, exception: Optional[BaseException] = None):
+        with self._lock:
+            future = self._futures.pop(request_id, None)
+        if future is None:
+            return
+        self._slots.release()
+        # Futures cancelled after a timeout are dropped
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(results)
+
+    def _replace(self, worker_id: int):
+        """Fork a dead worker again: its first pending request, being processed when it died, fails and the others are sent to the new process"""
+        worker = self._workers[worker_id]
+        worker.process.join(1.0)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        with self._lock:
+            worker.closed = True
+            if self._closing:
+                return
+            pending = list(worker.pending.values())
+            replacement = self._spawn()
+            replacement.pending.update((item[0], item) for item in pending[1:])
+            self._workers[worker_id] = replacement
+            self._worker_restarts[worker_id] += 1
+        worker.requests.close()
+        worker.responses.close()
+        exitcode = worker.process.exitcode
+        print(f"Search worker {worker_id} died (exit code {exitcode}), restarting it")
+        for request_id, _, _ in pending[:1]:
+            self._resolve(request_id, exception=RuntimeError(f"Search worker {worker_id} died (exit code {exitcode})"))
+        self._send(replacement, pending[1:])
+
+
+if __name__ == "__main__":
+    import argparse, csv
+    from tabulate import tabulate
+    from documents import preprocess_documents
+    from helpers.config import EmbedderConfig, HybridSearchConfig
+    from os import getenv
+
+    parser = argparse.ArgumentParser(description="Serve queries from a pool of pre-forked search workers")
+    parser.add_argument("--csv", default="../data.csv", help="CSV file to index")
+    parser.add_argument("--columns", nargs="+", default=["Question", "Answer"], help="Columns concatenated as document text")
+    parser.add_argument("--encoding", default="iso-8859-2")
+    parser.add_argument("--queries", help="File with one query per line, defaults to stdin")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--max-pending", type=int, default=1024)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--model", default=getenv("EMBEDDING_MODEL"))
+    parser.add_argument("--embedding-module", default="local-dmr")
+    parser.add_argument("--fusion-method", default="rrf", choices=["rrf", "weighted_sum"])
+    args = parser.parse_args()
+
+    with open(args.csv, encoding=args.encoding, newline="") as f:
+        raw_documents = [" ".join(row[column] for column in args.columns) for row in csv.DictReader(f)]
+
+    search_system = HybridSearchSystem(
+        config=HybridSearchConfig(fusion_method=args.fusion_method),
+        embedder_config=EmbedderConfig(model_name=args.model, embedding_module=args.embedding_module),
+    )
+    search_system.index_documents(preprocess_documents(raw_documents))
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        import sys
+        queries = [line.strip() for line in sys.stdin if line.strip()]
+
+    with SearchWorkerPool(search_system, args.workers, args.max_pending) as pool:
+        start = time.perf_counter()
+        pool.search_many(queries, args.top_k)
+        elapsed = time.perf_counter() - start
+        print(tabulate(pool.get_worker_stats(), headers="keys", tablefmt="github"))
+    print(f"\n{len(queries)} queries in {elapsed:.2f}s ({len(queries) / elapsed:.1f} queries/s)")
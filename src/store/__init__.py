@@ -1,3 +1,7 @@
 from .redis import RedisController, to_binary
+from .sharded import ShardedRedisController, create_controller
+from .query import build_text_query, escape_term
+from .fake import FakeRedisController, FakeRedisClient, get_memory_client
 
-__all__ = ["RedisController", "to_binary"]
\ No newline at end of file
+__all__ = ["RedisController", "ShardedRedisController", "create_controller", "to_binary", "build_text_query", "escape_term",
+           "FakeRedisController", "FakeRedisClient", "get_memory_client"]
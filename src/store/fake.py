@@ -0,0 +1,366 @@
+import fnmatch, math, re, threading, time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from documents import Analyzer
+from .redis import RedisController
+
+# Variants of a query built by `build_text_query`: `term`, `%term%` (fuzzy, one % per edit) or `term*` (prefix)
+_VARIANT_PATTERN = re.compile(r"(%*)((?:\\.|[^|()%*\\\s])+)%*(\*?)")
+# `KNN <k> @<field>` clause of the vector queries
+_KNN_PATTERN = re.compile(r"KNN (\d+) @(\w+)")
+
+def _to_bytes(value: Any) -> bytes:
+    # Redis stores everything as bytes, numbers as their decimal representation
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class FakePipeline:
+    """Commands are queued and run on `execute`, like a non-transactional pipeline"""
+
+    def __init__(self, client: "FakeRedisClient"):
+        self._client = client
+        self._commands: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        getattr(self._client, name)  # Unknown commands fail when queued, not on execute
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+class FakeRedisClient:
+    """In-process stand-in for the subset of `redis.Redis` used by the project: strings with expiry, hashes,
+    key scans and pipelines. Values are returned as bytes, like a client created with `decode_responses=False`.
+    RediSearch indexes created through `FakeRedisController` live in the client, so controllers sharing it share them."""
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._expiry: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self.indexes: Dict[str, Dict[str, Any]] = {}
+        # Incremented by every write to a hash, search caches are rebuilt when it changes
+        self.version = 0
+
+    def _live(self, key: str) -> bool:
+        expiry = self._expiry.get(key)
+        if expiry is not None and expiry <= time.monotonic():
+            if isinstance(self._data.pop(key, None), dict):
+                self.version += 1
+            self._expiry.pop(key, None)
+        return key in self._data
+
+    @staticmethod
+    def _key(key) -> str:
+        return key.decode() if isinstance(key, bytes) else str(key)
+
+    def get(self, key) -> Optional[bytes]:
+        key = self._key(key)
+        with self._lock:
+            value = self._data.get(key) if self._live(key) else None
+            return value if isinstance(value, bytes) else None
+
+    def mget(self, keys) -> List[Optional[bytes]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ex: Optional[float] = None) -> bool:
+        key = self._key(key)
+        with self._lock:
+            if isinstance(self._data.get(key), dict):
+                self.version += 1
+            self._data[key] = _to_bytes(value)
+            if ex is None:
+                self._expiry.pop(key, None)
+            else:
+                self._expiry[key] = time.monotonic() + ex
+        return True
+
+    def setex(self, key, time_seconds: float, value) -> bool:
+        return self.set(key, value, ex=time_seconds)
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            deleted = 0
+            for key in map(self._key, keys):
+                if self._live(key):
+                    if isinstance(self._data.pop(key), dict):
+                        self.version += 1
+                    self._expiry.pop(key, None)
+                    deleted += 1
+            return deleted
+
+    def exists(self, *keys) -> int:
+        with self._lock:
+            return sum(self._live(key) for key in map(self._key, keys))
+
+    def hset(self, key, field=None, value=None, mapping: Optional[Dict[str, Any]] = None) -> int:
+        key = self._key(key)
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        with self._lock:
+            stored = self._data.get(key) if self._live(key) else None
+            if not isinstance(stored, dict):
+                stored = self._data[key] = {}
+            added = sum(self._key(name) not in stored for name in items)
+            stored.update({self._key(name): _to_bytes(item) for name, item in items.items()})
+            self.version += 1
+            return added
+
+    def hget(self, key, field) -> Optional[bytes]:
+        key = self._key(key)
+        with self._lock:
+            stored = self._data.get(key) if self._live(key) else None
+            return stored.get(self._key(field)) if isinstance(stored, dict) else None
+
+    def hgetall(self, key) -> Dict[bytes, bytes]:
+        key = self._key(key)
+        with self._lock:
+            stored = self._data.get(key) if self._live(key) else None
+            return {name.encode(): value for name, value in stored.items()} if isinstance(stored, dict) else {}
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[bytes]:
+        with self._lock:
+            keys = [key for key in list(self._data) if self._live(key) and (match is None or fnmatch.fnmatchcase(key, match))]
+        return iter([key.encode() for key in keys])
+
+    def close(self):
+        pass  # No connection to release, the store is shared by the whole process
+
+    def flushdb(self) -> bool:
+        with self._lock:
+            self._data.clear()
+            self._expiry.clear()
+            self.indexes.clear()
+            self.version += 1
+        return True
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> FakePipeline:
+        return FakePipeline(self)
+
+    def hashes(self, prefix: str) -> List[Tuple[str, Dict[str, bytes]]]:
+        """Live hashes under a key prefix, as an index would see them"""
+        with self._lock:
+            return [
+                (key, dict(value)) for key, value in list(self._data.items())
+                if key.startswith(prefix) and isinstance(value, dict) and self._live(key)
+            ]
+
+class FakeRedisController(RedisController):
+    """In-process stand-in for `RedisController`, for hermetic tests and benchmarks: documents are hashes of a `FakeRedisClient`
+    and the RediSearch subset used by the retrievers is emulated:
+    - KNN queries, exact (no HNSW approximation) with COSINE, IP or L2 (squared) distances
+    - full-text queries built by `build_text_query` (exact, fuzzy and prefix terms), scored with BM25STD
+    Searches scan a cached copy of the indexed fields, rebuilt after writes.
+    Arguments:
+        client: Store to use, controllers sharing a client share documents and indexes. Defaults to a new empty store.
+        analyzer: Tokenizes the indexed text, defaults to the analyzer of the in-memory BM25
+    """
+
+    def __init__(self, client: Optional[FakeRedisClient] = None, analyzer: Optional[Analyzer] = None, k1: float = 1.2, b: float = 0.75):
+        self.redis_client = client or FakeRedisClient()
+        self.analyzer = analyzer or Analyzer()
+        self.k1 = k1
+        self.b = b
+        self._caches: Dict[Tuple[str, str], Tuple[int, Any]] = {}
+        self._cache_lock = threading.Lock()
+
+    def create_vector_index(self, index_name: str, index_prefix: str, vector_dim: int, distance_metric="COSINE", vector_field: str = "embedding"):
+        self._create_index(index_name, {
+            "prefix": index_prefix,
+            "vector_field": vector_field,
+            "vector_dim": vector_dim,
+            "distance_metric": distance_metric.upper(),
+        })
+
+    def create_text_index(self, index_name: str, index_prefix: str):
+        self._create_index(index_name, {"prefix": index_prefix, "vector_field": None})
+
+    def _create_index(self, index_name: str, definition: Dict[str, Any]):
+        if index_name in self.redis_client.indexes:
+            print("Index creation error: Index already exists")
+            return
+        self.redis_client.indexes[index_name] = definition
+
+    def _index(self, index_name: str) -> Dict[str, Any]:
+        if index_name not in self.redis_client.indexes:
+            raise KeyError(f"{index_name}: no such index")
+        return self.redis_client.indexes[index_name]
+
+    def _cached(self, index_name: str, field: str, build):
+        # Cached data of an index, rebuilt when the store changed since it was built
+        with self._cache_lock:
+            version = self.redis_client.version
+            cached = self._caches.get((index_name, field))
+            if cached is None or cached[0] != version:
+                cached = self._caches[(index_name, field)] = (version, build())
+            return cached[1]
+
+    def _vector_data(self, index_name: str, index: Dict[str, Any]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        # Keys, vectors and norms of the documents of a vector index
+        def build():
+            keys, vectors = [], []
+            for key, mapping in self.redis_client.hashes(index["prefix"]):
+                vector = mapping.get(index["vector_field"])
+                # RediSearch skips documents whose vector does not match the index
+                if vector is not None and len(vector) == 4 * index["vector_dim"]:
+                    keys.append(key)
+                    vectors.append(np.frombuffer(vector, dtype='<f4'))
+            matrix = np.stack(vectors) if vectors else np.empty((0, index["vector_dim"]), dtype=np.float32)
+            return keys, matrix, np.linalg.norm(matrix, axis=1)
+        return self._cached(index_name, index["vector_field"], build)
+
+    def _text_data(self, index_name: str, index: Dict[str, Any]) -> Tuple[List[str], Dict[str, Dict[int, int]], List[int], float]:
+        # Keys, postings ({term: {document position: tf}}), lengths and average length of the documents of an index
+        def build():
+            keys, postings, lengths = [], {}, []
+            for key, mapping in self.redis_client.hashes(index["prefix"]):
+                terms = Counter(self.analyzer(mapping.get("content", b"").decode(errors="ignore")))
+                for term, tf in terms.items():
+                    postings.setdefault(term, {})[len(keys)] = tf
+                keys.append(key)
+                lengths.append(sum(terms.values()))
+            return keys, postings, lengths, (sum(lengths) / len(lengths) if lengths else 0.0)
+        return self._cached(index_name, "content", build)
+
+    def index_info(self, index_name: str) -> Dict[str, float]:
+        """FT.INFO-like figures of an index, sizes are those of the fake's own structures"""
+        try:
+            index = self._index(index_name)
+        except Exception as e:
+            print(f"Index info error: {e}")
+            return {}
+        keys, postings, _, _ = self._text_data(index_name, index)
+        num_records = sum(len(documents) for documents in postings.values())
+        figures = {
+            "num_docs": float(len(keys)),
+            "num_terms": float(len(postings)),
+            "num_records": float(num_records),
+            "records_per_doc_avg": num_records / len(keys) if keys else 0.0,
+            # One (document, frequency) pair of 32-bit integers per record
+            "inverted_sz_mb": num_records * 8 / 2 ** 20,
+        }
+        if index["vector_field"] is not None:
+            _, matrix, norms = self._vector_data(index_name, index)
+            figures["vector_index_sz_mb"] = (matrix.nbytes + norms.nbytes) / 2 ** 20
+        return figures
+
+    def search_vector(self, index_name: str, query_vector: list[float], top_k=10, vector_field: str = "embedding"):
+        try:
+            index = self._index(index_name)
+            if vector_field != index["vector_field"]:
+                raise KeyError(f"{vector_field}: no such vector field in {index_name}")
+        except Exception as e:
+            print(f"Vector search error: {e}")
+            return []
+
+        keys, matrix, norms = self._vector_data(index_name, index)
+        if not keys:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        metric = index["distance_metric"]
+        if metric == "L2":
+            distances = ((matrix - query) ** 2).sum(axis=1)
+        elif metric == "IP":
+            distances = 1.0 - matrix @ query
+        else:
+            denominators = norms * (np.linalg.norm(query) or 1.0)
+            denominators[denominators == 0] = 1.0
+            distances = 1.0 - (matrix @ query) / denominators
+        top_k = min(top_k, len(keys))
+        best = np.argpartition(distances, top_k - 1)[:top_k]
+        best = best[np.lexsort((best, distances[best]))]
+        # RediSearch returns the KNN score as a string field
+        return [(keys[position], str(float(distances[position]))) for position in best]
+
+    def search_text(
+        self,
+        index_name: str,
+        query_text: str,
+        top_k: int = 10,
+        fuzziness: int = 0,
+        scorer: str = "BM25STD",
+        prefix: bool = False,
+        max_terms: int = 16,
+    ):
+        search_query = self._text_query(query_text, top_k, fuzziness, scorer, prefix, max_terms)
+        if search_query is None:
+            return []
+        return self._search_text_query(index_name, search_query)
+
+    def _search_text_query(self, index_name: str, search_query):
+        try:
+            index = self._index(index_name)
+        except Exception as e:
+            print(f"Text search error: {e} (query: {search_query.query_string()})")
+            return []
+
+        keys, postings, lengths, avg_length = self._text_data(index_name, index)
+        matched = set()
+        for fuzzy, term, is_prefix in _VARIANT_PATTERN.findall(search_query.query_string().partition(":")[2]):
+            term = re.sub(r"\\(.)", r"\1", term).lower()
+            if is_prefix:
+                matched.update(candidate for candidate in postings if candidate.startswith(term))
+            elif fuzzy:
+                matched.update(candidate for candidate in postings if _edit_distance(term, candidate, len(fuzzy)) <= len(fuzzy))
+            elif term in postings:
+                matched.add(term)
+
+        scores: Dict[int, float] = {}
+        for term in matched:
+            documents = postings[term]
+            idf = math.log(1 + (len(keys) - len(documents) + 0.5) / (len(documents) + 0.5))
+            for position, tf in documents.items():
+                norm = self.k1 * ((1 - self.b) + self.b * lengths[position] / (avg_length or 1.0))
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:search_query._num]
+        return [(keys[position], score) for position, score in best]
+
+    def _search_pipeline(self, index_name: str, searches: list) -> list:
+        # Raw FT.SEARCH replies, shaped like those of a real search pipeline, so that `search_hybrid` parses them the same way
+        replies = []
+        for query, params in searches:
+            if params and "vec" in params:
+                top_k, vector_field = _KNN_PATTERN.search(query.query_string()).groups()
+                query_vector = np.frombuffer(params["vec"], dtype="<f4")
+                results = self.search_vector(index_name, query_vector, int(top_k), vector_field)
+                entries = [[key.encode(), [b"score", score.encode()]] for key, score in results]
+            else:
+                results = self._search_text_query(index_name, query)
+                if query._with_scores:
+                    entries = [[key.encode(), str(score).encode(), []] for key, score in results]
+                else:
+                    entries = [[key.encode(), []] for key, _ in results]
+            replies.append([len(entries)] + [item for entry in entries for item in entry])
+        return replies
+
+# In-process stores of `create_controller(host="memory")`, one per database like a real server
+_memory_clients: Dict[int, FakeRedisClient] = {}
+_memory_lock = threading.Lock()
+
+def get_memory_client(db: int = 0) -> FakeRedisClient:
+    """Process-wide fake store of a database, shared by every controller and cache created with the 'memory' host"""
+    with _memory_lock:
+        if db not in _memory_clients:
+            _memory_clients[db] = FakeRedisClient()
+        return _memory_clients[db]
@@ -0,0 +1,59 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+from documents import Analyzer
+
+# Characters with a meaning in the RediSearch query syntax
+_SPECIAL_CHARACTERS = re.compile(r"([,.<>{}\[\]\"':;!@#$%^&*()\-+=~|/\\\s])")
+
+_default_analyzer = Analyzer()
+
+def escape_term(term: str) -> str:
+    """Escape RediSearch query syntax characters of a term"""
+    return _SPECIAL_CHARACTERS.sub(r"\\\1", term)
+
+def fuzzy_distance(term: str, fuzziness: int) -> int:
+    """Levenshtein distance allowed for a term: none under 4 characters, then one more every 4 characters,
+    capped by `fuzziness`, so that short terms do not match most of the vocabulary"""
+    return min(fuzziness, len(term) // 4)
+
+@lru_cache(maxsize=4096)
+def build_text_query(
+    query_text: str,
+    field: str = "content",
+    fuzziness: int = 0,
+    prefix: bool = False,
+    max_terms: int = 16,
+    max_expanded_terms: int = 4,
+    min_prefix_length: int = 3,
+    analyzer: Optional[Analyzer] = None,
+) -> Optional[str]:
+    """Build a RediSearch full-text query matching any of the query terms (OR), scored by the index scorer.
+    The text is tokenized with the analyzer shared with the in-memory BM25, terms are deduplicated, escaped and capped at `max_terms`.
+    The `max_expanded_terms` longest terms are expanded, as expansions multiply the posting lists to read:
+    with `%term%` fuzzy matching (see `fuzzy_distance`) and/or `term*` prefix matching (terms of `min_prefix_length` or more).
+    Returns None when no term is left (e.g. only stop words or punctuation), such queries need no round trip.
+    Built queries are cached."""
+    if fuzziness < 0 or fuzziness > 3:
+        raise ValueError("Fuzziness must be between 0 and 3")
+
+    terms = list(dict.fromkeys((analyzer or _default_analyzer).tokenize(query_text)))[:max_terms]
+    if not terms:
+        return None
+
+    expanded = set(sorted(terms, key=len, reverse=True)[:max_expanded_terms]) if fuzziness or prefix else set()
+    clauses = []
+    for term in terms:
+        escaped = escape_term(term)
+        if term not in expanded:
+            clauses.append(escaped)
+            continue
+        variants = [escaped]
+        distance = fuzzy_distance(term, fuzziness)
+        if distance:
+            variants.append(f"{'%' * distance}{escaped}{'%' * distance}")
+        if prefix and len(term) >= min_prefix_length:
+            variants.append(f"{escaped}*")
+        clauses.append(variants[0] if len(variants) == 1 else f"({'|'.join(variants)})")
+    return f"@{field}:({'|'.join(clauses)})"
@@ -1,10 +1,23 @@
-import redis, struct
+import redis
+import numpy as np
 from redis.commands.search.query import Query
 from redis.commands.search.field import VectorField, TextField
 from redis.commands.search.index_definition import IndexDefinition, IndexType
+from .query import build_text_query
+
+# Numeric FT.INFO fields reported by `index_info`, sizes are in MB
+INDEX_INFO_FIELDS = (
+    "num_docs", "num_terms", "num_records", "records_per_doc_avg", "bytes_per_record_avg",
+    "inverted_sz_mb", "vector_index_sz_mb", "offset_vectors_sz_mb", "doc_table_size_mb",
+    "sortable_values_size_mb", "key_table_size_mb", "total_index_memory_sz_mb",
+)
 
 def to_binary(vector):
-    return struct.pack('>' + 'f'*len(vector), *vector)
+    # RediSearch FLOAT32 vectors are little-endian
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
 
 class RedisController:
     def __init__(self, host:str="localhost", port:int=6379, db:int=0):
@@ -25,9 +38,48 @@ class RedisController:
     def add_document(self, key:str, mapping:dict[str, str]):
         self.redis_client.hset(key, mapping=mapping)
 
-    def search_vector(self, index_name:str, query_vector:list[float], top_k=10):
+    def add_documents(self, items:list[tuple[str, dict[str, str]]], batch_size:int=1000):
+        # Write hashes in pipelined batches, one round trip per batch
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for position, (key, mapping) in enumerate(items, 1):
+            pipeline.hset(key, mapping=mapping)
+            if position % batch_size == 0:
+                pipeline.execute()
+        pipeline.execute()
+
+    def get_field(self, keys:list[str], field:str) -> list:
+        # Read one field of several hashes in a single round trip
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hget(key, field)
+        return pipeline.execute()
+
+    def rebalance(self, index_prefix:str) -> int:
+        # A single node always owns every key, nothing to move
+        return 0
+
+    @staticmethod
+    def _vector_query(top_k:int, vector_field:str="embedding") -> Query:
+        return (
+            Query(f'*=>[KNN {top_k} @{vector_field} $vec AS score]')
+            .sort_by("score")
+            .paging(0, top_k)
+            .dialect(2)
+        )
+
+    @staticmethod
+    def _text_query(query_text:str, top_k:int, fuzziness:int, scorer:str, prefix:bool, max_terms:int):
+        query = build_text_query(query_text, fuzziness=fuzziness, prefix=prefix, max_terms=max_terms)
+        if query is None:
+            return None
+        search_query = Query(query).paging(0, top_k)
+        if scorer:
+            search_query = search_query.scorer(scorer).with_scores()
+        return search_query
+
+    def search_vector(self, index_name:str, query_vector:list[float], top_k=10, vector_field:str="embedding"):
         # Search for similar vectors using RediSearch
-        query = f'*=>[KNN {top_k} @embedding $vec AS score]'
+        query = self._vector_query(top_k, vector_field)
         params = {"vec": to_binary(query_vector)}
         
         try:
@@ -44,32 +96,103 @@ class RedisController:
         top_k: int = 10,
         fuzziness: int = 0,
         scorer: str = "BM25STD",
+        prefix: bool = False,
+        max_terms: int = 16,
     ):
-        # Search for similar text using RediSearch's fuzzy matching
-        if fuzziness < 0 or fuzziness > 3:
-            raise ValueError("Fuzziness must be between 0 and 3")
-        
-        fuzzy_wildcard = "" #if fuzziness == 0 else "%"*fuzziness
-        query = f'@content:({fuzzy_wildcard}{query_text}{fuzzy_wildcard})'
-        
-        search_query = Query(query).paging(0, top_k)
-        if scorer:
-            search_query = search_query.scorer(scorer).with_scores()
+        # Search for similar text using RediSearch's fuzzy and prefix matching
+        search_query = self._text_query(query_text, top_k, fuzziness, scorer, prefix, max_terms)
+        if search_query is None:
+            return []
 
         try:
             results = self.redis_client.ft(index_name).search(search_query)
             return [(res.id, res.score) for res in results.docs]
         except Exception as e:
-            print(f"Text search error: {e}")
+            print(f"Text search error: {e} (query: {search_query.query_string()})")
             return []
 
-    def create_vector_index(self, index_name:str, index_prefix:str, vector_dim:int, distance_metric="COSINE"):
+    def search_hybrid(
+        self,
+        index_name: str,
+        query_texts: list[str],
+        query_vectors: list[list[float]],
+        top_k: int = 10,
+        text_top_k: int = None,
+        fuzziness: int = 0,
+        scorer: str = "BM25STD",
+        prefix: bool = False,
+        max_terms: int = 16,
+        vector_field: str = "embedding",
+    ) -> tuple[list, list]:
+        # KNN and full-text searches of several queries against one index holding both fields, pipelined in a single round trip
+        text_top_k = top_k if text_top_k is None else text_top_k
+        text_queries = [self._text_query(text, text_top_k, fuzziness, scorer, prefix, max_terms) for text in query_texts]
+        vector_query = self._vector_query(top_k, vector_field)
+
+        searches = [(vector_query, {"vec": to_binary(query_vector)}) for query_vector in query_vectors]
+        searches += [(text_query, None) for text_query in text_queries if text_query is not None]
+        try:
+            replies = iter(self._search_pipeline(index_name, searches))
+        except redis.exceptions.RedisError as e:
+            print(f"Hybrid search error: {e}")
+            return [[] for _ in query_vectors], [[] for _ in query_texts]
+
+        vector_results = [self._parse_search_reply(next(replies), with_scores=False) for _ in query_vectors]
+        text_results = [
+            self._parse_search_reply(next(replies), with_scores=text_query._with_scores) if text_query is not None else []
+            for text_query in text_queries
+        ]
+        return vector_results, text_results
+
+    def _search_pipeline(self, index_name: str, searches: list[tuple[Query, dict]]) -> list:
+        # Replies of several FT.SEARCH commands, pipelined in a single round trip
+        pipeline = self.redis_client.ft(index_name).pipeline(transaction=False)
+        for query, params in searches:
+            pipeline.search(query, query_params=params)
+        return pipeline.execute()
+
+    @staticmethod
+    def _parse_search_reply(reply, with_scores: bool, score_field: str = "score") -> list[tuple]:
+        # Pipelined searches get raw FT.SEARCH replies, [total, id, score (WITHSCORES only), [field, value, ...], id, ...],
+        # instead of the parsed Result of `ft().search`. Results are (id, score) like `search_vector` / `search_text`:
+        # the WITHSCORES score as a float, else the `score_field` value (the KNN distance) as a string, None without one
+        if hasattr(reply, "docs"):
+            return [(res.id, getattr(res, "score", None)) for res in reply.docs]
+        results = []
+        step = 3 if with_scores else 2
+        for position in range(1, len(reply), step):
+            key = _decode(reply[position])
+            if with_scores:
+                score = float(reply[position + 1])
+            else:
+                fields = reply[position + 1] or []
+                values = dict(zip(map(_decode, fields[::2]), fields[1::2]))
+                score = _decode(values[score_field]) if score_field in values else None
+            results.append((key, score))
+        return results
+
+    def index_info(self, index_name: str) -> dict[str, float]:
+        # FT.INFO memory and size figures of an index, empty if it cannot be read
+        try:
+            info = self.redis_client.ft(index_name).info()
+        except Exception as e:
+            print(f"Index info error: {e}")
+            return {}
+        figures = {}
+        for field in INDEX_INFO_FIELDS:
+            try:
+                figures[field] = float(info[field])
+            except (KeyError, TypeError, ValueError):
+                continue
+        return figures
+
+    def create_vector_index(self, index_name:str, index_prefix:str, vector_dim:int, distance_metric="COSINE", vector_field:str="embedding"):
         # Create RediSearch index for vector search
         fields = (
             TextField("metadata"),
             TextField("content"), 
             VectorField(
-                "embedding", 
+                vector_field, 
                 "HNSW", {
                     "TYPE": "FLOAT32", 
                     "DIM": vector_dim, 
@@ -0,0 +1,205 @@
+import hashlib, heapq
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+
+from .redis import RedisController, INDEX_INFO_FIELDS
+
+def parse_node(node: Union[str, Tuple[str, int]], db: int = 0) -> Tuple[str, int, int]:
+    """Parse a shard address given as `"host:port"`, `"host:port/db"` or a `(host, port)` tuple."""
+    if not isinstance(node, str):
+        return node[0], int(node[1]), db
+    address, _, node_db = node.partition("/")
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port or 6379), int(node_db or db)
+
+class ShardedRedisController:
+    """Scatter-gather controller over several Redis nodes.
+
+    Documents are hash-partitioned across the nodes with rendezvous hashing, so adding or removing
+    a node only moves the keys it gains or loses. Every node holds its own FT index over its partition;
+    queries are sent to all nodes concurrently and the per-shard top-k are merged into a global top-k.
+    BM25 statistics are per shard, so text scores are divided by the best score of their shard before merging (see `_merge_text`).
+    `close` stops the scatter threads and the shard connections.
+    Arguments:
+        nodes: Shard addresses, e.g. `["localhost:6379", "localhost:6380"]`
+        db: Default Redis database for nodes that do not specify one
+        max_workers: Number of threads used to scatter queries, defaults to one per shard
+    """
+    def __init__(self, nodes: List[Union[str, Tuple[str, int]]], db: int = 0, max_workers: Optional[int] = None):
+        if not nodes:
+            raise ValueError("At least one shard node is required")
+        self.nodes = [parse_node(node, db) for node in nodes]
+        self.shards = [RedisController(host=host, port=port, db=node_db) for host, port, node_db in self.nodes]
+        self._node_ids = [f"{host}:{port}/{node_db}".encode() for host, port, node_db in self.nodes]
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or len(self.shards))
+
+    def close(self):
+        """Stop the scatter threads and close the connections of the shards"""
+        self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.redis_client.close()
+
+    def shard_index(self, key: str) -> int:
+        """Index of the shard owning `key` (highest random weight)."""
+        encoded = key.encode()
+        weights = [
+            hashlib.blake2b(node_id + b"|" + encoded, digest_size=8).digest()
+            for node_id in self._node_ids
+        ]
+        return max(range(len(weights)), key=weights.__getitem__)
+
+    def shard_for(self, key: str) -> RedisController:
+        return self.shards[self.shard_index(key)]
+
+    def set(self, key, value, *kwargs):
+        self.shard_for(key).set(key, value, *kwargs)
+
+    def get(self, key):
+        return self.shard_for(key).get(key)
+
+    def delete(self, key):
+        self.shard_for(key).delete(key)
+
+    def exists(self, key):
+        return self.shard_for(key).exists(key)
+
+    def add_document(self, key: str, mapping: dict[str, str]):
+        self.shard_for(key).add_document(key, mapping)
+
+    def add_documents(self, items: list[tuple[str, dict[str, str]]]):
+        # One pipelined write per shard, all shards in parallel
+        partitions = [[] for _ in self.shards]
+        for key, mapping in items:
+            partitions[self.shard_index(key)].append((key, mapping))
+        futures = [
+            self._executor.submit(shard.add_documents, partition)
+            for shard, partition in zip(self.shards, partitions) if partition
+        ]
+        for future in futures:
+            future.result()
+
+    def get_field(self, keys: list[str], field: str) -> list:
+        # One pipelined read per shard, values are returned in the order of `keys`
+        partitions = [[] for _ in self.shards]
+        for position, key in enumerate(keys):
+            partitions[self.shard_index(key)].append(position)
+        futures = [
+            (positions, self._executor.submit(shard.get_field, [keys[position] for position in positions], field))
+            for shard, positions in zip(self.shards, partitions) if positions
+        ]
+        values = [None] * len(keys)
+        for positions, future in futures:
+            for position, value in zip(positions, future.result()):
+                values[position] = value
+        return values
+
+    def search_vector(self, index_name: str, query_vector: list[float], top_k=10, vector_field: str = "embedding"):
+        # KNN scores are distances, the smallest ones are the best matches
+        results = self._scatter("search_vector", index_name, query_vector, top_k, vector_field=vector_field)
+        return heapq.nsmallest(top_k, results, key=lambda res: float(res[1]))
+
+    def search_text(self, index_name: str, query_text: str, top_k: int = 10, **kwargs):
+        futures = [self._executor.submit(shard.search_text, index_name, query_text, top_k, **kwargs) for shard in self.shards]
+        return self._merge_text([future.result() for future in futures], top_k)
+
+    @staticmethod
+    def _merge_text(shard_results: List[list], top_k: int) -> list:
+        # Each shard computes idf and average length on its own partition, so raw scores of different shards are not comparable:
+        # they are divided by the best score of their shard, and the merged scores range from 0 to 1
+        normalized = []
+        for results in shard_results:
+            scores = [float(score) for _, score in results if score is not None]
+            best = max(scores, default=0.0) or 1.0
+            normalized += [(key, float(score) / best if score is not None else 0.0) for key, score in results]
+        return heapq.nlargest(top_k, normalized, key=lambda res: res[1])
+
+    def search_hybrid(self, index_name: str, query_texts: list[str], query_vectors: list[list[float]], top_k: int = 10, text_top_k: int = None, **kwargs):
+        # One pipelined round trip per shard, the per-shard lists of every query are merged like `search_vector` / `search_text`
+        text_top_k = top_k if text_top_k is None else text_top_k
+        futures = [
+            self._executor.submit(shard.search_hybrid, index_name, query_texts, query_vectors, top_k, text_top_k, **kwargs)
+            for shard in self.shards
+        ]
+        shard_results = [future.result() for future in futures]
+        vector_results = [
+            heapq.nsmallest(top_k, [res for vectors, _ in shard_results for res in vectors[position]], key=lambda res: float(res[1]))
+            for position in range(len(query_vectors))
+        ]
+        text_results = [
+            self._merge_text([texts[position] for _, texts in shard_results], text_top_k)
+            for position in range(len(query_texts))
+        ]
+        return vector_results, text_results
+
+    def index_info(self, index_name: str) -> dict[str, float]:
+        # Sizes and counts add up over the shards, averages are recomputed from the totals
+        figures = {}
+        for shard_figures in self._executor.map(lambda shard: shard.index_info(index_name), self.shards):
+            for field, value in shard_figures.items():
+                figures[field] = figures.get(field, 0.0) + value
+        if figures.get("num_docs"):
+            figures["records_per_doc_avg"] = figures.get("num_records", 0.0) / figures["num_docs"]
+        if figures.get("num_records"):
+            figures["bytes_per_record_avg"] = figures.get("inverted_sz_mb", 0.0) * 2 ** 20 / figures["num_records"]
+        return {field: figures[field] for field in INDEX_INFO_FIELDS if field in figures}
+
+    def create_vector_index(self, index_name: str, index_prefix: str, vector_dim: int, distance_metric="COSINE", vector_field: str = "embedding"):
+        self._scatter("create_vector_index", index_name, index_prefix, vector_dim, distance_metric, vector_field=vector_field)
+
+    def create_text_index(self, index_name: str, index_prefix: str):
+        self._scatter("create_text_index", index_name, index_prefix)
+
+    def rebalance(self, index_prefix: str, batch_size: int = 500) -> int:
+        """Move every hash under `index_prefix` to the shard that owns it, e.g. after the node list changed.
+        Stray copies whose owner already holds the key (because it was just re-indexed) are simply dropped.
+        Returns the number of keys that were moved or dropped."""
+        moved = 0
+        for source_idx, source in enumerate(self.shards):
+            stray = [
+                key for key in source.redis_client.scan_iter(match=f"{index_prefix}*", count=batch_size)
+                if self.shard_index(key.decode()) != source_idx
+            ]
+            for start in range(0, len(stray), batch_size):
+                moved += self._move_keys(source, stray[start:start + batch_size])
+        return moved
+
+    def _move_keys(self, source: RedisController, keys: list[bytes]) -> int:
+        reads = source.redis_client.pipeline(transaction=False)
+        for key in keys:
+            reads.hgetall(key)
+        mappings = reads.execute()
+
+        to_copy = []
+        for key, mapping in zip(keys, mappings):
+            key = key.decode()
+            if mapping and not self.shard_for(key).exists(key):
+                to_copy.append((key, mapping))
+        self.add_documents(to_copy)
+
+        deletes = source.redis_client.pipeline(transaction=False)
+        for key in keys:
+            deletes.delete(key)
+        deletes.execute()
+        return len(keys)
+
+    def _scatter(self, method: str, *args, **kwargs) -> list:
+        futures = [self._executor.submit(getattr(shard, method), *args, **kwargs) for shard in self.shards]
+        results = []
+        for future in futures:
+            results.extend(future.result() or [])
+        return results
+
+def create_controller(
+    host: str = "localhost",
+    port: int = 6379,
+    db: int = 0,
+    shards: Optional[List[Union[str, Tuple[str, int]]]] = None,
+) -> Union[RedisController, ShardedRedisController]:
+    """Build a single-node controller, or a sharded one when a list of shard nodes is given.
+    The 'memory' host gives an in-process `FakeRedisController` over a store shared per database, for hermetic tests and benchmarks."""
+    if host == "memory":
+        from .fake import FakeRedisController, get_memory_client
+        return FakeRedisController(get_memory_client(db))
+    if shards:
+        return ShardedRedisController(shards, db=db)
+    return RedisController(host=host, port=port, db=db)